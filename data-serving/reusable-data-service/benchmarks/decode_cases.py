@@ -0,0 +1,85 @@
+"""Compare the rate at which mongo documents can be decoded into Case objects.
+
+The legacy path serialised each pymongo document to extended JSON and parsed
+it back before building a Case; the store now decodes the pymongo document
+directly. Run from the reusable-data-service directory:
+
+    poetry run python -m benchmarks.decode_cases [number_of_documents]
+"""
+
+import datetime
+import sys
+import time
+
+from bson import ObjectId
+from bson.json_util import dumps
+from json import loads
+
+from data_service.model.case import observe_case_class
+from data_service.stores import mongo_store
+from data_service.stores.mongo_store import MongoStore
+
+Case = None
+
+
+def case_observer(cls):
+    global Case
+    Case = cls
+
+
+def legacy_document_to_case(doc):
+    """The extended-JSON round trip that the store used to make for every document."""
+    dictionary = loads(dumps(doc))
+    the_id = dictionary["_id"]
+    if isinstance(the_id, dict):
+        dictionary["_id"] = the_id["$oid"]
+    return Case.from_dict(dictionary)
+
+
+def sample_documents(count: int):
+    """Documents shaped the way pymongo hands them back from the cases collection."""
+    start = datetime.datetime(2022, 5, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "confirmationDate": start + datetime.timedelta(days=i % 90),
+            "caseReference": {"sourceId": ObjectId("fedc09876543210987654321")},
+            "location": {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [12.345, 67.89]},
+                "properties": {"country": "IND", "admin1": "Kerala"},
+            },
+            "age": {"lower": 21, "upper": 25},
+            "caseStatus": "probable",
+            "pathogenStatus": "unknown",
+            "sexAtBirth": "female",
+            "gender": ["non-binary", "other"],
+            "gender_other": "womxn",
+            "race": ["Asian"],
+        }
+        for i in range(count)
+    ]
+
+
+def rows_per_second(decoder, documents) -> float:
+    start = time.perf_counter()
+    for doc in documents:
+        decoder(doc)
+    return len(documents) / (time.perf_counter() - start)
+
+
+def main():
+    observe_case_class(case_observer)
+    # the store normally starts observing the Case class when it is constructed
+    observe_case_class(mongo_store.case_observer)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    documents = sample_documents(count)
+    legacy = rows_per_second(legacy_document_to_case, documents)
+    direct = rows_per_second(MongoStore.mongo_document_to_case, documents)
+    print(f"decoded {count} documents")
+    print(f"extended JSON round trip: {legacy:10.0f} rows/s")
+    print(f"direct decoding:          {direct:10.0f} rows/s ({direct / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
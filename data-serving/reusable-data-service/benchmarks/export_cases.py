@@ -0,0 +1,88 @@
+"""Compare the rate at which cases can be written out as CSV for a download.
+
+The legacy path built a new csv writer for every row and worked out which
+fields to write by walking the dataclass fields of every case; downloads now
+write batches of rows through one writer using a column plan made once per
+Case class, yielding large chunks. Run from the reusable-data-service directory:
+
+    poetry run python -m benchmarks.export_cases [number_of_cases]
+"""
+
+import csv
+import dataclasses
+import io
+import sys
+import time
+
+from benchmarks.decode_cases import sample_documents
+from data_service.model.case import observe_case_class
+from data_service.model.document import Document
+from data_service.stores import mongo_store
+from data_service.stores.mongo_store import MongoStore
+
+Case = None
+
+
+def case_observer(cls):
+    global Case
+    Case = cls
+
+
+def legacy_field_values(document) -> list[str]:
+    """How field values were found for each row before the column plan existed."""
+    fields = []
+    for f in dataclasses.fields(document):
+        value = getattr(document, f.name)
+        if issubclass(f.type, Document):
+            if document.include_dataclass_fields(f.type):
+                if value is not None:
+                    fields += legacy_field_values(value)
+                else:
+                    fields += f.type.none_field_values()
+        elif hasattr(f.type, "custom_field_names"):
+            if value is not None:
+                fields += value.custom_field_values()
+            else:
+                fields += f.type.custom_none_field_values()
+        elif isinstance(value, list):
+            fields.append(",".join(value))
+        else:
+            fields.append(str(value) if value is not None else "")
+    return fields
+
+
+def legacy_csv_output(cases):
+    yield Case.csv_header()
+    for case in cases:
+        f = io.StringIO()
+        csv.writer(f, delimiter=",").writerow(legacy_field_values(case))
+        yield f.getvalue()
+
+
+def chunked_csv_output(cases):
+    yield Case.csv_header()
+    yield from Case.csv_chunks(cases)
+
+
+def rows_per_second(generator, cases) -> tuple[float, int]:
+    start = time.perf_counter()
+    pieces = sum(1 for _ in generator(cases))
+    return len(cases) / (time.perf_counter() - start), pieces
+
+
+def main():
+    observe_case_class(case_observer)
+    observe_case_class(mongo_store.case_observer)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    cases = [MongoStore.mongo_document_to_case(d) for d in sample_documents(count)]
+    legacy, legacy_pieces = rows_per_second(legacy_csv_output, cases)
+    chunked, chunked_pieces = rows_per_second(chunked_csv_output, cases)
+    print(f"exported {count} cases as CSV")
+    print(f"row at a time: {legacy:10.0f} rows/s in {legacy_pieces} pieces")
+    print(
+        f"chunked:       {chunked:10.0f} rows/s in {chunked_pieces} pieces ({chunked / legacy:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
-import sys
+import base64
+import json
 
 from flask import jsonify
 from datetime import date
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Union
 
 from data_service.controller.geocode_controller import Geocoder
 
@@ -21,11 +23,15 @@ from data_service.model.filter import (
 )
 from data_service.model.geojson import Feature
 from data_service.util.errors import (
+    DependencyFailedError,
     NotFoundError,
     PreconditionUnsatisfiedError,
     UnsupportedTypeError,
     ValidationError,
 )
+from data_service.util.columnar_export import columnar_formats
+from data_service.util.compression import compress_stream, supported_encodings
+from data_service.util.ttl_cache import TTLCache
 
 Case = None
 
@@ -41,12 +47,32 @@ class CaseController:
     storage technology can be chosen.
     All methods return a tuple of (response, HTTP status code)"""
 
-    def __init__(self, store, outbreak_date: date, geocoder: Geocoder):
+    permitted_count_modes = ["exact", "estimate", "none"]
+    # an estimated count stops counting matching cases when it gets to this many
+    estimate_count_limit = 10000
+
+    def __init__(
+        self,
+        store,
+        outbreak_date: date,
+        geocoder: Geocoder,
+        count_cache_ttl: float = 30,
+        count_workers: int = 4,
+    ):
         """store is an adapter to the external storage technology.
-        outbreak_date is the earliest date on which this instance should accept cases."""
+        outbreak_date is the earliest date on which this instance should accept cases.
+        count_cache_ttl is how many seconds a count of cases matching a filter is reused for.
+        Counts are cached by the text of their filter, and are only forgotten early when
+        this controller changes the cases: changes made by other processes or replicas
+        aren't reflected in the count for a filter until its cached count expires.
+        count_workers is how many counts can run in the background at once."""
         self.store = store
         self.outbreak_date = outbreak_date
         self.geocoder = geocoder
+        self.count_cache = TTLCache(ttl=count_cache_ttl)
+        self.count_executor = ThreadPoolExecutor(
+            max_workers=count_workers, thread_name_prefix="case-count"
+        )
         observe_case_class(case_observer)
 
     def get_case(self, id: str):
@@ -58,21 +84,99 @@ class CaseController:
             raise NotFoundError(f"No case with ID {id}")
         return case
 
-    def list_cases(self, page: int = None, limit: int = None, filter: str = None):
-        """Implements get /cases."""
+    def list_cases(
+        self,
+        page: int = None,
+        limit: int = None,
+        filter: str = None,
+        after: str = None,
+        count: str = None,
+    ):
+        """Implements get /cases. Clients can ask for a page by number, or pass
+        the nextCursor from the page they already have as after: fetching a page by
+        cursor costs the same however deep into the collection it is.
+        count says how the total is reported: exact (the default) counts matching cases,
+        reusing a recent count if this controller hasn't changed any cases since; estimate
+        accepts a previous exact count however old it is, and otherwise counts at most
+        estimate_count_limit matching cases, so total is a lower bound when it reaches
+        that; none skips counting, so total is None and nextPage is offered whenever
+        this page is full."""
+        if page is not None and after is not None:
+            raise PreconditionUnsatisfiedError("Do not supply both a page and a cursor")
         page = 1 if page is None else page
         limit = 10 if limit is None else limit
+        count = "exact" if count is None else count
         if page <= 0:
             raise PreconditionUnsatisfiedError("page must be >0")
         if limit <= 0:
             raise PreconditionUnsatisfiedError("limit must be >0")
+        if count not in self.permitted_count_modes:
+            raise PreconditionUnsatisfiedError(
+                f"count must be one of {self.permitted_count_modes}"
+            )
         predicate = CaseController.parse_filter(filter)
         if predicate is None:
             raise ValidationError("cannot understand query")
-        cases = self.store.fetch_cases(page, limit, predicate)
-        count = self.store.count_cases(predicate)
-        nextPage = page + 1 if count > page * limit else None
-        return CasePage(cases, count, nextPage)
+        # the count doesn't depend on the page, so get it going while the page is fetched
+        counted = self.start_counting(predicate, count)
+        if after is not None:
+            last_id = CaseController.decode_cursor(after)
+            try:
+                # ask for one more case than we need to find out whether there's another page
+                cases = self.store.fetch_cases_after(last_id, limit + 1, predicate)
+            except ValueError:
+                raise PreconditionUnsatisfiedError(f"Malformed cursor {after}")
+            has_more = len(cases) > limit
+            cases = cases[:limit]
+            total = counted()
+            nextPage = None
+        else:
+            cases = self.store.fetch_cases(page, limit, predicate)
+            total = counted()
+            if total is None or (
+                count == "estimate" and total == self.estimate_count_limit
+            ):
+                has_more = len(cases) == limit
+            else:
+                has_more = total > page * limit
+            nextPage = page + 1 if has_more else None
+        nextCursor = (
+            CaseController.encode_cursor(cases[-1]) if has_more and cases else None
+        )
+        return CasePage(cases, total, nextPage, nextCursor)
+
+    def start_counting(
+        self, predicate: Filter, mode: str
+    ) -> Callable[[], Optional[int]]:
+        """Find the number of cases matching the predicate, counting them in the
+        background if a usable count isn't cached. Returns a function that waits for
+        and returns the count (None if the mode is none)."""
+        if mode == "none":
+            return lambda: None
+        key = str(predicate)
+        max_age = float("inf") if mode == "estimate" else None
+        if (cached := self.count_cache.get(key, max_age=max_age)) is not None:
+            return lambda: cached
+        limit = None
+        if mode == "estimate":
+            # bounded counts are cached apart, so they aren't taken for exact ones
+            key = f"at most {self.estimate_count_limit}: {key}"
+            limit = self.estimate_count_limit
+            if (cached := self.count_cache.get(key)) is not None:
+                return lambda: cached
+        generation = self.count_cache.generation
+        future = self.count_executor.submit(self.store.count_cases, predicate, limit)
+
+        def result():
+            count = future.result()
+            self.count_cache.put(key, count, generation)
+            return count
+
+        return result
+
+    def close(self):
+        """Stop the background counting threads, once any counts under way have finished."""
+        self.count_executor.shutdown()
 
     def create_case(self, maybe_case: dict, num_cases: int = 1):
         """Implements post /cases."""
@@ -82,6 +186,7 @@ class CaseController:
             case = self.create_case_if_valid(maybe_case)
             for i in range(num_cases):
                 self.store.insert_case(case)
+            self.count_cache.clear()
             return
         except:
             # pass this upstream for the app to handle
@@ -105,62 +210,82 @@ class CaseController:
         cases = body.get("cases")
         if cases is None or len(cases) == 0:
             raise PreconditionUnsatisfiedError("No cases to upsert!")
+        # ingestion batches repeat the same places a lot, so look each one up once
+        queries = [q for c in cases if (q := self.location_query(c)) is not None]
+        located = self.geocoder.locate_features(queries) if len(queries) > 0 else {}
         errors = {}
         usable_cases = []
         for i, maybe_case in enumerate(cases):
             try:
-                case = self.create_case_if_valid(maybe_case)
+                case = self.create_case_if_valid(maybe_case, located)
                 usable_cases.append(case)
             except Exception as e:
                 errors[str(i)] = e.args[0]
         (created, updated) = (
             self.store.batch_upsert(usable_cases) if len(usable_cases) > 0 else (0, 0)
         )
+        self.count_cache.clear()
         return CaseUpsertOutcome(created, updated, errors)
 
     def download(
-        self, format: str = "csv", filter: str = None, case_ids: List[str] = None
+        self,
+        format: str = "csv",
+        filter: str = None,
+        case_ids: List[str] = None,
+        compression: str = None,
     ):
-        """Download all cases matching the requested query, in the given format."""
+        """Download all cases matching the requested query, in the given format.
+        If compression names one of the supported encodings, the output is compressed
+        as it is generated."""
 
         if filter is not None and case_ids is not None:
             raise PreconditionUnsatisfiedError(
                 "Do not supply both a filter and a list of IDs"
             )
 
-        permitted_formats = ["csv", "tsv", "json"]
+        permitted_formats = ["csv", "tsv", "json"] + columnar_formats()
         if format not in permitted_formats:
             raise UnsupportedTypeError(f"Format must be one of {permitted_formats}")
+        if compression is not None and compression not in supported_encodings():
+            raise UnsupportedTypeError(
+                f"Compression must be one of {supported_encodings()}"
+            )
         # now we know the format is good, we can build method names using it
         converter_method = f"to_{format}"
+        chunks_method = f"{format}_chunks"
         header_method = f"{format}_header"
         separator_method = f"{format}_separator"
         footer_method = f"{format}_footer"
+        # formats written in bulk only need the fields that appear in the output
+        fields = Case.exported_fields() if hasattr(Case, chunks_method) else None
 
         if case_ids is not None:
-            case_iterator = self.store.identified_case_iterator(case_ids)
-            count = len(case_ids)
+            case_iterator = self.store.identified_case_iterator(case_ids, fields)
         else:
             predicate = CaseController.parse_filter(filter)
             if predicate is None:
                 raise ValidationError(f"cannot understand query {filter}")
-            case_iterator = self.store.matching_case_iterator(predicate)
-            count = self.store.count_cases(predicate)
+            case_iterator = self.store.matching_case_iterator(predicate, fields)
 
-        def generate_output():
+        def generate_uncompressed():
             if hasattr(Case, header_method):
                 yield getattr(Case, header_method)()
-            i = 0
-            has_separator = hasattr(Case, separator_method)
-            for case in case_iterator:
-                yield getattr(case, converter_method)()
-                if i < count - 1:
-                    if has_separator:
+            if hasattr(Case, chunks_method):
+                yield from getattr(Case, chunks_method)(case_iterator)
+            else:
+                has_separator = hasattr(Case, separator_method)
+                for i, case in enumerate(case_iterator):
+                    if i > 0 and has_separator:
                         yield getattr(Case, separator_method)()
-                    i += 1
+                    yield getattr(case, converter_method)()
             if hasattr(Case, footer_method):
                 yield getattr(Case, footer_method)()
 
+        def generate_output():
+            if compression is None:
+                return generate_uncompressed()
+            return compress_stream(generate_uncompressed(), compression)
+
         return generate_output
 
     def valid_statuses(self):
@@ -185,24 +310,20 @@ class CaseController:
         if status == "omit_error" and note is None:
             raise ValidationError(f"Excluding cases must be documented in a note")
 
-        def update_status(id: str, status: str, note: str):
-            if status == "omit_error":
-                caseExclusion = CaseExclusionMetadata()
-                caseExclusion.note = note
-            else:
-                caseExclusion = None
-            self.store.update_case_status(id, status, caseExclusion)
+        if status == "omit_error":
+            caseExclusion = CaseExclusionMetadata()
+            caseExclusion.note = note
+        else:
+            caseExclusion = None
 
         if case_ids is not None:
-            for anId in case_ids:
-                update_status(anId, status, note)
+            self.store.batch_update_case_status(case_ids, status, caseExclusion)
         else:
             predicate = CaseController.parse_filter(filter)
             if predicate is None:
                 raise ValidationError(f"cannot understand query {filter}")
-            case_iterator = self.store.matching_case_iterator(predicate)
-            for case in case_iterator:
-                update_status(case._id, status, note)
+            self.store.update_cases_status(predicate, status, caseExclusion)
+        self.count_cache.clear()
 
     def excluded_case_ids(
         self, source_id: str, query: Optional[str] = None
@@ -225,6 +346,7 @@ class CaseController:
         # tell the store to apply the update rather than replacing the whole document:
         # should be more efficient given a competent DB
         self.store.update_case(case_id, diff)
+        self.count_cache.clear()
         return updated_case
 
     def batch_update(self, updates: List[dict]) -> int:
@@ -241,13 +363,24 @@ class CaseController:
 
         try:
             update_map = {
-                u["_id"]: DocumentUpdate.from_dict(remove_id(u)) for u in updates
+                u["_id"]: Case.typed_update(DocumentUpdate.from_dict(remove_id(u)))
+                for u in updates
             }
         except KeyError:
             raise PreconditionUnsatisfiedError("not every update includes an _id")
+        # fetch all of the cases up front, rather than one query per update
+        cases = self.store.cases_by_ids(list(update_map.keys()))
         for id, update in iter(update_map.items()):
-            self.validate_updated_case(id, update)
-        return self.store.batch_update(update_map)
+            case = cases.get(id)
+            if case is None:
+                raise NotFoundError(f"No case with ID {id}")
+            # these are freshly-decoded copies, so apply the update without copying
+            case.apply_update(update)
+            case.validate()
+            self.check_case_preconditions(case)
+        modified = self.store.batch_update(update_map)
+        self.count_cache.clear()
+        return modified
 
     def batch_update_query(self, query: str, update: dict) -> int:
         """Update a collection of documents. Update is a description
@@ -256,19 +389,50 @@ class CaseController:
         in an inconsistent state."""
         if update is None:
             raise PreconditionUnsatisfiedError("No update supplied")
-        cases = self.list_cases(limit=sys.maxsize, filter=query)
-        updates = []
-        for case in cases.cases:
-            an_update = dict(update)
-            an_update["_id"] = case._id
-            updates.append(an_update)
-        return self.batch_update(updates)
+        predicate = CaseController.parse_filter(query)
+        if predicate is None:
+            raise ValidationError("cannot understand query")
+        diff = Case.typed_update(DocumentUpdate.from_dict(update))
+        if self.update_can_be_validated_alone(diff):
+            self.validate_update(diff)
+        else:
+            # stream the cases rather than holding them all, and as each decoded case
+            # is thrown away after it's checked there's no need to copy it.
+            for case in self.store.matching_case_iterator(predicate):
+                case.apply_update(diff)
+                case.validate()
+                self.check_case_preconditions(case)
+        modified = self.store.update_cases(predicate, diff)
+        self.count_cache.clear()
+        return modified
+
+    def update_can_be_validated_alone(self, update: DocumentUpdate) -> bool:
+        """Whether an update's validity doesn't depend on the cases it's applied to.
+        That's true when it only sets top-level fields with simple types, because each
+        value can be checked against its field model alone."""
+        field_models = {f.key: f for f in Case.custom_fields}
+        if len(update.unsets) > 0:
+            return False
+        for key, value in update.updates_iter():
+            model = field_models.get(key)
+            if model is None or model.element_type() not in [str, int, date]:
+                return False
+        return True
+
+    def validate_update(self, update: DocumentUpdate):
+        """Check an update that update_can_be_validated_alone approves of against
+        the case schema. Raises ValidationError if it's invalid."""
+        field_models = {f.key: f for f in Case.custom_fields}
+        for key, value in update.updates_iter():
+            Case.validate_field_value(field_models[key], value)
+        self.check_update_preconditions(update)
 
     def delete_case(self, case_id: str):
         """Remove a case. Raises NotFoundError if no case with the given id exists."""
         if self.store.case_by_id(case_id) is None:
             raise NotFoundError(f"No case with ID {case_id}")
         self.store.delete_case(case_id)
+        self.count_cache.clear()
 
     def batch_delete(
         self,
@@ -281,8 +445,17 @@ class CaseController:
                 "Must specify exactly one of query or case ID list"
             )
         if case_ids is not None:
-            for case_id in case_ids:
-                self.delete_case(case_id)
+            # check everything is there first, so that nothing is deleted if any are missing
+            missing_ids = self.store.missing_case_ids(case_ids)
+            if len(missing_ids) > 0:
+                raise NotFoundError(f"No cases with IDs {missing_ids}")
+            target_case_count = len(set(case_ids))
+            if threshold and target_case_count > threshold:
+                raise ValidationError(
+                    f"Command would delete {target_case_count} cases, above threshold of {threshold}"
+                )
+            self.store.delete_cases_by_ids(case_ids)
+            self.count_cache.clear()
         else:  # query is not None
             filter = self.parse_filter(query)
             if filter is None or filter.matches_everything():
@@ -295,6 +468,7 @@ class CaseController:
                     f"Command would delete {target_case_count} cases, above threshold of {threshold}"
                 )
             self.store.delete_cases(filter)
+            self.count_cache.clear()
 
     def validate_updated_case(self, id: str, update: DocumentUpdate):
         """Find out whether updating a case would result in it being invalid.
@@ -310,14 +484,26 @@ class CaseController:
         self.check_case_preconditions(updated_case)
         return updated_case
 
-    def create_case_if_valid(self, maybe_case: dict):
+    def create_case_if_valid(
+        self,
+        maybe_case: dict,
+        located: Optional[
+            Dict[str, Union[List[Feature], DependencyFailedError]]
+        ] = None,
+    ):
         """Attempts to create a case from an input dictionary and validate it against
         the application rules. Raises ValidationError or PreconditionUnsatisfiedError on invalid input.
-        Raises DependencyFailedError if it has to geocode a case and the location service fails."""
+        Raises DependencyFailedError if it has to geocode a case and the location service fails.
+        located holds the outcomes of any location queries that have already been made,
+        as returned by Geocoder.locate_features."""
         if "location" in maybe_case:
             loc = maybe_case["location"]
             if "query" in loc:
-                features = self.geocoder.locate_feature(loc["query"])
+                features = located.get(loc["query"]) if located is not None else None
+                if features is None:
+                    features = self.geocoder.locate_feature(loc["query"])
+                elif isinstance(features, DependencyFailedError):
+                    raise features
                 feature = features[0]
             else:
                 # if you aren't asking for a query, you must be telling me what it is
@@ -329,10 +515,42 @@ class CaseController:
         self.check_case_preconditions(case)
         return case
 
+    @staticmethod
+    def location_query(maybe_case: Any) -> Optional[str]:
+        """The query that would be used to geocode this case, if it has one."""
+        try:
+            query = maybe_case["location"]["query"]
+        except (KeyError, TypeError):
+            return None
+        # an unusable query is reported when the case is checked
+        return query if isinstance(query, str) else None
+
     def check_case_preconditions(self, case: Case):
         if case.confirmationDate < self.outbreak_date:
             raise ValidationError("Confirmation date is before outbreak began")
 
+    def check_update_preconditions(self, update: DocumentUpdate):
+        """The counterpart of check_case_preconditions for an update on its own."""
+        confirmation_date = update.updates.get("confirmationDate")
+        if confirmation_date is not None and confirmation_date < self.outbreak_date:
+            raise ValidationError("Confirmation date is before outbreak began")
+
+    @staticmethod
+    def encode_cursor(case: Case) -> str:
+        """Create an opaque token identifying the position just after the supplied case."""
+        position = json.dumps({"_id": str(case._id)})
+        return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> str:
+        """Find the ID of the case a cursor token points after.
+        Raises PreconditionUnsatisfiedError if the token is not one I made."""
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return position["_id"]
+        except (ValueError, TypeError, KeyError):
+            raise PreconditionUnsatisfiedError(f"Malformed cursor {cursor}")
+
     @staticmethod
     def parse_filter(filter: str) -> Filter:
         """Interpret the filter query in the incoming request."""
@@ -1,17 +1,57 @@
 import iso3166
 import requests
 
-from typing import Any, Dict, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, Iterable, List, Union
 
 from data_service.model.geojson import Feature, Point
 from data_service.util.errors import DependencyFailedError
+from data_service.util.ttl_cache import TTLCache
+
+# Locating a query can take a geocoding and a tilequery call to Mapbox, each of which
+# the location-service rate limits.
+MAPBOX_CALLS_PER_QUERY = 2
 
 
 class Geocoder:
-    """Call the location-service to identify locations."""
+    """Call the location-service to identify locations.
+    Responses are cached, so that the same query made again within cache_ttl
+    seconds doesn't go back to the location-service. Batches of queries are
+    sent to the location-service batch_size at a time, at most batch_concurrency
+    batches at once, over a pool of max_concurrency connections that is shared
+    by all requests.
+    The location-service makes up to rate_limit_per_min calls to Mapbox a minute,
+    so a batch is given as long as its queries could take at that rate, when as
+    many batches as can be in flight are sharing it, on top of timeout.
+    A location-service that can't geocode batches is asked about each query in
+    turn instead."""
 
-    def __init__(self, location_service: str):
+    def __init__(
+        self,
+        location_service: str,
+        max_concurrency: int = 8,
+        timeout: float = 10,
+        cache_size: int = 10000,
+        cache_ttl: float = 3600,
+        batch_size: int = 20,
+        batch_concurrency: int = 4,
+        rate_limit_per_min: float = 600,
+    ):
         self.location_endpoint = f"{location_service}/geocode"
+        self.batch_endpoint = f"{location_service}/geocode/batch"
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.batch_concurrency = batch_concurrency
+        self.rate_limit_per_min = rate_limit_per_min
+        self.batches_supported = True
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=batch_concurrency)
+        self.query_executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.cache = TTLCache(max_size=cache_size, ttl=cache_ttl)
 
     def locate_feature(self, query: str) -> List[Feature]:
         """Make a query to the location-service and turn its response
@@ -21,18 +61,145 @@ class Geocoder:
         or responds with any status code other than 200, or if it returns
         an empty list of locations, or a location that cannot be turned
         into a feature."""
-        response = requests.get(self.location_endpoint, {"q": query})
+        locations = self.cache.get(query)
+        if locations is not None:
+            return self.features_from_locations(locations, query)
+        locations = self.fetch_locations(query)
+        features = self.features_from_locations(locations, query)
+        self.cache.put(query, locations)
+        return features
+
+    def locate_features(
+        self, queries: Iterable[str]
+    ) -> Dict[str, Union[List[Feature], DependencyFailedError]]:
+        """Locate each distinct query, asking the location-service about the ones that
+        aren't cached in batches. Returns a dictionary mapping each query onto either its
+        features or the DependencyFailedError that locate_feature would have raised for it,
+        so that one query failing doesn't stop the others from being located."""
+        distinct = list(dict.fromkeys(queries))
+        found = {q: self.cache.get(q) for q in distinct}
+        unknown = [q for q in distinct if found[q] is None]
+        fetched = set(unknown)
+        batches = [
+            unknown[i : i + self.batch_size]
+            for i in range(0, len(unknown), self.batch_size)
+        ]
+        for batch, outcomes in zip(
+            batches, self.executor.map(self.fetch_batch_locations, batches)
+        ):
+            found.update(zip(batch, outcomes))
+
+        def features_or_error(
+            query: str,
+        ) -> Union[List[Feature], DependencyFailedError]:
+            if isinstance(found[query], DependencyFailedError):
+                return found[query]
+            try:
+                features = self.features_from_locations(found[query], query)
+            except DependencyFailedError as e:
+                return e
+            # only remember fresh locations, so that cached ones still expire
+            if query in fetched:
+                self.cache.put(query, found[query])
+            return features
+
+        return {q: features_or_error(q) for q in distinct}
+
+    def features_from_locations(
+        self, locations: List[Dict[str, Any]], query: str
+    ) -> List[Feature]:
+        """Turn the locations found for a query into features."""
+        if len(locations) == 0:
+            raise DependencyFailedError(
+                f"Geocoding service returned no locations for query {query}"
+            )
+        # build new features each time, because cases can change their locations
+        return [self.create_feature(l, query) for l in locations]
+
+    def fetch_locations(self, query: str) -> List[Dict[str, Any]]:
+        """Ask the location-service about a query, and return the locations it finds."""
+        try:
+            response = self.session.get(
+                self.location_endpoint, params={"q": query}, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise DependencyFailedError(
+                f"Geocoding service could not be reached for query {query}: {e}"
+            )
         if response.status_code != 200:
             raise DependencyFailedError(
                 f"Geocoding service responded with status {response.status_code} for query {query}"
             )
-        locations = response.json()
-        if len(locations) == 0:
-            raise DependencyFailedError(
-                f"Geocoding service returned no locations for query {query}"
+        return response.json()
+
+    def fetch_batch_locations(
+        self, queries: List[str]
+    ) -> List[Union[List[Dict[str, Any]], DependencyFailedError]]:
+        """Ask the location-service about a batch of queries in one request. Returns the
+        locations found for each query in order, or for every query the error that
+        stopped the batch from being located, including a response that doesn't have
+        a list of locations for each query."""
+        if not self.batches_supported:
+            return self.fetch_each_location(queries)
+        body = {"queries": [{"q": q} for q in queries]}
+        try:
+            response = self.session.post(
+                self.batch_endpoint, json=body, timeout=self.batch_timeout(len(queries))
             )
-        features = [self.create_feature(l, query) for l in locations]
-        return features
+        except requests.RequestException as e:
+            return [
+                DependencyFailedError(
+                    f"Geocoding service could not be reached for query {q}: {e}"
+                )
+                for q in queries
+            ]
+        if response.status_code == 404:
+            # an older location-service, without the batch endpoint
+            self.batches_supported = False
+            return self.fetch_each_location(queries)
+        if response.status_code != 200:
+            return [
+                DependencyFailedError(
+                    f"Geocoding service responded with status {response.status_code} for query {q}"
+                )
+                for q in queries
+            ]
+        try:
+            found = response.json()
+        except ValueError:
+            found = None
+        if (
+            not isinstance(found, list)
+            or len(found) != len(queries)
+            or not all(isinstance(locations, list) for locations in found)
+        ):
+            return [
+                DependencyFailedError(
+                    f"Geocoding service did not respond with locations for each query in the batch with query {q}"
+                )
+                for q in queries
+            ]
+        return found
+
+    def batch_timeout(self, size: int) -> float:
+        """How long to wait for the location-service to locate a batch of size queries."""
+        calls = MAPBOX_CALLS_PER_QUERY * size * self.batch_concurrency
+        return self.timeout + calls * 60 / self.rate_limit_per_min
+
+    def fetch_each_location(
+        self, queries: List[str]
+    ) -> List[Union[List[Dict[str, Any]], DependencyFailedError]]:
+        """Ask the location-service about each query of a batch in its own request."""
+
+        def locations_or_error(
+            query: str,
+        ) -> Union[List[Dict[str, Any]], DependencyFailedError]:
+            try:
+                return self.fetch_locations(query)
+            except DependencyFailedError as e:
+                return e
+
+        return list(self.query_executor.map(locations_or_error, queries))
 
     def create_feature(self, location: Dict[str, Union[str, float]], query: str):
         """Turn a location-service response into a GeoJSON feature."""
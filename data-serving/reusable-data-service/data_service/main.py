@@ -10,8 +10,14 @@ from data_service.util.errors import (
     ValidationError,
     WebApplicationError,
 )
+from data_service.util.columnar_export import mime_types as columnar_mime_types
+from data_service.util.compression import (
+    mime_types as compression_mime_types,
+    supported_encodings,
+)
 from data_service.util.json_encoder import JSONEncoder
 
+import atexit
 import os
 import logging
 
@@ -42,10 +48,14 @@ def list_cases():
         page = request.args.get("page", type=int)
         limit = request.args.get("limit", type=int)
         filter = request.args.get("q", type=str)
+        after = request.args.get("after", type=str)
+        count = request.args.get("count", type=str)
         try:
             return (
                 jsonify(
-                    case_controller.list_cases(page=page, limit=limit, filter=filter)
+                    case_controller.list_cases(
+                        page=page, limit=limit, filter=filter, after=after, count=count
+                    )
                 ),
                 200,
             )
@@ -97,12 +107,30 @@ def download_cases():
             "csv": "text/csv",
             "tsv": "text/tab-separated-values",
             "json": "application/json",
+            **columnar_mime_types,
         }
         mime_type = content_types.get(req.get("format"), "text/plain")
+        # clients can ask for a compressed file with the compression field; otherwise
+        # the output is compressed in transit if their Accept-Encoding allows it.
+        compression = req.get("compression")
+        content_encoding = None
+        if compression is not None:
+            mime_type = compression_mime_types.get(compression, mime_type)
+        else:
+            content_encoding = request.accept_encodings.best_match(
+                supported_encodings()
+            )
         generator = case_controller.download(
-            req.get("format"), req.get("query"), req.get("caseIds")
+            req.get("format"),
+            req.get("query"),
+            req.get("caseIds"),
+            compression or content_encoding,
         )
-        return app.response_class(generator(), mimetype=mime_type)
+        response = app.response_class(generator(), mimetype=mime_type)
+        response.vary.add("Accept-Encoding")
+        if content_encoding is not None:
+            response.content_encoding = content_encoding
+        return response
     except WebApplicationError as e:
         return jsonify({"message": e.args[0]}), e.http_code
 
@@ -186,11 +214,25 @@ def set_up_controllers():
     location_service_base = os.environ.get("LOCATION_SERVICE")
     if location_service_base is None:
         raise ValueError("Define $LOCATION_SERVICE in the environment")
+    count_cache_ttl = float(os.environ.get("COUNT_CACHE_TTL_SECONDS", 30))
+    geocoder = Geocoder(
+        location_service_base,
+        max_concurrency=int(os.environ.get("GEOCODE_CONCURRENCY", 8)),
+        cache_ttl=float(os.environ.get("GEOCODE_CACHE_TTL_SECONDS", 3600)),
+        batch_size=int(os.environ.get("GEOCODE_BATCH_SIZE", 20)),
+        batch_concurrency=int(os.environ.get("GEOCODE_BATCH_CONCURRENCY", 4)),
+        rate_limit_per_min=float(
+            os.environ.get("MAPBOX_GEOCODE_RATE_LIMIT_PER_MIN", 600)
+        ),
+    )
     case_controller = CaseController(
         store,
         date.fromisoformat(outbreak_date),
-        geocoder=Geocoder(location_service_base),
+        geocoder=geocoder,
+        count_cache_ttl=count_cache_ttl,
+        count_workers=int(os.environ.get("COUNT_WORKERS", 4)),
     )
+    atexit.register(case_controller.close)
     schema_controller = SchemaController(store)
 
 
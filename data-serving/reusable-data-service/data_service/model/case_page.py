@@ -10,3 +10,4 @@ class CasePage:
     cases: List[Case]
     total: int
     nextPage: Optional[int] = None
+    nextCursor: Optional[str] = None
@@ -2,7 +2,9 @@ import copy
 import csv
 import dataclasses
 import datetime
+import functools
 import io
+import itertools
 import operator
 import json
 import flask.json
@@ -12,7 +14,7 @@ from data_service.model.geojson import Feature
 from data_service.util.errors import ValidationError
 from data_service.util.json_encoder import JSONEncoder
 
-from typing import Any, List
+from typing import Any, Callable, Iterable, Iterator, List
 
 
 @dataclasses.dataclass
@@ -30,21 +32,27 @@ class Document:
         return JSONEncoder().encode(self.to_dict())
 
     @classmethod
-    def date_fields(cls) -> list[str]:
+    def date_fields(cls) -> tuple[str]:
         """Record where dates are kept because they sometimes need special treatment."""
         return cls.fields_of_class(datetime.date)
 
     @classmethod
-    def location_fields(cls) -> list[str]:
+    def location_fields(cls) -> tuple[str]:
         return cls.fields_of_class(Feature)
 
     @classmethod
-    def document_fields(cls) -> list[str]:
+    def document_fields(cls) -> tuple[str]:
         return cls.fields_of_class(Document)
 
     @classmethod
-    def fields_of_class(cls, a_class: type) -> list[str]:
-        return [f.name for f in dataclasses.fields(cls) if issubclass(f.type, a_class)]
+    @functools.cache
+    def fields_of_class(cls, a_class: type) -> tuple[str]:
+        # A dataclass's fields don't change once it's made (adding a field to the Case
+        # makes a new class), and this is asked for every key of every decoded document,
+        # so remember the answer.
+        return tuple(
+            f.name for f in dataclasses.fields(cls) if issubclass(f.type, a_class)
+        )
 
     @staticmethod
     def interpret_date(maybe_date) -> datetime.date:
@@ -113,25 +121,36 @@ class Document:
 
     def field_values(self) -> List[str]:
         """The list of values of fields on this object and member dataclasses."""
-        fields = []
-        for f in dataclasses.fields(self):
-            value = getattr(self, f.name)
+        values = []
+        for extract in self.field_value_extractors():
+            values += extract(self)
+        return values
+
+    @classmethod
+    @functools.cache
+    def field_value_extractors(cls) -> tuple[Callable[[Any], List[str]]]:
+        """For each field in this class, a function that returns the list of values that
+        field contributes to field_values(). Worked out once per class rather than once per
+        row, because downloads ask for the field values of every case."""
+        extractors = []
+        for f in dataclasses.fields(cls):
             if issubclass(f.type, Document):
-                if self.include_dataclass_fields(f.type):
-                    if value is not None:
-                        fields += value.field_values()
-                    else:
-                        fields += f.type.none_field_values()
+                if cls.include_dataclass_fields(f.type):
+                    extractors.append(document_values_extractor(f.name, f.type))
             elif hasattr(f.type, "custom_field_names"):
-                if value is not None:
-                    fields += value.custom_field_values()
-                else:
-                    fields += f.type.custom_none_field_values()
-            elif isinstance(value, list):
-                fields.append(",".join(value))
+                extractors.append(custom_values_extractor(f.name, f.type))
             else:
-                fields.append(str(value) if value is not None else "")
-        return fields
+                extractors.append(simple_value_extractor(f.name))
+        return tuple(extractors)
+
+    @classmethod
+    def exported_fields(cls) -> List[str]:
+        """The names of the fields in this class that appear in delimiter-separated downloads."""
+        return [
+            f.name
+            for f in dataclasses.fields(cls)
+            if not issubclass(f.type, Document) or cls.include_dataclass_fields(f.type)
+        ]
 
     @staticmethod
     def include_dataclass_fields(aType: type):
@@ -145,6 +164,34 @@ class Document:
         csv_writer.writerow(self.field_values())
         return f.getvalue()
 
+    @classmethod
+    def delimiter_separated_chunks(
+        cls, documents: Iterable, sep: str, chunk_size: int = 65536
+    ) -> Iterator[str]:
+        """Create the lines for many documents, writing batches of rows through a single
+        csv writer and yielding the output in chunks of about chunk_size characters."""
+        buffer = io.StringIO()
+        csv_writer = csv.writer(buffer, delimiter=sep)
+        documents = iter(documents)
+        while batch := list(itertools.islice(documents, 500)):
+            csv_writer.writerows([d.field_values() for d in batch])
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell() > 0:
+            yield buffer.getvalue()
+
+    @classmethod
+    def tsv_chunks(cls, documents: Iterable) -> Iterator[str]:
+        """Generate the rows of a TSV file containing the documents, in large chunks."""
+        return cls.delimiter_separated_chunks(documents, "\t")
+
+    @classmethod
+    def csv_chunks(cls, documents: Iterable) -> Iterator[str]:
+        """Generate the rows of a CSV file containing the documents, in large chunks."""
+        return cls.delimiter_separated_chunks(documents, ",")
+
     def to_tsv(self) -> str:
         """Generate a row in a CSV file representing myself."""
         return self.delimiter_separated_values("\t")
@@ -198,22 +245,45 @@ class Document:
         """Check whether I am consistent. Raise ValidationError if not."""
         for field in self.custom_fields:
             getter = operator.attrgetter(field.key)
-            value = getter(self)
-            if field.required is True and value is None:
-                raise ValidationError(f"{field.key} must have a value")
-            if field.key in self.document_fields() and value is not None:
-                getter(self).validate()
-            if field.is_list:
-                for element in value:
-                    if not isinstance(element, field.element_type()):
-                        raise ValidationError(f"{field.key} member {element} is of the wrong type")
-            if field.values is not None:
-                test_collection = value if field.is_list is True else [value]
-                for a_value in test_collection:
-                    if a_value is not None and a_value not in field.values:
-                        raise ValidationError(
-                            f"{field.key} value {a_value} not in permissible values {field.values}"
-                        )
+            self.validate_field_value(field, getter(self))
+
+    @classmethod
+    def validate_field_value(cls, field, value):
+        """Check whether value is acceptable for the field described by the
+        supplied Field model. Raise ValidationError if not."""
+        if field.required is True and value is None:
+            raise ValidationError(f"{field.key} must have a value")
+        if field.key in cls.document_fields() and value is not None:
+            value.validate()
+        if field.is_list:
+            for element in value:
+                if not isinstance(element, field.element_type()):
+                    raise ValidationError(f"{field.key} member {element} is of the wrong type")
+        if field.values is not None:
+            test_collection = value if field.is_list is True else [value]
+            for a_value in test_collection:
+                if a_value is not None and a_value not in field.values:
+                    raise ValidationError(
+                        f"{field.key} value {a_value} not in permissible values {field.values}"
+                    )
+
+    @classmethod
+    def typed_update(cls, update: DocumentUpdate) -> DocumentUpdate:
+        """A copy of the update with values converted to the types of the fields they
+        are going into, where they arrived as strings (e.g. dates from a JSON API)."""
+        typed = DocumentUpdate()
+        for key, value in update.updates_iter():
+            try:
+                field_type = cls.field_type_for_key_path(key)
+            except (IndexError, TypeError):
+                # not a field of mine: leave it for validation to deal with
+                field_type = None
+            if field_type == datetime.date and type(value) == str:
+                value = datetime.date.fromisoformat(value)
+            typed.update(key, value)
+        for key in update.unsets_iter():
+            typed.update(key, None)
+        return typed
 
     def _internal_set_value(self, key, value):
         self._internal_ensure_containers_exist(key)
@@ -260,3 +330,39 @@ class Document:
             name = props.pop(0)
             a_type = [f.type for f in dataclasses.fields(a_type) if f.name == name][0]
         return a_type
+
+
+def simple_value_extractor(name: str) -> Callable[[Any], List[str]]:
+    """Report a scalar or list field as a single value."""
+
+    def extract(document) -> List[str]:
+        value = getattr(document, name)
+        if isinstance(value, list):
+            return [",".join(value)]
+        return [str(value) if value is not None else ""]
+
+    return extract
+
+
+def document_values_extractor(name: str, a_type: type) -> Callable[[Any], List[str]]:
+    """Report each of the fields of a member document."""
+
+    def extract(document) -> List[str]:
+        value = getattr(document, name)
+        return value.field_values() if value is not None else a_type.none_field_values()
+
+    return extract
+
+
+def custom_values_extractor(name: str, a_type: type) -> Callable[[Any], List[str]]:
+    """Report the values of a member object that describes its own fields, like a Feature."""
+
+    def extract(document) -> List[str]:
+        value = getattr(document, name)
+        return (
+            value.custom_field_values()
+            if value is not None
+            else a_type.custom_none_field_values()
+        )
+
+    return extract
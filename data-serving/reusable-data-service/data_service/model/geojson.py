@@ -65,6 +65,8 @@ class Feature:
         "admin2": lambda f: f.properties.get("admin2", ""),
         "admin3": lambda f: f.properties.get("admin3", ""),
     }
+    # types of the field_getters values that aren't strings, for typed (e.g. parquet) downloads
+    field_types = {"latitude": float, "longitude": float}
 
     def validate(self):
         if self.type != "Feature":
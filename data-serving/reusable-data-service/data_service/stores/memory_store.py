@@ -1,3 +1,5 @@
+import copy
+
 from functools import reduce
 from operator import attrgetter, and_
 from typing import List, Optional
@@ -26,6 +28,10 @@ class MemoryStore:
     def case_by_id(self, id: str):
         return self.cases.get(id)
 
+    def cases_by_ids(self, ids: List[str]) -> dict[str, Case]:
+        # callers can change what they get back, as they can with cases decoded from a database
+        return {id: copy.deepcopy(self.cases[id]) for id in ids if id in self.cases}
+
     def put_case(self, id: str, case: Case):
         """This is test-only interface for populating the store."""
         self.cases[id] = case
@@ -44,6 +50,12 @@ class MemoryStore:
         case = self.case_by_id(id)
         case.apply_update(update)
 
+    def update_cases(self, predicate: Filter, update: DocumentUpdate) -> int:
+        matching = [c for c in self.cases.values() if predicate(c)]
+        for case in matching:
+            case.apply_update(update)
+        return len(matching)
+
     def batch_update(self, updates: dict[str, DocumentUpdate]):
         for id, update in iter(updates.items()):
             self.update_case(id, update)
@@ -56,11 +68,35 @@ class MemoryStore:
         case.caseStatus = status
         case.caseExclusion = exclusion
 
+    def update_cases_status(
+        self, predicate: Filter, status: str, exclusion: CaseExclusionMetadata
+    ):
+        for case in self.cases.values():
+            if predicate(case):
+                case.caseStatus = status
+                case.caseExclusion = exclusion
+
+    def batch_update_case_status(
+        self, ids: List[str], status: str, exclusion: CaseExclusionMetadata
+    ):
+        for id in ids:
+            self.update_case_status(id, status, exclusion)
+
     def fetch_cases(self, page: int, limit: int, predicate: Filter):
         return list(self.cases.values())[(page - 1) * limit : page * limit]
 
-    def count_cases(self, predicate: Filter = Anything()):
-        return len([True for c in self.cases.values() if predicate(c)])
+    def fetch_cases_after(self, last_id: str, limit: int, predicate: Filter):
+        ids = list(self.cases.keys())
+        try:
+            position = ids.index(last_id)
+        except ValueError:
+            raise ValueError(f"{last_id} is not a valid case ID")
+        following = [self.cases[id] for id in ids[position + 1 :]]
+        return [c for c in following if predicate(c)][:limit]
+
+    def count_cases(self, predicate: Filter = Anything(), limit: Optional[int] = None):
+        count = len([True for c in self.cases.values() if predicate(c)])
+        return count if limit is None else min(count, limit)
 
     def batch_upsert(self, cases: List[Case]):
         for case in cases:
@@ -77,13 +113,23 @@ class MemoryStore:
     def delete_case(self, case_id: str):
         del self.cases[case_id]
 
+    def delete_cases_by_ids(self, ids: List[str]) -> int:
+        present = [id for id in ids if id in self.cases]
+        for id in present:
+            del self.cases[id]
+        return len(present)
+
+    def missing_case_ids(self, ids: List[str]) -> List[str]:
+        return [id for id in ids if id not in self.cases]
+
     def delete_cases(self, query: Filter):
         self.cases = dict()
 
-    def matching_case_iterator(self, query: Filter):
-        return iter(self.cases.values())
+    def matching_case_iterator(self, query: Filter, fields: List[str] = None):
+        # like cases decoded from a database, the cases can be changed without changing the store
+        return (copy.deepcopy(c) for c in self.cases.values())
 
-    def identified_case_iterator(self, case_ids):
+    def identified_case_iterator(self, case_ids, fields: List[str] = None):
         ids_as_ints = [int(x) for x in case_ids]
         all_cases = list(self.cases.values())
         matching_cases = [all_cases[i] for i in ids_as_ints]
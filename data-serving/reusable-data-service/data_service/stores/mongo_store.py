@@ -12,15 +12,18 @@ from data_service.model.filter import (
     PropertyFilter,
     FilterOperator,
 )
-from json import loads
 from bson.errors import InvalidId
-from bson.json_util import dumps
 from bson.objectid import ObjectId
-from typing import Any, List, Tuple
+from typing import Iterator, List, Optional, Tuple
 
 
 Case = None
 
+# Iterators over many cases (e.g. for downloads) fetch them from mongo this many at a time
+ITERATOR_BATCH_SIZE = 5000
+# Bulk operations on lists of cases are sent to mongo this many at a time
+BULK_WRITE_CHUNK_SIZE = 1000
+
 
 def case_observer(cls):
     global Case
@@ -59,23 +62,57 @@ class MongoStore:
         try:
             case = self.get_case_collection().find_one({"_id": ObjectId(id)})
             if case is not None:
-                # case includes BSON fields like ObjectID - convert into JSON for use by the app
-                return Case.from_dict(MongoStore.mongo_document_to_json(case))
+                return MongoStore.mongo_document_to_case(case)
             else:
                 return None
         except InvalidId:
             return None
 
+    def cases_by_ids(self, ids: List[str]) -> dict[str, Case]:
+        """Fetch the cases with IDs in the list, up to BULK_WRITE_CHUNK_SIZE in each query.
+        Returns the cases that exist, keyed by ID."""
+        cases = {}
+        for chunk in chunked(object_ids(ids), BULK_WRITE_CHUNK_SIZE):
+            found = self.get_case_collection().find({"_id": {"$in": chunk}})
+            for doc in found:
+                case = MongoStore.mongo_document_to_case(doc)
+                cases[case._id] = case
+        return cases
+
     def fetch_cases(self, page: int, limit: int, filter: Filter):
+        # sort by _id so that pages line up with those fetched by fetch_cases_after
+        cases = self.get_case_collection().find(
+            filter.to_mongo_query(),
+            sort=[("_id", pymongo.ASCENDING)],
+            skip=(page - 1) * limit,
+            limit=limit,
+        )
+        return [MongoStore.mongo_document_to_case(c) for c in cases]
+
+    def fetch_cases_after(self, last_id: str, limit: int, filter: Filter):
+        """Fetch up to limit cases matching the filter that come after the case with
+        ID last_id in _id order. The _id index finds the start of the page, rather than
+        skipping over all of the cases before it. Raises ValueError if last_id is not
+        a valid ID."""
+        try:
+            oid = ObjectId(last_id)
+        except (InvalidId, TypeError):
+            raise ValueError(f"{last_id} is not a valid case ID")
+        query = {"$and": [filter.to_mongo_query(), {"_id": {"$gt": oid}}]}
         cases = self.get_case_collection().find(
-            filter.to_mongo_query(), skip=(page - 1) * limit, limit=limit
+            query, sort=[("_id", pymongo.ASCENDING)], limit=limit
         )
-        return [Case.from_dict(MongoStore.mongo_document_to_json(c)) for c in cases]
+        return [MongoStore.mongo_document_to_case(c) for c in cases]
 
-    def count_cases(self, filter: Filter) -> int:
+    def count_cases(self, filter: Filter, limit: Optional[int] = None) -> int:
+        """Count the cases matching the filter, reading at most limit of them if it's
+        given: a count that reaches limit means there are at least that many."""
         if isinstance(filter, Anything):
             return self.get_case_collection().estimated_document_count()
-        return self.get_case_collection().count_documents(filter.to_mongo_query())
+        options = {} if limit is None else {"limit": limit}
+        return self.get_case_collection().count_documents(
+            filter.to_mongo_query(), **options
+        )
 
     def insert_case(self, case: Case):
         to_insert = MongoStore.case_to_bson_compatible_dict(case)
@@ -91,14 +128,38 @@ class MongoStore:
     def update_case_status(
         self, id: str, status: str, exclusion: CaseExclusionMetadata
     ):
+        update = self.case_status_update_command(status, exclusion)
+        self.get_case_collection().update_one({"_id": ObjectId(id)}, update)
+
+    def update_cases_status(
+        self, filter: Filter, status: str, exclusion: CaseExclusionMetadata
+    ):
+        """Set the status of every case matching the filter, in a single command."""
+        update = self.case_status_update_command(status, exclusion)
+        self.get_case_collection().update_many(filter.to_mongo_query(), update)
+
+    def batch_update_case_status(
+        self, ids: List[str], status: str, exclusion: CaseExclusionMetadata
+    ):
+        """Set the status of every case with an ID in the list, sending the updates
+        to mongo in bulk writes of up to BULK_WRITE_CHUNK_SIZE operations."""
+        update = self.case_status_update_command(status, exclusion)
+        for chunk in chunked(ids, BULK_WRITE_CHUNK_SIZE):
+            operations = [
+                pymongo.UpdateOne({"_id": ObjectId(id)}, update) for id in chunk
+            ]
+            self.get_case_collection().bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def case_status_update_command(status: str, exclusion: CaseExclusionMetadata):
         update = {"$set": {"caseStatus": status}}
         if exclusion:
             update["$set"][
                 "caseExclusion"
-            ] = self.case_exclusion_to_bson_compatible_dict(exclusion)
+            ] = MongoStore.case_exclusion_to_bson_compatible_dict(exclusion)
         else:
             update["$unset"] = {"caseExclusion": True}
-        self.get_case_collection().update_one({"_id": ObjectId(id)}, update)
+        return update
 
     def batch_upsert(self, cases: List[Case]) -> Tuple[int, int]:
         to_insert = [
@@ -130,7 +191,7 @@ class MongoStore:
                 ]
             }
         )
-        return [Case.from_dict(MongoStore.mongo_document_to_json(c)) for c in cases]
+        return [MongoStore.mongo_document_to_case(c) for c in cases]
 
     def update_case(self, id: str, update: DocumentUpdate):
         if len(update) == 0:
@@ -138,11 +199,16 @@ class MongoStore:
         command = self.mongodb_update_command(update)
         self.get_case_collection().update_one({"_id": ObjectId(id)}, command)
 
-    def update_cases(self, filter: Filter, update: DocumentUpdate):
+    def update_cases(self, filter: Filter, update: DocumentUpdate) -> int:
+        """Apply the update to all cases matching the filter, in a single command.
+        Returns the number of cases modified."""
         if len(update) == 0:
-            return
+            return 0
         command = self.mongodb_update_command(update)
-        self.get_case_collection().update_many(filter.to_mongo_query(), command)
+        result = self.get_case_collection().update_many(
+            filter.to_mongo_query(), command
+        )
+        return result.modified_count
 
     def batch_update(self, updates: dict[str, DocumentUpdate]):
         mongo_commands = {
@@ -159,6 +225,26 @@ class MongoStore:
         """Delete the case with the specified ID"""
         self.get_case_collection().delete_one({"_id": ObjectId(id)})
 
+    def delete_cases_by_ids(self, ids: List[str]) -> int:
+        """Delete all cases with IDs in the list, in chunks of up to BULK_WRITE_CHUNK_SIZE
+        IDs. Returns the number of cases deleted."""
+        deleted = 0
+        for chunk in chunked(object_ids(ids), BULK_WRITE_CHUNK_SIZE):
+            result = self.get_case_collection().delete_many({"_id": {"$in": chunk}})
+            deleted += result.deleted_count
+        return deleted
+
+    def missing_case_ids(self, ids: List[str]) -> List[str]:
+        """Report which of the IDs in the list don't identify a case, reading only
+        the IDs of the cases that do exist."""
+        present = set()
+        for chunk in chunked(object_ids(ids), BULK_WRITE_CHUNK_SIZE):
+            found = self.get_case_collection().find(
+                {"_id": {"$in": chunk}}, projection={"_id": True}
+            )
+            present.update(str(doc["_id"]) for doc in found)
+        return [id for id in ids if id not in present]
+
     def delete_cases(self, filter: Filter):
         """Delete all cases that match the specified filter."""
         predicate = filter.to_mongo_query()
@@ -166,12 +252,15 @@ class MongoStore:
 
     @staticmethod
     def mongodb_update_command(update: DocumentUpdate):
-        objectify_id = (
-            lambda k, v: ObjectId(v)
-            if Case.field_type_for_key_path(k) == ObjectId
-            else v
-        )
-        sets = {key: objectify_id(key, value) for key, value in update.updates_iter()}
+        def bson_value(key, value):
+            if Case.field_type_for_key_path(key) == ObjectId:
+                return ObjectId(value)
+            # BSON works with datetimes, not dates
+            if type(value) == datetime.date:
+                return date_to_datetime(value)
+            return value
+
+        sets = {key: bson_value(key, value) for key, value in update.updates_iter()}
         unsets = {key: True for key in update.unsets_iter()}
         command = dict()
         if len(sets) > 0:
@@ -180,24 +269,33 @@ class MongoStore:
             command["$unset"] = unsets
         return command
 
-    def matching_case_iterator(self, predicate: Filter):
-        """Return an object that iterates over cases matching the predicate."""
-        cases = self.get_case_collection().find(predicate.to_mongo_query())
+    def matching_case_iterator(
+        self, predicate: Filter, fields: Optional[List[str]] = None
+    ):
+        """Return an object that iterates over cases matching the predicate.
+        If fields is supplied, only those fields are read from the database."""
+        cases = self.get_case_collection().find(
+            predicate.to_mongo_query(),
+            projection=fields,
+            batch_size=ITERATOR_BATCH_SIZE,
+        )
         return MongoStore.case_model_iterator(cases)
 
-    def identified_case_iterator(self, caseIds: List[str]):
-        """Return an object that iterates over cases with the listed IDs."""
+    def identified_case_iterator(
+        self, caseIds: List[str], fields: Optional[List[str]] = None
+    ):
+        """Return an object that iterates over cases with the listed IDs.
+        If fields is supplied, only those fields are read from the database."""
         oids = [ObjectId(anId) for anId in caseIds]
-        cases = self.get_case_collection().find({"_id": {"$in": oids}})
+        cases = self.get_case_collection().find(
+            {"_id": {"$in": oids}}, projection=fields, batch_size=ITERATOR_BATCH_SIZE
+        )
         return MongoStore.case_model_iterator(cases)
 
     @staticmethod
     def case_model_iterator(mongo_iterator):
         """Turn an iterator of mongo results into an iterator of cases."""
-        return map(
-            lambda c: Case.from_dict(MongoStore.mongo_document_to_json(c)),
-            mongo_iterator,
-        )
+        return map(MongoStore.mongo_document_to_case, mongo_iterator)
 
     @staticmethod
     def setup():
@@ -236,14 +334,16 @@ class MongoStore:
         return bson_case
 
     @staticmethod
-    def mongo_document_to_json(doc) -> Any:
-        """Patch up some bson-specific warts in a pymongo document before handing back to the app."""
-        # Because bson.json_util doesn't expose dump we have to round-trip through a string
-        dictionary = loads(dumps(doc))
-        the_id = dictionary["_id"]
-        if isinstance(the_id, dict):
-            dictionary["_id"] = the_id["$oid"]
-        return dictionary
+    def mongo_document_to_case(doc) -> Case:
+        """Decode a pymongo document straight into a Case.
+        pymongo has already turned the BSON into python types, and the Case model understands
+        datetimes in date fields, so the only wart to patch up is the ObjectId in _id, which the
+        app treats as an opaque string. Nested ObjectIds (e.g. caseReference.sourceId) are kept
+        as they are so that they are written back to mongo with the same type; the app's JSON
+        encoder presents them as strings."""
+        dictionary = dict(doc)
+        dictionary["_id"] = str(dictionary["_id"])
+        return Case.from_dict(dictionary)
 
     @staticmethod
     def case_exclusion_to_bson_compatible_dict(exclusion: CaseExclusionMetadata):
@@ -273,6 +373,23 @@ class MongoStore:
         ]
 
 
+def chunked(items: List, size: int) -> Iterator[List]:
+    """Split a list into lists of up to size items."""
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def object_ids(ids: List[str]) -> List[ObjectId]:
+    """Convert case IDs to ObjectIds, leaving out any that can't be case IDs."""
+    oids = []
+    for id in ids:
+        try:
+            oids.append(ObjectId(id))
+        except (InvalidId, TypeError):
+            pass
+    return oids
+
+
 def date_to_datetime(dt: datetime.date) -> datetime.datetime:
     """Convert datetime.date to datetime.datetime for encoding as BSON"""
     return datetime.datetime(dt.year, dt.month, dt.day)
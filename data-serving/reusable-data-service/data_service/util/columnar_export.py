@@ -0,0 +1,192 @@
+import dataclasses
+import datetime
+import functools
+import io
+import itertools
+
+import pyarrow
+import pyarrow.ipc
+import pyarrow.parquet
+
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+
+from data_service.model.document import Document
+
+# Each batch of this many documents becomes one record batch (and one parquet row group),
+# which bounds how many rows are held in memory at once.
+ROWS_PER_BATCH = 10000
+
+
+def columnar_formats() -> List[str]:
+    """The columnar download formats I can produce."""
+    return ["parquet", "arrow"]
+
+
+mime_types = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+class ChunkSink(io.RawIOBase):
+    """A write-only file that hands over what has been written to it on request.
+    The writers record offsets in their output, so tell() reports the total
+    written even after earlier output has been taken."""
+
+    def __init__(self):
+        self.position = 0
+        self.pieces = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pieces.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self) -> bytes:
+        """Return everything written since the last call, and forget it."""
+        data = b"".join(self.pieces)
+        self.pieces = []
+        return data
+
+
+def arrow_type(python_type: type):
+    return {
+        str: pyarrow.string(),
+        int: pyarrow.int64(),
+        float: pyarrow.float64(),
+        bool: pyarrow.bool_(),
+        datetime.date: pyarrow.date32(),
+    }.get(python_type, pyarrow.string())
+
+
+def arrow_value(python_type: type, value: Any) -> Any:
+    """Massage a value to fit the column it's going into. Anything that doesn't
+    have a natural arrow type (like an ObjectId) is written as a string."""
+    if value is None:
+        return None
+    if python_type in (int, bool, datetime.date):
+        return value
+    if python_type is float:
+        return float(value)
+    return str(value)
+
+
+def attribute_column(
+    name: str, python_type: type
+) -> Tuple[str, Any, Callable[[Any], Any]]:
+    def getter(document):
+        return arrow_value(python_type, getattr(document, name))
+
+    return name, arrow_type(python_type), getter
+
+
+def list_column(name: str, element_type: type) -> Tuple[str, Any, Callable[[Any], Any]]:
+    def getter(document):
+        value = getattr(document, name)
+        if value is None:
+            return None
+        return [arrow_value(element_type, v) for v in value]
+
+    return name, pyarrow.list_(arrow_type(element_type)), getter
+
+
+def member_column(
+    name: str, column: Tuple[str, Any, Callable[[Any], Any]]
+) -> Tuple[str, Any, Callable[[Any], Any]]:
+    """A column of a member document, prefixed with the member's name."""
+    (member_name, member_type, member_getter) = column
+
+    def getter(document):
+        member = getattr(document, name)
+        return member_getter(member) if member is not None else None
+
+    return f"{name}.{member_name}", member_type, getter
+
+
+def custom_field_column(
+    name: str, a_type: type, field: str
+) -> Tuple[str, Any, Callable[[Any], Any]]:
+    """A column for one of the fields reported by an object that describes its
+    own fields for downloads, like a Feature."""
+    python_type = a_type.field_types.get(field, str)
+    field_getter = a_type.field_getters[field]
+
+    def getter(member):
+        # these getters report missing values as empty strings for the text formats
+        value = field_getter(member)
+        return arrow_value(python_type, value) if value != "" else None
+
+    return member_column(name, (field, arrow_type(python_type), getter))
+
+
+@functools.cache
+def column_plan(cls: type) -> Tuple[Tuple[str, Any, Callable[[Any], Any]]]:
+    """The (name, arrow type, getter) of each column in a download of this
+    class, in the same order as the delimiter-separated formats. Lists become
+    list columns using the element type from the class's field models, and dates stay dates."""
+    field_models = {f.key: f for f in getattr(cls, "custom_fields", [])}
+    columns = []
+    for f in dataclasses.fields(cls):
+        if issubclass(f.type, Document):
+            if cls.include_dataclass_fields(f.type):
+                columns += [member_column(f.name, c) for c in column_plan(f.type)]
+        elif hasattr(f.type, "custom_field_names"):
+            columns += [
+                custom_field_column(f.name, f.type, g)
+                for g in f.type.custom_field_names()
+            ]
+        elif f.type is list:
+            model = field_models.get(f.name)
+            element_type = model.element_type() if model is not None else str
+            columns.append(list_column(f.name, element_type))
+        else:
+            columns.append(attribute_column(f.name, f.type))
+    return tuple(columns)
+
+
+def arrow_schema(cls: type):
+    return pyarrow.schema([(name, a_type) for (name, a_type, _) in column_plan(cls)])
+
+
+def record_batches(cls: type, documents: Iterable) -> Iterator[Any]:
+    """Turn documents into arrow record batches of up to ROWS_PER_BATCH rows."""
+    plan = column_plan(cls)
+    schema = arrow_schema(cls)
+    documents = iter(documents)
+    while batch := list(itertools.islice(documents, ROWS_PER_BATCH)):
+        arrays = [
+            pyarrow.array([getter(d) for d in batch], type=a_type)
+            for (_, a_type, getter) in plan
+        ]
+        yield pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def parquet_chunks(cls, documents: Iterable) -> Iterator[bytes]:
+    """Generate a parquet file containing the documents, one row group at a time."""
+    sink = ChunkSink()
+    with pyarrow.parquet.ParquetWriter(sink, arrow_schema(cls)) as writer:
+        for batch in record_batches(cls, documents):
+            writer.write_table(pyarrow.Table.from_batches([batch]))
+            yield sink.take()
+    yield sink.take()
+
+
+def arrow_chunks(cls, documents: Iterable) -> Iterator[bytes]:
+    """Generate an arrow IPC stream containing the documents, one record batch at a time."""
+    sink = ChunkSink()
+    with pyarrow.ipc.new_stream(sink, arrow_schema(cls)) as writer:
+        for batch in record_batches(cls, documents):
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
+
+
+# Add methods to the Document class here so that downloads can find them.
+Document.parquet_chunks = classmethod(parquet_chunks)
+Document.arrow_chunks = classmethod(arrow_chunks)
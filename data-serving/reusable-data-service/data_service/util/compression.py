@@ -0,0 +1,37 @@
+import zlib
+import zstandard
+
+from typing import Iterable, Iterator, List, Union
+
+
+def gzip_compressor():
+    # wbits of 16 + MAX_WBITS asks zlib for a gzip header and trailer
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def zstd_compressor():
+    return zstandard.ZstdCompressor().compressobj()
+
+
+# in order of preference when a client will accept more than one
+compressors = {"zstd": zstd_compressor, "gzip": gzip_compressor}
+
+mime_types = {"gzip": "application/gzip", "zstd": "application/zstd"}
+
+
+def supported_encodings() -> List[str]:
+    """The compression formats I can produce, most preferred first."""
+    return list(compressors.keys())
+
+
+def compress_stream(
+    chunks: Iterable[Union[str, bytes]], encoding: str
+) -> Iterator[bytes]:
+    """Compress a stream of text (or binary data) incrementally, so that only the
+    compressor's window is held in memory rather than the whole output."""
+    compressor = compressors[encoding]()
+    for chunk in chunks:
+        data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        if compressed := compressor.compress(data):
+            yield compressed
+    yield compressor.flush()
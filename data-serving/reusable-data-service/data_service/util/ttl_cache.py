@@ -0,0 +1,61 @@
+import collections
+import threading
+import time
+
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """A thread-safe, size-limited cache whose entries go stale after ttl seconds.
+    When the cache is full the least recently used entry is evicted.
+    clear() starts a new generation of the cache: values computed from data read
+    before a clear() can be discarded by passing the generation they were read in
+    to put(), so that a slow reader can't repopulate the cache with stale data."""
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        ttl: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.generation = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, max_age: Optional[float] = None) -> Any:
+        """Return the value stored for key, or None if there isn't one or it's older
+        than max_age seconds (by default, the cache's ttl). Pass max_age=float("inf")
+        to accept a value however old it is."""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.clock() - stored_at > max_age:
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        """Store value for key. If generation is supplied and the cache has been cleared
+        since then, the value is dropped."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Forget everything, and start a new generation."""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,6 +1,7 @@
 import freezegun
 import pytest
 import json
+import time
 
 from datetime import date
 
@@ -89,6 +90,87 @@ def test_list_cases_nonexistent_page(case_controller):
     assert cases.nextPage is None
 
 
+def test_list_cases_by_cursor_visits_every_case(case_controller):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    for i in range(15):
+        case_controller.store.insert_case(Case.from_dict(case_doc))
+    first_page = case_controller.list_cases(limit=10)
+    assert first_page.nextCursor is not None
+    second_page = case_controller.list_cases(limit=10, after=first_page.nextCursor)
+    assert len(second_page.cases) == 5
+    assert second_page.total == 15
+    assert second_page.nextPage is None
+    assert second_page.nextCursor is None
+    ids = [c._id for c in first_page.cases + second_page.cases]
+    assert len(set(ids)) == 15
+
+
+def test_list_cases_with_malformed_cursor_raises(case_controller):
+    with pytest.raises(PreconditionUnsatisfiedError):
+        case_controller.list_cases(after="not a cursor")
+
+
+def test_list_cases_with_page_and_cursor_raises(case_controller):
+    with pytest.raises(PreconditionUnsatisfiedError):
+        case_controller.list_cases(page=2, after="eyJfaWQiOiAiMSJ9")
+
+
+def test_list_cases_without_count(case_controller):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    for i in range(15):
+        case_controller.store.insert_case(Case.from_dict(case_doc))
+    cases = case_controller.list_cases(page=1, limit=10, count="none")
+    assert len(cases.cases) == 10
+    assert cases.total is None
+    assert cases.nextPage == 2
+
+
+def test_list_cases_with_unknown_count_mode_raises(case_controller):
+    with pytest.raises(PreconditionUnsatisfiedError):
+        case_controller.list_cases(count="roughly")
+
+
+def test_list_cases_reuses_count_until_cases_change(case_controller):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    case_controller.create_case(case_doc)
+    assert case_controller.list_cases().total == 1
+    # the store changes behind the controller's back, so the cached count is used
+    case_controller.store.insert_case(Case.from_dict(case_doc))
+    assert case_controller.list_cases().total == 1
+    # the controller changes the store, so the count is recalculated
+    case_controller.create_case(case_doc)
+    assert case_controller.list_cases().total == 3
+
+
+def test_list_cases_estimate_accepts_stale_count(case_controller):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    case_controller.create_case(case_doc)
+    with freezegun.freeze_time() as frozen_time:
+        case_controller.count_cache.clock = time.monotonic
+        assert case_controller.list_cases().total == 1
+        case_controller.store.insert_case(Case.from_dict(case_doc))
+        frozen_time.tick(3600)
+        assert case_controller.list_cases(count="estimate").total == 1
+        assert case_controller.list_cases(count="exact").total == 2
+
+
+def test_list_cases_estimate_stops_counting_at_its_limit(case_controller):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    case_controller.create_case(case_doc, num_cases=3)
+    case_controller.estimate_count_limit = 2
+    page = case_controller.list_cases(limit=2, count="estimate")
+    assert page.total == 2
+    assert page.nextPage == 2
+    assert case_controller.list_cases(count="estimate").nextPage is None
+    # a bounded count isn't taken for an exact one
+    assert case_controller.list_cases(count="exact").total == 3
+
+
 def test_create_case_with_missing_properties_raises(case_controller):
     with pytest.raises(ValidationError):
         case_controller.create_case({})
@@ -450,6 +532,19 @@ def test_batch_update_raises_if_case_would_be_invalid(case_controller):
         case_controller.batch_update([update])
 
 
+def test_batch_update_leaves_cases_alone_if_any_update_is_invalid(case_controller):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    case_controller.create_case(case_doc)
+    case_controller.create_case(case_doc)
+    update_one = {"_id": "1", "caseStatus": "confirmed"}
+    update_two = {"_id": "2", "confirmationDate": None}
+    with pytest.raises(ValidationError):
+        case_controller.batch_update([update_one, update_two])
+    assert case_controller.get_case("1").caseStatus == "probable"
+    assert case_controller.get_case("2").confirmationDate is not None
+
+
 def test_batch_update_raises_if_case_not_found(case_controller):
     update = {"_id": "1", "confirmationDate": date(2022, 5, 13)}
     with pytest.raises(NotFoundError):
@@ -469,6 +564,42 @@ def test_batch_update_query_returns_modified_count(case_controller):
     assert modified == 4
 
 
+def test_batch_update_query_validates_simple_update_once(case_controller):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    for i in range(4):
+        case_controller.create_case(case_doc)
+
+    def no_iteration(predicate):
+        raise AssertionError("cases should not be read to validate this update")
+
+    case_controller.store.matching_case_iterator = no_iteration
+    modified = case_controller.batch_update_query(None, {"caseStatus": "suspected"})
+    assert modified == 4
+    assert case_controller.store.case_by_id("1").caseStatus == "suspected"
+
+
+def test_batch_update_query_rejects_invalid_simple_update(case_controller):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    case_controller.create_case(case_doc)
+    with pytest.raises(ValidationError):
+        case_controller.batch_update_query(None, {"caseStatus": "dubious"})
+    with pytest.raises(ValidationError):
+        case_controller.batch_update_query(None, {"confirmationDate": "2001-01-01"})
+    assert case_controller.store.case_by_id("1").caseStatus == "probable"
+
+
+def test_batch_update_query_validates_each_case_for_nested_update(case_controller):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    case_controller.create_case(case_doc)
+    before = case_controller.store.case_by_id("1").to_dict()
+    with pytest.raises(ValidationError):
+        case_controller.batch_update_query(None, {"age": {"lower": 50, "upper": 2}})
+    assert case_controller.store.case_by_id("1").to_dict() == before
+
+
 def test_delete_present_case_deletes_case(case_controller):
     with open("./tests/data/case.minimal.json", "r") as minimal_file:
         case_doc = json.load(minimal_file)
@@ -529,6 +660,24 @@ def test_batch_delete_with_case_ids(case_controller):
     assert case_controller.store.count_cases() == 2
 
 
+def test_batch_delete_with_missing_case_id_deletes_nothing(case_controller):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    case_controller.create_case(case_doc, num_cases=2)
+    with pytest.raises(NotFoundError):
+        case_controller.batch_delete(None, ["1", "missing"])
+    assert case_controller.store.count_cases() == 2
+
+
+def test_cannot_batch_delete_more_case_ids_than_threshold(case_controller):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    case_controller.create_case(case_doc, num_cases=3)
+    with pytest.raises(ValidationError):
+        case_controller.batch_delete(None, ["1", "2", "3"], threshold=2)
+    assert case_controller.store.count_cases() == 3
+
+
 def test_batch_delete_with_query(case_controller):
     """This test is deliberately set up to effectively delete all cases because
     anything more nuanced would require interpreting filter logic in the test store,
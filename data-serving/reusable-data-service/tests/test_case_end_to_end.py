@@ -1,7 +1,11 @@
 import bson
 import freezegun
+import gzip
+import io
 import json
+import pyarrow.parquet
 import pymongo
+import zstandard
 
 from datetime import datetime
 
@@ -49,6 +53,32 @@ def test_list_cases_with_pagination_query(client_with_patched_mongo):
     assert response.json["nextPage"] == 3
 
 
+def test_list_cases_with_cursor(client_with_patched_mongo):
+    db = pymongo.MongoClient("mongodb://localhost:27017/outbreak")
+    with open("./tests/data/case.minimal.json") as case_file:
+        case_doc = json.load(case_file)
+    db["outbreak"]["cases"].insert_many([dict(case_doc) for i in range(25)])
+    seen_ids = set()
+    cursor = None
+    for expected_length in [10, 10, 5]:
+        query = (
+            f"/api/cases?limit=10&after={cursor}" if cursor else "/api/cases?limit=10"
+        )
+        response = client_with_patched_mongo.get(query)
+        assert response.status_code == 200
+        assert len(response.json["cases"]) == expected_length
+        assert response.json["total"] == 25
+        seen_ids.update([c["_id"] for c in response.json["cases"]])
+        cursor = response.json["nextCursor"]
+    assert cursor is None
+    assert len(seen_ids) == 25
+
+
+def test_list_cases_with_malformed_cursor_rejected(client_with_patched_mongo):
+    response = client_with_patched_mongo.get(f"/api/cases?after=eyJfaWQiOiAiMSJ9")
+    assert response.status_code == 400
+
+
 def test_list_cases_with_negative_page_rejected(client_with_patched_mongo):
     response = client_with_patched_mongo.get(f"/api/cases?page=-2")
     assert response.status_code == 400
@@ -248,6 +278,78 @@ def test_download_all_cases_csv(client_with_patched_mongo):
     assert "2022-05-01" in string
 
 
+def test_download_compressed_in_transit_when_client_accepts_gzip(
+    client_with_patched_mongo,
+):
+    with open("./tests/data/case.minimal.json") as case_file:
+        case_doc = json.load(case_file)
+    db = pymongo.MongoClient("mongodb://localhost:27017/outbreak")
+    db["outbreak"]["cases"].insert_one(case_doc)
+    post_response = client_with_patched_mongo.post(
+        "/api/cases/download",
+        json={"format": "csv"},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert post_response.status_code == 200
+    assert post_response.headers["Content-Encoding"] == "gzip"
+    assert post_response.mimetype == "text/csv"
+    string = gzip.decompress(post_response.get_data()).decode("utf-8")
+    assert "2021-12-31" in string
+
+
+def test_download_compressed_file(client_with_patched_mongo):
+    with open("./tests/data/case.minimal.json") as case_file:
+        case_doc = json.load(case_file)
+    db = pymongo.MongoClient("mongodb://localhost:27017/outbreak")
+    db["outbreak"]["cases"].insert_one(case_doc)
+    post_response = client_with_patched_mongo.post(
+        "/api/cases/download", json={"format": "csv", "compression": "gzip"}
+    )
+    assert post_response.status_code == 200
+    assert "Content-Encoding" not in post_response.headers
+    assert post_response.mimetype == "application/gzip"
+    string = gzip.decompress(post_response.get_data()).decode("utf-8")
+    assert "2021-12-31" in string
+
+
+def test_download_prefers_zstd_in_transit(client_with_patched_mongo):
+    with open("./tests/data/case.minimal.json") as case_file:
+        case_doc = json.load(case_file)
+    db = pymongo.MongoClient("mongodb://localhost:27017/outbreak")
+    db["outbreak"]["cases"].insert_one(case_doc)
+    post_response = client_with_patched_mongo.post(
+        "/api/cases/download",
+        json={"format": "csv"},
+        headers={"Accept-Encoding": "gzip, zstd"},
+    )
+    assert post_response.status_code == 200
+    assert post_response.headers["Content-Encoding"] == "zstd"
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    string = decompressor.decompress(post_response.get_data()).decode("utf-8")
+    assert "2021-12-31" in string
+
+
+def test_download_parquet(client_with_patched_mongo):
+    with open("./tests/data/case.minimal.json") as case_file:
+        case_doc = json.load(case_file)
+    db = pymongo.MongoClient("mongodb://localhost:27017/outbreak")
+    db["outbreak"]["cases"].insert_many([dict(case_doc) for i in range(3)])
+    post_response = client_with_patched_mongo.post(
+        "/api/cases/download", json={"format": "parquet"}
+    )
+    assert post_response.status_code == 200
+    assert post_response.mimetype == "application/vnd.apache.parquet"
+    table = pyarrow.parquet.read_table(io.BytesIO(post_response.get_data()))
+    assert table.num_rows == 3
+
+
+def test_download_unsupported_compression_rejected(client_with_patched_mongo):
+    post_response = client_with_patched_mongo.post(
+        "/api/cases/download", json={"format": "csv", "compression": "rar"}
+    )
+    assert post_response.status_code == 415
+
+
 def test_download_selected_cases_tsv(client_with_patched_mongo):
     with open("./tests/data/case.minimal.json") as case_file:
         case_doc = json.load(case_file)
@@ -426,6 +528,8 @@ def test_batch_update_query(client_with_patched_mongo):
     )
     assert post_result.status_code == 200
     assert post_result.get_json()["numModified"] == 2
+    updated = db["outbreak"]["cases"].find_one({"_id": inserted.inserted_ids[0]})
+    assert updated["confirmationDate"] == datetime(2022, 4, 1)
 
 
 def test_delete_case(client_with_patched_mongo):
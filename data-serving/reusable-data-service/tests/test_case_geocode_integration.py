@@ -2,7 +2,7 @@ import json
 import pytest
 
 from datetime import date
-from typing import List
+from typing import Dict, List
 
 from data_service.controller.case_controller import CaseController
 from data_service.controller.geocode_controller import Geocoder
@@ -13,10 +13,15 @@ from data_service.stores.memory_store import MemoryStore
 class FakeGeocoder:
     def __init__(self, ignored_url: str):
         self.returned_feature = None
+        self.batches = []
 
     def locate_feature(self, query: str) -> List[Feature]:
         return [self.returned_feature]
 
+    def locate_features(self, queries: List[str]) -> Dict[str, List[Feature]]:
+        self.batches.append(list(queries))
+        return {q: [self.returned_feature] for q in set(queries)}
+
 
 @pytest.fixture
 def case_controller():
@@ -45,3 +50,25 @@ def test_geocodes_a_case_with_location_query(case_controller):
     assert len(cases) == 1
     case = cases[0]
     assert case.location == feature
+
+
+def test_batch_upsert_locates_each_distinct_query_once(case_controller):
+    feature = Feature()
+    point = Point()
+    point.coordinates = [1.234, 5.678]
+    feature.geometry = point
+    feature.properties = {"country": "ESP"}
+    case_controller.geocoder.returned_feature = feature
+
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_dict = json.load(minimal_file)
+    cases = [
+        dict(case_dict, location={"query": q}) for q in ["Madrid", "Lugo", "Madrid"]
+    ]
+    outcome = case_controller.batch_upsert({"cases": cases})
+
+    assert outcome.numCreated == 3
+    assert len(case_controller.geocoder.batches) == 1
+    assert sorted(set(case_controller.geocoder.batches[0])) == ["Lugo", "Madrid"]
+    located = case_controller.list_cases().cases
+    assert all(c.location == feature for c in located)
@@ -102,3 +102,28 @@ def test_list_elements_must_come_from_acceptable_values():
     case.gender = ["woman", "dalek"]
     with pytest.raises(ValidationError):
         case.validate()
+
+
+def test_csv_chunks_match_individual_rows():
+    with open("./tests/data/case.with_location.json", "r") as file:
+        case = Case.from_json(file.read())
+    chunks = list(Case.csv_chunks([case] * 3))
+    assert "".join(chunks) == case.to_csv() * 3
+
+
+def test_delimited_chunks_are_split_at_chunk_size():
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case = Case.from_json(minimal_file.read())
+    row = case.to_tsv()
+    chunks = list(
+        Case.delimiter_separated_chunks([case] * 1000, "\t", chunk_size=len(row) * 10)
+    )
+    assert len(chunks) > 1
+    assert "".join(chunks) == row * 1000
+
+
+def test_exported_fields_leave_out_excluded_documents():
+    fields = Case.exported_fields()
+    assert "caseStatus" in fields
+    assert "location" in fields
+    assert "caseExclusion" not in fields
@@ -0,0 +1,64 @@
+import io
+import pyarrow
+import pyarrow.ipc
+import pyarrow.parquet
+import pytest
+
+from datetime import date
+
+from data_service.model.case import Case
+from data_service.util.columnar_export import (
+    arrow_chunks,
+    columnar_formats,
+    parquet_chunks,
+)
+
+
+@pytest.fixture
+def cases():
+    with open("./tests/data/case.with_location.json", "r") as file:
+        located_case = Case.from_json(file.read())
+    with open("./tests/data/case.minimal.json", "r") as file:
+        minimal_case = Case.from_json(file.read())
+    return [located_case, minimal_case]
+
+
+def test_columnar_formats_offered():
+    assert columnar_formats() == ["parquet", "arrow"]
+
+
+def test_parquet_export_keeps_types(cases):
+    data = b"".join(parquet_chunks(Case, cases))
+    table = pyarrow.parquet.read_table(io.BytesIO(data))
+    assert table.num_rows == 2
+    assert table.schema.field("confirmationDate").type == pyarrow.date32()
+    assert table.schema.field("location.latitude").type == pyarrow.float64()
+    assert table.schema.field("gender").type == pyarrow.list_(pyarrow.string())
+    rows = table.to_pylist()
+    assert rows[0]["confirmationDate"] == date(2021, 12, 31)
+    assert rows[0]["location.country"] == "IND"
+    assert rows[0]["location.latitude"] == 12.345
+    assert rows[0]["location.admin1"] is None
+    assert rows[0]["gender"] == ["non-binary", "other"]
+    assert rows[0]["caseReference.sourceId"] == "fedc09876543210987654321"
+    assert rows[1]["location.country"] is None
+
+
+def test_parquet_export_has_the_same_columns_as_csv(cases):
+    data = b"".join(parquet_chunks(Case, cases))
+    table = pyarrow.parquet.read_table(io.BytesIO(data))
+    assert table.column_names == Case.field_names()
+
+
+def test_parquet_export_writes_row_groups(cases, monkeypatch):
+    monkeypatch.setattr("data_service.util.columnar_export.ROWS_PER_BATCH", 1)
+    data = b"".join(parquet_chunks(Case, cases))
+    parquet_file = pyarrow.parquet.ParquetFile(io.BytesIO(data))
+    assert parquet_file.num_row_groups == 2
+
+
+def test_arrow_stream_export(cases):
+    data = b"".join(arrow_chunks(Case, cases))
+    table = pyarrow.ipc.open_stream(data).read_all()
+    assert table.num_rows == 2
+    assert table.schema.field("confirmationDate").type == pyarrow.date32()
@@ -1,5 +1,8 @@
+import freezegun
 import pytest
+import requests
 import requests_mock
+import time
 
 from data_service.controller.geocode_controller import Geocoder
 from data_service.util.errors import DependencyFailedError
@@ -75,3 +78,145 @@ def test_geocode_controller_only_needs_country_and_geometry_in_response(requests
     props = location.properties
     assert props["country"] == "USA"
     assert props["query"] == "CDC Atlanta"
+
+
+def test_geocode_controller_caches_locations(requests_mock):
+    requests_mock.get(
+        "https://geocode.example/location-service/geocode",
+        json=[{"geometry": {"latitude": 12.3, "longitude": 45.6}, "country": "US"}],
+    )
+    controller = Geocoder("https://geocode.example/location-service")
+    first = controller.locate_feature("CDC Atlanta")
+    second = controller.locate_feature("CDC Atlanta")
+    assert requests_mock.call_count == 1
+    assert first == second
+    assert first[0] is not second[0]
+
+
+def test_geocode_controller_raises_if_service_cannot_be_reached(requests_mock):
+    requests_mock.get(
+        "https://geocode.example/location-service/geocode",
+        exc=requests.exceptions.ConnectTimeout,
+    )
+    controller = Geocoder("https://geocode.example/location-service")
+    with pytest.raises(DependencyFailedError):
+        controller.locate_feature("CDC Atlanta")
+
+
+def test_geocode_controller_locates_distinct_features_in_one_batch(requests_mock):
+    requests_mock.post(
+        "https://geocode.example/location-service/geocode/batch",
+        json=[
+            [{"geometry": {"latitude": 12.3, "longitude": 45.6}, "country": "US"}],
+            [],
+        ],
+    )
+    controller = Geocoder("https://geocode.example/location-service")
+    located = controller.locate_features(["Atlanta", "Nowhere", "Atlanta"])
+    assert requests_mock.call_count == 1
+    assert requests_mock.last_request.json() == {
+        "queries": [{"q": "Atlanta"}, {"q": "Nowhere"}]
+    }
+    assert located["Atlanta"][0].properties["country"] == "USA"
+    assert isinstance(located["Nowhere"], DependencyFailedError)
+
+
+def test_geocode_controller_only_sends_uncached_queries_in_batches(requests_mock):
+    requests_mock.get(
+        "https://geocode.example/location-service/geocode",
+        json=[{"geometry": {"latitude": 12.3, "longitude": 45.6}, "country": "US"}],
+    )
+    requests_mock.post(
+        "https://geocode.example/location-service/geocode/batch",
+        json=[[{"geometry": {"latitude": 1.2, "longitude": 3.4}, "country": "FR"}]],
+    )
+    controller = Geocoder("https://geocode.example/location-service")
+    controller.locate_feature("Atlanta")
+    located = controller.locate_features(["Atlanta", "Lyon"])
+    assert requests_mock.last_request.json() == {"queries": [{"q": "Lyon"}]}
+    assert located["Atlanta"][0].properties["country"] == "USA"
+    assert located["Lyon"][0].properties["country"] == "FRA"
+
+
+def test_geocode_controller_reports_failed_batch_for_every_query(requests_mock):
+    requests_mock.post(
+        "https://geocode.example/location-service/geocode/batch", status_code=500
+    )
+    controller = Geocoder("https://geocode.example/location-service", batch_size=1)
+    located = controller.locate_features(["Atlanta", "Lyon"])
+    assert requests_mock.call_count == 2
+    assert all(isinstance(e, DependencyFailedError) for e in located.values())
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        [[{"geometry": {"latitude": 12.3, "longitude": 45.6}, "country": "US"}]],
+        {"error": "Something went wrong"},
+        [[], None],
+    ],
+)
+def test_geocode_controller_reports_malformed_batch_for_every_query(
+    requests_mock, response
+):
+    requests_mock.post(
+        "https://geocode.example/location-service/geocode/batch", json=response
+    )
+    controller = Geocoder("https://geocode.example/location-service")
+    located = controller.locate_features(["Atlanta", "Lyon"])
+    assert all(isinstance(e, DependencyFailedError) for e in located.values())
+
+
+def test_geocode_controller_gives_larger_batches_longer(requests_mock):
+    controller = Geocoder(
+        "https://geocode.example/location-service",
+        timeout=10,
+        batch_concurrency=4,
+        rate_limit_per_min=600,
+    )
+    assert controller.batch_timeout(1) == pytest.approx(10.8)
+    assert controller.batch_timeout(20) == pytest.approx(26)
+
+
+def test_geocode_controller_locates_each_query_without_batch_endpoint(
+    requests_mock,
+):
+    requests_mock.post(
+        "https://geocode.example/location-service/geocode/batch", status_code=404
+    )
+    requests_mock.get(
+        "https://geocode.example/location-service/geocode?q=Atlanta",
+        json=[{"geometry": {"latitude": 12.3, "longitude": 45.6}, "country": "US"}],
+    )
+    requests_mock.get(
+        "https://geocode.example/location-service/geocode?q=Lyon", status_code=500
+    )
+    controller = Geocoder("https://geocode.example/location-service")
+    located = controller.locate_features(["Atlanta", "Lyon"])
+    assert located["Atlanta"][0].properties["country"] == "USA"
+    assert isinstance(located["Lyon"], DependencyFailedError)
+    requests_mock.get(
+        "https://geocode.example/location-service/geocode?q=Paris",
+        json=[{"geometry": {"latitude": 1.2, "longitude": 3.4}, "country": "FR"}],
+    )
+    located = controller.locate_features(["Paris"])
+    assert located["Paris"][0].properties["country"] == "FRA"
+    assert [r.method for r in requests_mock.request_history].count("POST") == 1
+
+
+def test_geocode_controller_cache_entries_expire_however_often_they_are_used(
+    requests_mock,
+):
+    requests_mock.get(
+        "https://geocode.example/location-service/geocode",
+        json=[{"geometry": {"latitude": 12.3, "longitude": 45.6}, "country": "US"}],
+    )
+    controller = Geocoder("https://geocode.example/location-service", cache_ttl=60)
+    with freezegun.freeze_time() as frozen_time:
+        controller.cache.clock = time.monotonic
+        controller.locate_feature("Atlanta")
+        for _ in range(3):
+            frozen_time.tick(30)
+            controller.locate_feature("Atlanta")
+            controller.locate_features(["Atlanta"])
+    assert requests_mock.call_count == 2
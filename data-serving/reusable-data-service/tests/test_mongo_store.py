@@ -1,16 +1,18 @@
+import json
 import pytest
 import mongomock
 
 from bson import ObjectId
-from datetime import date
+from datetime import date, datetime
 
 from data_service.model.case import (
     observe_case_class,
     remove_case_class_observer,
     reset_custom_case_fields,
 )
+from data_service.model.case_exclusion_metadata import CaseExclusionMetadata
 from data_service.model.case_reference import CaseReference
-from data_service.model.filter import Anything
+from data_service.model.filter import Anything, FilterOperator, PropertyFilter
 from data_service.stores.mongo_store import MongoStore
 
 Case = None
@@ -53,6 +55,15 @@ def test_store_inserts_case_with_no_case_reference(mongo_store):
     assert mongo_store.count_cases(Anything()) == 1
 
 
+def test_store_counts_at_most_the_limit(mongo_store):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case = Case.from_json(minimal_file.read())
+    mongo_store.batch_upsert([case, case, case])
+    confirmed = PropertyFilter("caseStatus", FilterOperator.EQUAL, case.caseStatus)
+    assert mongo_store.count_cases(confirmed) == 3
+    assert mongo_store.count_cases(confirmed, limit=2) == 2
+
+
 def test_store_inserts_case_with_empty_case_reference(mongo_store):
     with open("./tests/data/case.minimal.json", "r") as minimal_file:
         case = Case.from_json(minimal_file.read())
@@ -93,3 +104,86 @@ def test_batch_upsert_updates_case_with_existing_object_id(mongo_store):
     retrieved_case.confirmationDate = date(2021, 6, 19)
     (created, updated) = mongo_store.batch_upsert([retrieved_case])
     assert mongo_store.count_cases(Anything()) == 1
+
+
+def test_store_decodes_bson_types_without_json_round_trip(mongo_store):
+    source_id = ObjectId("fedc09876543210987654321")
+    inserted = (
+        mongo_store.get_case_collection()
+        .insert_one(
+            {
+                "confirmationDate": datetime(2022, 5, 10, 13, 45),
+                "caseReference": {"sourceId": source_id},
+                "caseStatus": "probable",
+                "pathogenStatus": "emerging",
+                "sexAtBirth": "female",
+                "gender": [],
+                "race": [],
+            }
+        )
+        .inserted_id
+    )
+    case = mongo_store.case_by_id(str(inserted))
+    assert case._id == str(inserted)
+    assert case.confirmationDate == date(2022, 5, 10)
+    assert case.caseReference.sourceId == source_id
+
+
+def insert_minimal_cases(mongo_store, count: int):
+    with open("./tests/data/case.minimal.json", "r") as minimal_file:
+        case_doc = json.load(minimal_file)
+    del case_doc["confirmationDate"]
+    docs = [
+        dict(case_doc, confirmationDate=datetime(2022, 5, i + 1)) for i in range(count)
+    ]
+    inserted = mongo_store.get_case_collection().insert_many(docs)
+    return [str(anId) for anId in inserted.inserted_ids]
+
+
+def test_batch_update_case_status_in_chunks(mongo_store, monkeypatch):
+    monkeypatch.setattr("data_service.stores.mongo_store.BULK_WRITE_CHUNK_SIZE", 2)
+    ids = insert_minimal_cases(mongo_store, 5)
+    exclusion = CaseExclusionMetadata()
+    exclusion.note = "duplicate"
+    mongo_store.batch_update_case_status(ids[:3], "omit_error", exclusion)
+    statuses = [mongo_store.case_by_id(anId).caseStatus for anId in ids]
+    assert statuses == ["omit_error"] * 3 + ["probable"] * 2
+    assert mongo_store.case_by_id(ids[0]).caseExclusion.note == "duplicate"
+
+
+def test_update_cases_status_by_filter(mongo_store):
+    ids = insert_minimal_cases(mongo_store, 4)
+    mongo_store.update_cases_status(
+        PropertyFilter(
+            "confirmationDate", FilterOperator.GREATER_THAN, date(2022, 5, 2)
+        ),
+        "suspected",
+        None,
+    )
+    statuses = [mongo_store.case_by_id(anId).caseStatus for anId in ids]
+    assert statuses == ["probable", "probable", "suspected", "suspected"]
+    assert mongo_store.case_by_id(ids[3]).caseExclusion is None
+
+
+def test_delete_cases_by_ids_in_chunks(mongo_store, monkeypatch):
+    monkeypatch.setattr("data_service.stores.mongo_store.BULK_WRITE_CHUNK_SIZE", 2)
+    ids = insert_minimal_cases(mongo_store, 5)
+    deleted = mongo_store.delete_cases_by_ids(ids[1:])
+    assert deleted == 4
+    assert mongo_store.count_cases(Anything()) == 1
+    assert mongo_store.case_by_id(ids[0]) is not None
+
+
+def test_missing_case_ids(mongo_store):
+    ids = insert_minimal_cases(mongo_store, 2)
+    absent = str(ObjectId())
+    missing = mongo_store.missing_case_ids([ids[0], absent, "not_an_id", ids[1]])
+    assert missing == [absent, "not_an_id"]
+
+
+def test_cases_by_ids_in_chunks(mongo_store, monkeypatch):
+    monkeypatch.setattr("data_service.stores.mongo_store.BULK_WRITE_CHUNK_SIZE", 2)
+    ids = insert_minimal_cases(mongo_store, 5)
+    cases = mongo_store.cases_by_ids(ids[1:] + [str(ObjectId()), "not_an_id"])
+    assert sorted(cases.keys()) == sorted(ids[1:])
+    assert cases[ids[2]].confirmationDate == date(2022, 5, 3)
@@ -0,0 +1,50 @@
+from data_service.util.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_returns_stored_value():
+    cache = TTLCache()
+    cache.put("key", 42)
+    assert cache.get("key") == 42
+
+
+def test_cache_returns_none_for_unknown_key():
+    cache = TTLCache()
+    assert cache.get("key") is None
+
+
+def test_cache_entries_go_stale_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl=30, clock=clock)
+    cache.put("key", 42)
+    clock.now = 31
+    assert cache.get("key") is None
+    assert cache.get("key", max_age=float("inf")) == 42
+
+
+def test_cache_evicts_least_recently_used_entry():
+    cache = TTLCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_cache_drops_values_from_before_clear():
+    cache = TTLCache()
+    generation = cache.generation
+    cache.clear()
+    cache.put("key", 42, generation)
+    assert cache.get("key") is None
+    cache.put("key", 42, cache.generation)
+    assert cache.get("key") == 42
@@ -1,39 +1,102 @@
 #!/usr/bin/env python3
 
+import collections
 import datetime
+import gzip
+import hashlib
+import itertools
 import json
 import logging
 import os
 import sys
+import tempfile
+import time
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Callable, Optional
 
 import boto3
 import pandas as pd
 import pymongo
 import iso3166
+from bson import ObjectId
+from botocore.exceptions import ClientError
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
 
 
-def upload(S3, data: str, bucket: str, keys: list[str]):
-    """Upload data to S3
+def content_digest(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def stored_digest(S3, bucket: str, key: str) -> Optional[str]:
+    """The digest of the data uploaded to key, or None if there is nothing there"""
+    try:
+        return S3.head_object(Bucket=bucket, Key=key)["Metadata"].get("sha256")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise
+
+
+def upload(S3, data: str, bucket: str, keys: list[str], skip_unchanged: bool = False):
+    """Upload data to S3, compressed with gzip
 
     data -- Data to upload as a string
     bucket -- S3 bucket to upload to
     keys -- List of S3 paths to upload to
+    skip_unchanged -- Don't upload to keys that already have the same data
     """
+    body = gzip.compress(data.encode("utf-8"), mtime=0)
+    digest = content_digest(data)
     for key in keys:
-        logging.info(f"Uploading data to {key} in {bucket}")
         try:
+            if skip_unchanged and stored_digest(S3, bucket, key) == digest:
+                logging.info(f"Data at {key} in {bucket} is unchanged, not uploading it")
+                continue
+            logging.info(f"Uploading data to {key} in {bucket}")
             S3.put_object(
                 ACL="public-read",
-                Body=data,
+                Body=body,
                 Bucket=bucket,
                 Key=key,
+                ContentType="application/json",
+                ContentEncoding="gzip",
+                Metadata={"sha256": digest},
             )
         except Exception as e:
             logging.exception(f"Failed to upload data to s3://{bucket}/{key}")
 
 
+def fetch_map_data(S3, bucket: str, key: str, cache_dir: Optional[str] = None):
+    """Fetch and parse the map data at key in bucket
+
+    If cache_dir is set, the map data is kept there along with its ETag, and is downloaded
+    again only if S3 has a different version.
+    """
+    request = {"Bucket": bucket, "Key": key}
+    cached = os.path.join(cache_dir, key) if cache_dir else None
+    if cached and os.path.exists(cached) and os.path.exists(f"{cached}.etag"):
+        with open(f"{cached}.etag") as f:
+            request["IfNoneMatch"] = f.read()
+    try:
+        obj = S3.get_object(**request)
+    except ClientError as e:
+        if "IfNoneMatch" in request and e.response["Error"]["Code"] in ("304", "NotModified"):
+            logging.info(f"Map data {key} is unchanged, using the cached copy")
+            with open(cached) as f:
+                return json.load(f)
+        raise
+    body = obj["Body"].read()
+    if cached:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(f"{cached}.tmp", "wb") as f:
+            f.write(body)
+        os.replace(f"{cached}.tmp", cached)
+        with open(f"{cached}.etag", "w") as f:
+            f.write(obj["ETag"])
+    return json.loads(body)
+
+
 def setup_logger():
     h = logging.StreamHandler(sys.stdout)
     rootLogger = logging.getLogger()
@@ -53,12 +116,6 @@ def map_adm0(adm0_entry, adm0_map_data):
     return {**adm0_map_data[id], "caseCount": caseCount, "lastUpdated": lastUpdated, "countryCode": countryCode}
 
 
-def aggregate_adm0(cases, adm0_map_data):
-    adm0_counts = list(cases.aggregate(
-        [{"$match": {"caseStatus": "confirmed"}}, {"$group": {"_id": "$location.countryISO3", "caseCount": {"$sum": 1}, "lastUpdated": {"$max": "$revisionMetadata.updateMetadata.date"}, "countryCode": {"$first": "$location.countryISO3"}}}]))
-    return list(map(lambda e: map_adm0(e, adm0_map_data), adm0_counts))
-
-
 def map_adm1(adm1_entry, adm1_map_data):
     id = adm1_entry.get('_id', '')
     caseCount = adm1_entry.get('caseCount', 0)
@@ -71,12 +128,6 @@ def map_adm1(adm1_entry, adm1_map_data):
     return {**adm1_map_data[id], "caseCount": caseCount, "lastUpdated": lastUpdated, "countryCode": countryCode}
 
 
-def aggregate_adm1(cases, adm1_map_data):
-    adm1_counts = list(cases.aggregate(
-        [{"$match": {"caseStatus": "confirmed"}}, {"$group": {"_id": "$location.admin1WikiId", "caseCount": {"$sum": 1}, "lastUpdated": {"$max": "$revisionMetadata.updateMetadata.date"}, "countryCode": {"$first": "$location.countryISO3"}}}]))
-    return list(map(lambda e: map_adm1(e, adm1_map_data), adm1_counts))
-
-
 def map_adm2(adm2_entry, adm2_map_data):
     id = adm2_entry.get('_id', '')
     caseCount = adm2_entry.get('caseCount', 0)
@@ -89,12 +140,6 @@ def map_adm2(adm2_entry, adm2_map_data):
     return {**adm2_map_data[id], "caseCount": caseCount, "lastUpdated": lastUpdated, "countryCode": countryCode}
 
 
-def aggregate_adm2(cases, adm2_map_data):
-    adm2_counts = list(cases.aggregate(
-        [{"$match": {"caseStatus": "confirmed"}}, {"$group": {"_id": "$location.admin2WikiId", "caseCount": {"$sum": 1}, "lastUpdated": {"$max": "$revisionMetadata.updateMetadata.date"}, "countryCode": {"$first": "$location.countryISO3"}}}]))
-    return list(map(lambda e: map_adm2(e, adm2_map_data), adm2_counts))
-
-
 def map_adm3(adm3_entry, adm3_map_data):
     id = adm3_entry.get('_id', '')
     caseCount = adm3_entry.get('caseCount', 0)
@@ -107,10 +152,345 @@ def map_adm3(adm3_entry, adm3_map_data):
     return {**adm3_map_data[id], "caseCount": caseCount, "lastUpdated": lastUpdated, "countryCode": countryCode}
 
 
-def aggregate_adm3(cases, adm3_map_data):
-    adm3_counts = list(cases.aggregate(
-        [{"$match": {"caseStatus": "confirmed"}}, {"$group": {"_id": "$location.admin3WikiId", "caseCount": {"$sum": 1}, "lastUpdated": {"$max": "$revisionMetadata.updateMetadata.date"}, "countryCode": {"$first": "$location.countryISO3"}}}]))
-    return list(map(lambda e: map_adm3(e, adm3_map_data), adm3_counts))
+# The location field that identifies the area at each admin level
+ADMIN_LEVELS = {
+    "admin0": "countryISO3",
+    "admin1": "admin1WikiId",
+    "admin2": "admin2WikiId",
+    "admin3": "admin3WikiId",
+}
+
+# The admin levels with time series of daily case counts
+TIME_SERIES_LEVELS = ["admin0", "admin1"]
+
+# When a case was last changed: cases that have never been updated have no updateMetadata
+UPDATE_DATE = {"$ifNull": ["$revisionMetadata.updateMetadata.date", "$revisionMetadata.creationMetadata.date"]}
+
+# The day a case is counted on in the time series
+CASE_DATE = {"$ifNull": ["$events.dateConfirmation", "$events.dateEntry"]}
+
+AGGREGATE_MODES = {"full", "incremental", "verify"}
+
+# Cases are read, and their contributions written, this many at a time
+CHUNK_SIZE = 1000
+
+# Incremental aggregation reads again the cases updated this long before the watermark, and the
+# case revisions saved this long before the last run started
+WATERMARK_OVERLAP = datetime.timedelta(minutes=10)
+
+# Change this when what is materialized changes, so that the materialized counts are rebuilt
+MATERIALIZED_VERSION = 4
+
+
+def group_by_areas_and_day():
+    """Group confirmed cases by the areas they're in at every admin level, and the day they're
+    counted on, at once."""
+    key = {level: f"$location.{area_field}" for level, area_field in ADMIN_LEVELS.items()}
+    key["date"] = {"$dateToString": {"format": "%Y-%m-%d", "date": CASE_DATE}}
+    return [{"$group": {
+        "_id": key,
+        "caseCount": {"$sum": 1},
+        "lastUpdated": {"$max": UPDATE_DATE},
+        "countryCode": {"$first": "$location.countryISO3"},
+    }}]
+
+
+def roll_up(groups):
+    """Add up the counts of groups of cases, keyed by the area they're in at each admin level and
+    the day they're counted on, into the counts for each area at each level, ordered by area, and
+    the counts on each day for each area at the TIME_SERIES_LEVELS."""
+    by_area = {level: {} for level in ADMIN_LEVELS}
+    by_day = {level: collections.Counter() for level in TIME_SERIES_LEVELS}
+    for group in groups:
+        for level in ADMIN_LEVELS:
+            area = group["_id"].get(level)
+            count = by_area[level].setdefault(area, {"_id": area, "caseCount": 0, "countryCode": group.get("countryCode")})
+            count["caseCount"] += group["caseCount"]
+            if group.get("lastUpdated") is not None:
+                count["lastUpdated"] = max(group["lastUpdated"], count.get("lastUpdated", group["lastUpdated"]))
+        if (date := group["_id"].get("date")) is not None:
+            for level in TIME_SERIES_LEVELS:
+                by_day[level][(group["_id"].get(level), date)] += group["caseCount"]
+    admin_counts = {level: [counts[area] for area in sorted(counts, key=lambda a: (a is not None, str(a)))]
+                    for level, counts in by_area.items()}
+    daily_counts = {level: [{"area": area, "date": date, "caseCount": count} for (area, date), count in counts.items()]
+                    for level, counts in by_day.items()}
+    return admin_counts, daily_counts
+
+
+def aggregate_admins(cases):
+    """Count confirmed cases in the areas at every admin level, and on each day in the areas at
+    the TIME_SERIES_LEVELS.
+
+    The cases are grouped by all of their areas and their day in one pipeline, whose groups are
+    read from a cursor and added up for each level here, so the collection is only scanned once;
+    and unlike a $facet, whose result is a single document of at most 16MB, it works however many
+    areas there are.
+
+    Returns the counts for each level in ADMIN_LEVELS, the daily counts for each level in
+    TIME_SERIES_LEVELS, and the number of confirmed cases counted.
+    """
+    groups = cases.aggregate([{"$match": {"caseStatus": "confirmed"}}, *group_by_areas_and_day()], allowDiskUse=True)
+    admin_counts, daily_counts = roll_up(groups)
+    # every confirmed case is in one admin0 group, if only the group of cases without a country
+    confirmed = sum(count["caseCount"] for count in admin_counts["admin0"])
+    return admin_counts, daily_counts, confirmed
+
+
+def time_series(daily_counts, weekly=False):
+    """Arrange daily counts of cases in areas as columns: the dates, and the counts in each area.
+    The dates run from the first day with a case to the last, without gaps. Each area's counts
+    run, without gaps, from its own first day with a case to its last, starting at offset in the
+    dates; so an area only has as many counts as the days it has had cases over, rather than one
+    for every date.
+    If weekly, the counts are added up by week, and the dates are the Mondays the weeks start on.
+    Cases that aren't in an area at this level are left out.
+    """
+    by_area = collections.defaultdict(collections.Counter)
+    for count in daily_counts:
+        if count.get("area") is None:
+            continue
+        day = datetime.date.fromisoformat(count["date"])
+        if weekly:
+            day -= datetime.timedelta(days=day.weekday())
+        by_area[count["area"]][day] += count["caseCount"]
+    days = [day for counts in by_area.values() for day in counts]
+    if not days:
+        return {"dates": [], "areas": {}}
+    step = datetime.timedelta(days=7 if weekly else 1)
+    first = min(days)
+    dates = [first + step * i for i in range((max(days) - first) // step + 1)]
+
+    def series(counts):
+        start, end = min(counts), max(counts)
+        return {
+            "offset": (start - first) // step,
+            "counts": [counts[start + step * i] for i in range((end - start) // step + 1)],
+        }
+
+    return {
+        "dates": [day.isoformat() for day in dates],
+        "areas": {area: series(counts) for area, counts in sorted(by_area.items())},
+    }
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def update_date(case):
+    revision = case.get("revisionMetadata", {})
+    return revision.get("updateMetadata", {}).get("date") or revision.get("creationMetadata", {}).get("date")
+
+
+def case_day(case):
+    events = case.get("events", {})
+    date = events.get("dateConfirmation") or events.get("dateEntry")
+    return date.strftime("%Y-%m-%d") if date else None
+
+
+def case_contribution(case):
+    """What a case adds to the counts: the areas it is in and the day it is counted on, if it
+    is confirmed, otherwise None."""
+    if case.get("caseStatus") != "confirmed":
+        return None
+    location = case.get("location", {})
+    return {
+        "_id": case["_id"],
+        "areas": {level: location.get(area_field) for level, area_field in ADMIN_LEVELS.items()},
+        "countryCode": location.get("countryISO3"),
+        "lastUpdated": update_date(case),
+        "date": case_day(case),
+    }
+
+
+def ensure_materialized_indexes(db):
+    db.aggregateCounts.create_index([("level", 1), ("area", 1)], unique=True)
+    db.aggregateDailyCounts.create_index([("level", 1), ("area", 1), ("date", 1)], unique=True)
+    for level in ADMIN_LEVELS:
+        db.aggregateCases.create_index([(f"areas.{level}", 1), ("lastUpdated", -1)])
+
+
+def apply_contributions(db, changes):
+    """Update the materialized counts for changes, a list of (previous, current) contributions of
+    cases where either may be None.
+
+    The contribution each case made to the counts is kept in aggregateCases, so that a case that
+    moves, stops being confirmed or is deleted can be taken away from the areas it was counted in.
+    """
+    increments = collections.Counter()
+    daily_increments = collections.Counter()
+    latest = {}
+    country_codes = {}
+    # areas that lost a case, whose lastUpdated may now be later than their latest case
+    reduced = set()
+    contribution_writes = []
+    for previous, current in changes:
+        if previous == current:
+            continue
+        if previous is not None:
+            for level, area in previous["areas"].items():
+                increments[(level, area)] -= 1
+                if current is None or current["areas"][level] != area or current["lastUpdated"] != previous["lastUpdated"]:
+                    reduced.add((level, area))
+            if previous["date"] is not None:
+                for level in TIME_SERIES_LEVELS:
+                    daily_increments[(level, previous["areas"][level], previous["date"])] -= 1
+            if current is None:
+                contribution_writes.append(DeleteOne({"_id": previous["_id"]}))
+        if current is not None:
+            for level, area in current["areas"].items():
+                increments[(level, area)] += 1
+                country_codes[(level, area)] = current["countryCode"]
+                if current["lastUpdated"] is not None:
+                    latest[(level, area)] = max(current["lastUpdated"], latest.get((level, area), current["lastUpdated"]))
+            if current["date"] is not None:
+                for level in TIME_SERIES_LEVELS:
+                    daily_increments[(level, current["areas"][level], current["date"])] += 1
+            contribution_writes.append(ReplaceOne({"_id": current["_id"]}, current, upsert=True))
+    if not contribution_writes:
+        return
+    db.aggregateCases.bulk_write(contribution_writes, ordered=False)
+
+    count_writes = []
+    for (level, area), increment in increments.items():
+        update = {"$inc": {"caseCount": increment}}
+        if (level, area) in country_codes:
+            update["$set"] = {"countryCode": country_codes[(level, area)]}
+        if (level, area) in latest:
+            update["$max"] = {"lastUpdated": latest[(level, area)]}
+        count_writes.append(UpdateOne({"level": level, "area": area}, update, upsert=True))
+    db.aggregateCounts.bulk_write(count_writes, ordered=False)
+
+    daily_writes = [
+        UpdateOne({"level": level, "area": area, "date": date}, {"$inc": {"caseCount": increment}}, upsert=True)
+        for (level, area, date), increment in daily_increments.items() if increment != 0
+    ]
+    if daily_writes:
+        db.aggregateDailyCounts.bulk_write(daily_writes, ordered=False)
+        db.aggregateDailyCounts.delete_many({"caseCount": {"$lte": 0}})
+
+    for level, area in reduced:
+        newest = db.aggregateCases.find_one({f"areas.{level}": area}, sort=[("lastUpdated", -1)])
+        if newest is None:
+            db.aggregateCounts.delete_one({"level": level, "area": area})
+        else:
+            db.aggregateCounts.update_one({"level": level, "area": area}, {"$set": {"lastUpdated": newest["lastUpdated"]}})
+
+
+def deleted_contributions(db, since):
+    """Contributions of cases that have been deleted since they were counted.
+
+    Before a case is deleted (by the data service, or by prune-uploads), a copy of it is saved in
+    caserevisions, so only the cases with a revision saved since the last run can have been
+    deleted, and only they are looked for. Cases deleted any other way are found by verification.
+    """
+    if since is None:
+        return []
+    revisions = db.caserevisions.find({"_id": {"$gte": ObjectId.from_datetime(since)}}, {"case._id": 1})
+    deleted = {}
+    for chunk in chunked(revisions, CHUNK_SIZE):
+        ids = list({revision["case"]["_id"] for revision in chunk})
+        existing = {c["_id"] for c in db.day0cases.find({"_id": {"$in": ids}}, {"_id": 1})}
+        missing = [i for i in ids if i not in existing]
+        deleted.update((c["_id"], c) for c in db.aggregateCases.find({"_id": {"$in": missing}}))
+    return list(deleted.values())
+
+
+def materialized_counts(db):
+    """The materialized counts, in the same form as aggregate_admins returns."""
+    admin_counts = {level: [] for level in ADMIN_LEVELS}
+    for count in db.aggregateCounts.find({}, {"_id": 0}).sort([("level", 1), ("area", 1)]):
+        level = count.pop("level")
+        admin_counts[level].append({"_id": count.pop("area"), **count})
+    daily_counts = {level: [] for level in TIME_SERIES_LEVELS}
+    for count in db.aggregateDailyCounts.find({}, {"_id": 0}):
+        daily_counts[count.pop("level")].append(count)
+    return admin_counts, daily_counts, sum(count["caseCount"] for count in admin_counts["admin0"])
+
+
+def reset_materialized_counts(db):
+    for collection in ["aggregateCases", "aggregateCounts", "aggregateDailyCounts", "aggregateState"]:
+        db.drop_collection(collection)
+
+
+def aggregate_admins_incrementally(db):
+    """Bring the materialized counts up to date with the cases changed since the last run, and return them.
+
+    The watermark is the latest update date of the cases seen so far, or creation date for cases
+    that have never been updated. Cases changed shortly before it are read again, in case they were
+    saved after the last run read the cases; that's harmless as a case that hasn't changed is skipped.
+    Case revisions saved shortly before the last run started are likewise looked at again.
+    """
+    started = datetime.datetime.now(datetime.timezone.utc)
+    state = db.aggregateState.find_one({"_id": "watermark"})
+    if state is not None and state.get("version") != MATERIALIZED_VERSION:
+        logging.info("Materialized counts were made by an older version of this job, rebuilding them")
+        reset_materialized_counts(db)
+        state = None
+    ensure_materialized_indexes(db)
+    watermark = state["date"] if state else None
+    revisions_since = state["revisionsCheckedAt"] - WATERMARK_OVERLAP if state else None
+    query = {}
+    if watermark is not None:
+        # a case is never created after it's updated, so each date can be looked up in its own index
+        since = {"$gte": watermark - WATERMARK_OVERLAP}
+        query = {"$or": [{"revisionMetadata.updateMetadata.date": since}, {"revisionMetadata.creationMetadata.date": since}]}
+    projection = {"caseStatus": 1, "location": 1, "events.dateConfirmation": 1, "events.dateEntry": 1,
+                  "revisionMetadata.updateMetadata.date": 1, "revisionMetadata.creationMetadata.date": 1}
+    changed = 0
+    for chunk in chunked(db.day0cases.find(query, projection), CHUNK_SIZE):
+        ids = [case["_id"] for case in chunk]
+        previous = {c["_id"]: c for c in db.aggregateCases.find({"_id": {"$in": ids}})}
+        contributions = [(previous.get(case["_id"]), case_contribution(case)) for case in chunk]
+        apply_contributions(db, contributions)
+        watermark = max(filter(None, [watermark, *map(update_date, chunk)]), default=None)
+        changed += len(chunk)
+    deleted = deleted_contributions(db, revisions_since)
+    apply_contributions(db, [(contribution, None) for contribution in deleted])
+    if watermark is not None:
+        db.aggregateState.replace_one(
+            {"_id": "watermark"},
+            {"_id": "watermark", "date": watermark, "revisionsCheckedAt": started, "version": MATERIALIZED_VERSION},
+            upsert=True)
+    logging.info(f"Applied {changed} changed and {len(deleted)} deleted cases to the materialized counts")
+    return materialized_counts(db)
+
+
+def count_differences(expected, actual):
+    """The areas whose caseCount or lastUpdated differ between two sets of admin counts."""
+    def by_area(admin_counts):
+        return {(level, count["_id"]): (count["caseCount"], count.get("lastUpdated"))
+                for level, counts in admin_counts.items() for count in counts}
+    expected, actual = by_area(expected), by_area(actual)
+    return sorted((area for area in expected.keys() | actual.keys() if expected.get(area) != actual.get(area)), key=str)
+
+
+def daily_count_differences(expected, actual):
+    """The areas and days whose counts differ between two sets of daily counts."""
+    def by_day(daily_counts):
+        return {(level, count["area"], count["date"]): count["caseCount"]
+                for level, counts in daily_counts.items() for count in counts}
+    expected, actual = by_day(expected), by_day(actual)
+    return sorted((day for day in expected.keys() | actual.keys() if expected.get(day) != actual.get(day)), key=str)
+
+
+def verify_materialized_counts(db):
+    """Recompute the counts from every case, and rebuild the materialized counts if they differ."""
+    admin_counts, daily_counts, confirmed = aggregate_admins(db.day0cases)
+    (materialized_admin_counts, materialized_daily_counts, _) = materialized_counts(db)
+    differences = count_differences(admin_counts, materialized_admin_counts)
+    differences += daily_count_differences(daily_counts, materialized_daily_counts)
+    if differences:
+        logging.warning(f"Materialized counts differ for {len(differences)} areas or days, "
+                        f"for example {differences[:10]}; rebuilding them")
+        reset_materialized_counts(db)
+        aggregate_admins_incrementally(db)
+    else:
+        logging.info("Materialized counts match the full aggregation")
+    return admin_counts, daily_counts, confirmed
 
 
 def main():
@@ -123,19 +503,23 @@ def main():
     if envs := {"CONN", "S3_AGGREGATE_BUCKET", "S3_MAP_DATA_BUCKET", "DATABASE_NAME"} - set(os.environ):
         logging.info(f"Required {envs} not set in the environment, exiting")
         sys.exit(1)
+    # full: count every case; incremental: update the materialized counts with the cases
+    # changed since the last run; verify: check the materialized counts against a full count
+    if (mode := os.environ.get("AGGREGATE_MODE", "full")) not in AGGREGATE_MODES:
+        logging.info(f"AGGREGATE_MODE must be one of {AGGREGATE_MODES}, not {mode}, exiting")
+        sys.exit(1)
 
     bucket = os.environ.get("S3_AGGREGATE_BUCKET")
     map_data_bucket = os.environ.get("S3_MAP_DATA_BUCKET")
     logging.info("Starting fetching map data from S3")
+    # map data is downloaded, and the results uploaded, this many at a time
+    executor = ThreadPoolExecutor(max_workers=int(os.environ.get("S3_TRANSFER_WORKERS", 8)))
+    cache_dir = os.environ.get("MAP_DATA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "aggregate-map-data"))
     try:
-        adm0_obj = S3.get_object(Bucket=map_data_bucket, Key='adm0_map_data.json')
-        adm0_map_data = json.loads(adm0_obj['Body'].read())
-        adm1_obj = S3.get_object(Bucket=map_data_bucket, Key='adm1_map_data.json')
-        adm1_map_data = json.loads(adm1_obj['Body'].read())
-        adm2_obj = S3.get_object(Bucket=map_data_bucket, Key='adm2_map_data.json')
-        adm2_map_data = json.loads(adm2_obj['Body'].read())
-        adm3_obj = S3.get_object(Bucket=map_data_bucket, Key='adm3_map_data.json')
-        adm3_map_data = json.loads(adm3_obj['Body'].read())
+        (adm0_map_data, adm1_map_data, adm2_map_data, adm3_map_data) = executor.map(
+            lambda key: fetch_map_data(S3, map_data_bucket, key, cache_dir),
+            ['adm0_map_data.json', 'adm1_map_data.json', 'adm2_map_data.json', 'adm3_map_data.json'],
+        )
     except Exception as e:
         logging.error(f"Failed to fetch map data from S3: {e}")
         sys.exit(1)
@@ -148,21 +532,30 @@ def main():
     cases = db.day0cases
     logging.info("Finished getting day0cases from MongoDB")
 
-    logging.info("Starting aggregation")
+    logging.info(f"Starting {mode} aggregation")
+    started = time.monotonic()
+    if mode == "incremental":
+        admin_counts, daily_counts, confirmed = aggregate_admins_incrementally(db)
+    elif mode == "verify":
+        admin_counts, daily_counts, confirmed = verify_materialized_counts(db)
+    else:
+        admin_counts, daily_counts, confirmed = aggregate_admins(cases)
 
-    adm0_counts = aggregate_adm0(cases, adm0_map_data)
+    adm0_counts = [map_adm0(e, adm0_map_data) for e in admin_counts["admin0"]]
     logging.info(f"Finished admin 0 aggregation with {len(adm0_counts)} entries")
 
-    adm1_counts = aggregate_adm1(cases, adm1_map_data)
+    adm1_counts = [map_adm1(e, adm1_map_data) for e in admin_counts["admin1"]]
     logging.info(f"Finished admin 1 aggregation with {len(adm1_counts)} entries")
 
-    adm2_counts = aggregate_adm2(cases, adm2_map_data)
+    adm2_counts = [map_adm2(e, adm2_map_data) for e in admin_counts["admin2"]]
     logging.info(f"Finished admin 2 aggregation with {len(adm2_counts)} entries")
 
-    adm3_counts = aggregate_adm3(cases, adm3_map_data)
+    adm3_counts = [map_adm3(e, adm3_map_data) for e in admin_counts["admin3"]]
     logging.info(f"Finished admin 3 aggregation with {len(adm3_counts)} entries")
 
-    logging.info("Finished aggregation")
+    elapsed = time.monotonic() - started
+    logging.info(f"Finished aggregation of {confirmed} confirmed cases "
+                 f"(of {cases.estimated_document_count()} in day0cases) in {elapsed:.1f}s")
 
     counts_to_upload = [
         {"data": adm0_counts, "key": "admin0"},
@@ -171,13 +564,22 @@ def main():
         {"data": adm3_counts, "key": "admin3"},
     ]
 
+    # time series of the counts in each area, as
+    # {"dates": [...], "areas": {id: {"offset": index of the area's first date, "counts": [...]}}}
+    for level in TIME_SERIES_LEVELS:
+        counts_to_upload.append({"data": time_series(daily_counts[level]), "key": f"{level}/daily", "dated": False})
+        if os.environ.get("WEEKLY_TIME_SERIES"):
+            counts_to_upload.append({"data": time_series(daily_counts[level], weekly=True), "key": f"{level}/weekly", "dated": False})
+
+    uploads = []
     for count_to_upload in counts_to_upload:
-        upload(
-            S3,
-            json.dumps(count_to_upload["data"]),
-            bucket,
-            [f"{count_to_upload['key']}/latest.json", f"{count_to_upload['key']}/{today.strftime('%m-%d-%Y')}.json"],
-        )
+        data = json.dumps(count_to_upload["data"], separators=(",", ":"))
+        uploads.append(executor.submit(upload, S3, data, bucket, [f"{count_to_upload['key']}/latest.json"], True))
+        if count_to_upload.get("dated", True):
+            uploads.append(executor.submit(upload, S3, data, bucket, [f"{count_to_upload['key']}/{today.strftime('%m-%d-%Y')}.json"]))
+    for future in uploads:
+        future.result()
+    executor.shutdown()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+import gzip
 import json
 import app
 import moto
@@ -30,6 +31,9 @@ CASES = [
             "admin3WikiId": "Q622858",
             "query": "Brück,LK Potsdam-Mittelmark,Brandenburg,Germany"
         },
+        "events": {
+            "dateEntry": datetime.datetime(2024, 1, 10)
+        },
         "revisionMetadata": {
             "updateMetadata": {
                 "date": datetime.datetime(2024, 1, 21)
@@ -51,6 +55,9 @@ CASES = [
             "admin3WikiId": "Q623947",
             "query": "Borkwalde,LK Potsdam-Mittelmark,Brandenburg,Germany"
         },
+        "events": {
+            "dateEntry": datetime.datetime(2024, 1, 10)
+        },
         "revisionMetadata": {
             "updateMetadata": {
                 "date": datetime.datetime(2024, 1, 22)
@@ -73,6 +80,9 @@ CASES = [
             "admin3WikiId": "Q1711",
             "query": "Potsdam,SK Potsdam,Brandenburg,Germany"
         },
+        "events": {
+            "dateEntry": datetime.datetime(2024, 1, 12)
+        },
         "revisionMetadata": {
             "updateMetadata": {
                 "date": datetime.datetime(2024, 1, 23)
@@ -94,6 +104,9 @@ CASES = [
             "admin3WikiId": "Q507455",
             "query": "Eberstadt,LK Heilbronn,Baden-Württemberg,Germany"
         },
+        "events": {
+            "dateEntry": datetime.datetime(2024, 1, 20)
+        },
         "revisionMetadata": {
             "updateMetadata": {
                 "date": datetime.datetime(2024, 1, 24)
@@ -373,29 +386,222 @@ def test_count_dataframe(s3):
 
     # We check if the newly created objects are in the bucket
     s3_adm0_latest_obj = s3.get_object(Bucket=S3_AGGREGATE_BUCKET, Key='admin0/latest.json')
-    s3_adm0_latest_json = json.loads(s3_adm0_latest_obj['Body'].read())
+    s3_adm0_latest_json = json.loads(gzip.decompress(s3_adm0_latest_obj['Body'].read()))
     assert s3_adm0_latest_json == expected_adm0_json
     s3_adm0_dated_obj = s3.get_object(Bucket=S3_AGGREGATE_BUCKET, Key='admin0/02-01-2024.json')
-    s3_adm0_dated_json = json.loads(s3_adm0_dated_obj['Body'].read())
+    s3_adm0_dated_json = json.loads(gzip.decompress(s3_adm0_dated_obj['Body'].read()))
     assert s3_adm0_dated_json == expected_adm0_json
 
     s3_adm1_latest_obj = s3.get_object(Bucket=S3_AGGREGATE_BUCKET, Key='admin1/latest.json')
-    s3_adm1_latest_json = json.loads(s3_adm1_latest_obj['Body'].read())
+    s3_adm1_latest_json = json.loads(gzip.decompress(s3_adm1_latest_obj['Body'].read()))
     assert s3_adm1_latest_json == expected_adm1_json
     s3_adm1_dated_obj = s3.get_object(Bucket=S3_AGGREGATE_BUCKET, Key='admin1/02-01-2024.json')
-    s3_adm1_dated_json = json.loads(s3_adm1_dated_obj['Body'].read())
+    s3_adm1_dated_json = json.loads(gzip.decompress(s3_adm1_dated_obj['Body'].read()))
     assert s3_adm1_dated_json == expected_adm1_json
 
     s3_adm2_latest_obj = s3.get_object(Bucket=S3_AGGREGATE_BUCKET, Key='admin2/latest.json')
-    s3_adm2_latest_json = json.loads(s3_adm2_latest_obj['Body'].read())
+    s3_adm2_latest_json = json.loads(gzip.decompress(s3_adm2_latest_obj['Body'].read()))
     assert s3_adm2_latest_json == expected_adm2_json
     s3_adm2_dated_obj = s3.get_object(Bucket=S3_AGGREGATE_BUCKET, Key='admin2/02-01-2024.json')
-    s3_adm2_dated_json = json.loads(s3_adm2_dated_obj['Body'].read())
+    s3_adm2_dated_json = json.loads(gzip.decompress(s3_adm2_dated_obj['Body'].read()))
     assert s3_adm2_dated_json == expected_adm2_json
 
     s3_adm3_latest_obj = s3.get_object(Bucket=S3_AGGREGATE_BUCKET, Key='admin3/latest.json')
-    s3_adm3_latest_json = json.loads(s3_adm3_latest_obj['Body'].read())
+    s3_adm3_latest_json = json.loads(gzip.decompress(s3_adm3_latest_obj['Body'].read()))
     assert s3_adm3_latest_json == expected_adm3_json
     s3_adm3_dated_obj = s3.get_object(Bucket=S3_AGGREGATE_BUCKET, Key='admin3/02-01-2024.json')
-    s3_adm3_dated_json = json.loads(s3_adm3_dated_obj['Body'].read())
+    s3_adm3_dated_json = json.loads(gzip.decompress(s3_adm3_dated_obj['Body'].read()))
     assert s3_adm3_dated_json == expected_adm3_json
+    assert s3_adm3_dated_obj['ContentEncoding'] == 'gzip'
+
+    s3_adm1_daily_obj = s3.get_object(Bucket=S3_AGGREGATE_BUCKET, Key='admin1/daily/latest.json')
+    s3_adm1_daily_json = json.loads(gzip.decompress(s3_adm1_daily_obj['Body'].read()))
+    assert s3_adm1_daily_json == {
+        "dates": [f"2024-01-{day}" for day in range(10, 21)],
+        "areas": {
+            "Q1208": {"offset": 0, "counts": [2, 0, 1]},
+            "Q985": {"offset": 10, "counts": [1]},
+        },
+    }
+
+
+def without_id(case):
+    return {k: v for k, v in case.items() if k != "_id"}
+
+
+def test_aggregate_admins_reads_the_cases_once():
+    cases = mongomock.MongoClient().db.day0cases
+    cases.insert_many([without_id(case) for case in CASES])
+    cases.insert_one({**without_id(CASES[0]), "caseStatus": "suspected"})
+    pipelines = []
+    aggregate = cases.aggregate
+
+    def recording_aggregate(pipeline, **kwargs):
+        pipelines.append(pipeline)
+        return aggregate(pipeline, **kwargs)
+
+    cases.aggregate = recording_aggregate
+    admin_counts, daily_counts, confirmed = app.aggregate_admins(cases)
+    assert len(pipelines) == 1
+    assert not any("$facet" in stage for stage in pipelines[0])
+    assert confirmed == 4
+    assert [(e["_id"], e["caseCount"]) for e in admin_counts["admin0"]] == [("DEU", 4)]
+    assert sorted((e["_id"], e["caseCount"]) for e in admin_counts["admin1"]) == [("Q1208", 3), ("Q985", 1)]
+    assert len(admin_counts["admin2"]) == 3
+    assert len(admin_counts["admin3"]) == 4
+    assert sorted((e["area"], e["date"], e["caseCount"]) for e in daily_counts["admin1"]) == [
+        ("Q1208", "2024-01-10", 2), ("Q1208", "2024-01-12", 1), ("Q985", "2024-01-20", 1)
+    ]
+
+
+def test_aggregate_admins_with_no_confirmed_cases():
+    cases = mongomock.MongoClient().db.day0cases
+    cases.insert_one({**without_id(CASES[0]), "caseStatus": "suspected"})
+    admin_counts, daily_counts, confirmed = app.aggregate_admins(cases)
+    assert confirmed == 0
+    assert admin_counts == {"admin0": [], "admin1": [], "admin2": [], "admin3": []}
+    assert daily_counts == {"admin0": [], "admin1": []}
+
+
+def updated_case(case, date, **changes):
+    return {**without_id(case), **changes, "revisionMetadata": {"updateMetadata": {"date": date}}}
+
+
+def test_incremental_aggregation_matches_full_aggregation():
+    db = mongomock.MongoClient().db
+    db.day0cases.insert_many([without_id(case) for case in CASES])
+    admin_counts, daily_counts, confirmed = app.aggregate_admins_incrementally(db)
+    assert confirmed == 4
+    (full_admin_counts, full_daily_counts, _) = app.aggregate_admins(db.day0cases)
+    assert app.count_differences(full_admin_counts, admin_counts) == []
+    assert app.daily_count_differences(full_daily_counts, daily_counts) == []
+
+    (bruck, borkwalde, potsdam, eberstadt) = list(db.day0cases.find({}, {"_id": 1}))
+    db.day0cases.insert_one(updated_case(CASES[3], datetime.datetime(2024, 1, 25)))
+    db.day0cases.replace_one(bruck, updated_case(CASES[3], datetime.datetime(2024, 1, 26)))
+    db.day0cases.replace_one(borkwalde, updated_case(CASES[1], datetime.datetime(2024, 1, 26), caseStatus="omit_error"))
+    db.caserevisions.insert_one({"case": db.day0cases.find_one(potsdam)})
+    db.day0cases.delete_one(potsdam)
+    admin_counts, daily_counts, confirmed = app.aggregate_admins_incrementally(db)
+    assert confirmed == 3
+    (full_admin_counts, full_daily_counts, _) = app.aggregate_admins(db.day0cases)
+    assert app.count_differences(full_admin_counts, admin_counts) == []
+    assert app.daily_count_differences(full_daily_counts, daily_counts) == []
+    assert [(c["_id"], c["caseCount"], c["lastUpdated"]) for c in admin_counts["admin1"]] == [
+        ("Q985", 3, datetime.datetime(2024, 1, 26))
+    ]
+
+
+def test_incremental_aggregation_reads_only_changed_cases():
+    db = mongomock.MongoClient().db
+    db.day0cases.insert_many([without_id(case) for case in CASES])
+    app.aggregate_admins_incrementally(db)
+    assert db.aggregateState.find_one({"_id": "watermark"})["date"] == datetime.datetime(2024, 1, 24)
+
+    # a case updated long before the watermark isn't read again
+    db.day0cases.insert_one(updated_case(CASES[0], datetime.datetime(2024, 1, 1)))
+    db.day0cases.insert_one(updated_case(CASES[0], datetime.datetime(2024, 1, 27)))
+    admin_counts, daily_counts, confirmed = app.aggregate_admins_incrementally(db)
+    assert confirmed == 5
+    assert db.aggregateState.find_one({"_id": "watermark"})["date"] == datetime.datetime(2024, 1, 27)
+
+    # but verification finds it, and rebuilds the materialized counts
+    admin_counts, daily_counts, confirmed = app.verify_materialized_counts(db)
+    assert confirmed == 6
+    assert app.count_differences(admin_counts, app.materialized_counts(db)[0]) == []
+
+
+def test_incremental_aggregation_looks_only_for_revised_cases_being_deleted():
+    db = mongomock.MongoClient().db
+    db.day0cases.insert_many([without_id(case) for case in CASES])
+    app.aggregate_admins_incrementally(db)
+
+    (bruck, borkwalde, potsdam, eberstadt) = list(db.day0cases.find({}, {"_id": 1}))
+    # a case that was revised, but not deleted, is still counted
+    db.caserevisions.insert_one({"case": db.day0cases.find_one(bruck)})
+    db.caserevisions.insert_one({"case": db.day0cases.find_one(potsdam)})
+    db.caserevisions.insert_one({"case": db.day0cases.find_one(potsdam)})
+    db.day0cases.delete_one(potsdam)
+    db.day0cases.delete_one(eberstadt)
+    looked_up = []
+    find = db.aggregateCases.find
+
+    def recording_find(query, *args, **kwargs):
+        looked_up.append(query)
+        return find(query, *args, **kwargs)
+
+    db.aggregateCases.find = recording_find
+    admin_counts, daily_counts, confirmed = app.aggregate_admins_incrementally(db)
+    # the case deleted without a revision isn't looked for...
+    assert confirmed == 3
+    assert {"_id": {"$in": [potsdam["_id"]]}} in looked_up
+    assert {} not in looked_up
+    # ...until verification
+    admin_counts, daily_counts, confirmed = app.verify_materialized_counts(db)
+    assert confirmed == 2
+
+
+def test_incremental_aggregation_reads_cases_that_were_never_updated():
+    db = mongomock.MongoClient().db
+    db.day0cases.insert_many([without_id(case) for case in CASES])
+    app.aggregate_admins_incrementally(db)
+
+    created = {**without_id(CASES[3]), "revisionMetadata": {"creationMetadata": {"date": datetime.datetime(2024, 1, 28)}}}
+    db.day0cases.insert_one(created)
+    admin_counts, daily_counts, confirmed = app.aggregate_admins_incrementally(db)
+    assert confirmed == 5
+    assert db.aggregateState.find_one({"_id": "watermark"})["date"] == datetime.datetime(2024, 1, 28)
+    (full_admin_counts, full_daily_counts, _) = app.aggregate_admins(db.day0cases)
+    assert app.count_differences(full_admin_counts, admin_counts) == []
+    assert app.daily_count_differences(full_daily_counts, daily_counts) == []
+
+
+def test_map_data_is_downloaded_again_only_when_it_changes(s3, tmp_path):
+    s3.put_object(Bucket=S3_MAP_DATA_BUCKET, Key='test_map_data.json', Body=json.dumps({"DEU": {"label": "Germany"}}))
+    assert app.fetch_map_data(s3, S3_MAP_DATA_BUCKET, 'test_map_data.json', tmp_path) == {"DEU": {"label": "Germany"}}
+
+    # the cached copy is used while S3 has the same version
+    (tmp_path / 'test_map_data.json').write_text(json.dumps({"DEU": {"label": "Cached"}}))
+    assert app.fetch_map_data(s3, S3_MAP_DATA_BUCKET, 'test_map_data.json', tmp_path) == {"DEU": {"label": "Cached"}}
+
+    s3.put_object(Bucket=S3_MAP_DATA_BUCKET, Key='test_map_data.json', Body=json.dumps({"DEU": {"label": "Deutschland"}}))
+    assert app.fetch_map_data(s3, S3_MAP_DATA_BUCKET, 'test_map_data.json', tmp_path) == {"DEU": {"label": "Deutschland"}}
+
+
+class RecordingS3:
+    def __init__(self, s3):
+        self.s3 = s3
+        self.puts = []
+
+    def put_object(self, **kwargs):
+        self.puts.append(kwargs["Key"])
+        return self.s3.put_object(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.s3, name)
+
+
+def test_unchanged_data_is_not_uploaded_again(s3):
+    recording = RecordingS3(s3)
+    app.upload(recording, '[1, 2]', S3_AGGREGATE_BUCKET, ['test/latest.json'], skip_unchanged=True)
+    app.upload(recording, '[1, 2]', S3_AGGREGATE_BUCKET, ['test/latest.json'], skip_unchanged=True)
+    assert recording.puts == ['test/latest.json']
+    app.upload(recording, '[1, 2, 3]', S3_AGGREGATE_BUCKET, ['test/latest.json'], skip_unchanged=True)
+    assert recording.puts == ['test/latest.json', 'test/latest.json']
+    obj = s3.get_object(Bucket=S3_AGGREGATE_BUCKET, Key='test/latest.json')
+    assert obj['ContentEncoding'] == 'gzip'
+    assert json.loads(gzip.decompress(obj['Body'].read())) == [1, 2, 3]
+
+
+def test_time_series_by_week():
+    daily_counts = [
+        {"area": "DEU", "date": "2024-01-10", "caseCount": 2},
+        {"area": "DEU", "date": "2024-01-14", "caseCount": 1},
+        {"area": "FRA", "date": "2024-01-29", "caseCount": 3},
+        {"area": None, "date": "2024-02-20", "caseCount": 5},
+    ]
+    assert app.time_series(daily_counts, weekly=True) == {
+        "dates": ["2024-01-08", "2024-01-15", "2024-01-22", "2024-01-29"],
+        "areas": {"DEU": {"offset": 0, "counts": [3]}, "FRA": {"offset": 3, "counts": [3]}},
+    }
+    assert app.time_series([]) == {"dates": [], "areas": {}}
@@ -6,6 +6,7 @@
 # this deletes everything with list = false.
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 import os
@@ -23,6 +24,8 @@ from logger import setup_logger
 
 
 HOOKS = ["country_export", "aggregate"]
+# Copies of deleted cases are saved this many at a time
+REVISION_CHUNK_SIZE = 1000
 PRUNE_UPLOADS_WEBHOOK_URL = os.getenv("PRUNE_UPLOADS_WEBHOOK_URL")
 
 
@@ -196,6 +199,20 @@ def mark_cases_uuid(
     mark_upload(sources, source_id, accept, accept=True)
 
 
+def save_revisions(cases: pymongo.collection.Collection, query: Dict[str, Any]):
+    """Save a copy of each case matching query in caserevisions, as the data service does
+    before it deletes cases, so that the aggregation job knows which cases were deleted"""
+    revisions = cases.database.caserevisions
+    chunk = []
+    for case in cases.find(query):
+        chunk.append({"case": case})
+        if len(chunk) == REVISION_CHUNK_SIZE:
+            revisions.insert_many(chunk, ordered=False)
+            chunk = []
+    if chunk:
+        revisions.insert_many(chunk, ordered=False)
+
+
 def prune_uploads(
     cases: pymongo.collection.Collection,
     sources: pymongo.collection.Collection,
@@ -213,7 +230,7 @@ def prune_uploads(
     accept, reject = m
     if not dry_run:
         logging.info(f"source {_id} {source['name']}")
-    if not s.get("hasStableIdentifiers", False):
+    if not source.get("hasStableIdentifiers", False):
         try:
             if not dry_run:
                 mark_cases_non_uuid(cases, sources, _id, accept, reject)
@@ -224,7 +241,9 @@ def prune_uploads(
         try:
             if reject and not dry_run:
                 logging.info("  ... prune")
-                cases.delete_many({"caseReference.sourceId": _id, "list": False})
+                pruned = {"caseReference.sourceId": _id, "list": False}
+                save_revisions(cases, pruned)
+                cases.delete_many(pruned)
             if not dry_run:
                 logging.info("  prune ok")
             msgs.append("- prune ok")
@@ -243,6 +262,52 @@ def prune_uploads(
     return msgs
 
 
+def prune_source(
+    cases: pymongo.collection.Collection,
+    sources: pymongo.collection.Collection,
+    source: Dict[str, Any],
+    threshold: float,
+    epoch: datetime = None,
+    dry_run: bool = False,
+    allow_decrease: bool = False,
+) -> Tuple[List[str], bool]:
+    """Prune uploads for a source, so that a failure doesn't stop other sources being pruned
+
+    :return: A tuple of (notification messages, whether pruning finished)
+    """
+    try:
+        return prune_uploads(cases, sources, source, threshold, epoch, dry_run, allow_decrease), True
+    except Exception as e:
+        logging.exception(f"source {source['_id']} prune fail")
+        return [f"- prune fail: {e}"], False
+
+
+def prune_sources(
+    cases: pymongo.collection.Collection,
+    sources: pymongo.collection.Collection,
+    selected: List[Dict[str, Any]],
+    threshold: float,
+    epoch: datetime = None,
+    dry_run: bool = False,
+    allow_decrease: bool = False,
+    workers: int = 1,
+) -> List[Tuple[Dict[str, Any], List[str], bool]]:
+    """Prune uploads for the selected sources, up to workers sources at a time
+
+    Sources are independent, so they can be pruned concurrently.
+
+    :return: A list of (source, notification messages, whether pruning finished),
+      in the same order as selected
+    """
+    def prune(source):
+        return (source, *prune_source(cases, sources, source, threshold, epoch, dry_run, allow_decrease))
+
+    if workers <= 1:
+        return [prune(source) for source in selected]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(prune, selected))
+
+
 def get_selected_hooks(run_hooks):
     if not run_hooks:
         return []
@@ -272,6 +337,8 @@ if __name__ == "__main__":
                         help="Run hooks after prune finishes. Specify 'all' to run all hooks")
     parser.add_argument("--env",
                         help="Which environment to use for hooks (default: prod)")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="Number of sources to prune at the same time (default: 1)")
     args = parser.parse_args()
 
     # Prefer command line arguments to environment variables
@@ -288,6 +355,9 @@ if __name__ == "__main__":
     env = args.env or os.environ.get("ENV", "prod")
     logging.info(f"Environment: {env}")
 
+    workers = int(args.workers or os.environ.get("PRUNE_WORKERS", 1))
+    logging.info(f"Workers: {workers}")
+
     if args.dry_run:
         logging.info("Dry run, no changes will be made")
     # CONN is https://docs.mongodb.com/manual/reference/connection-string/
@@ -316,10 +386,11 @@ if __name__ == "__main__":
     )
     m = []
     ingested_sources = []
-    for s in sources:
-        if result := prune_uploads(db.cases, db.sources, s, threshold,
-                                   epoch, args.dry_run, args.allow_decrease):
-            ingested_sources.append(s)
+    for s, result, finished in prune_sources(db.cases, db.sources, list(sources), threshold,
+                                             epoch, args.dry_run, args.allow_decrease, workers):
+        if result:
+            if finished:
+                ingested_sources.append(s)
             list_msgs = "\n".join(result)
             m.append(f"*{s['name']}* ({str(s['_id'])}):\n{list_msgs}")
 
@@ -1,9 +1,12 @@
 import pytest
+import threading
+import time
 from bson.objectid import ObjectId
 from datetime import datetime
 from enum import Enum
 
-from prune_uploads import find_acceptable_upload, HOOKS, get_selected_hooks
+import prune_uploads
+from prune_uploads import find_acceptable_upload, HOOKS, get_selected_hooks, prune_sources
 
 # If the ratio of numError / numCreated is greater than this,
 # do not accept upload
@@ -177,3 +180,56 @@ def test_find_acceptable_upload_uuid(source, expected):
 )
 def test_get_selected_hooks(source, expected):
     assert get_selected_hooks(source) == expected
+
+
+def test_prune_sources_concurrently_in_order(monkeypatch):
+    lock = threading.Lock()
+    in_flight = []
+    most_in_flight = []
+
+    def fake_prune_uploads(cases, sources, source, *args):
+        with lock:
+            in_flight.append(source["name"])
+            most_in_flight.append(len(in_flight))
+        # the first source takes longest, so finishes last
+        time.sleep(0.2 if source["name"] == "first" else 0.05)
+        with lock:
+            in_flight.remove(source["name"])
+        if source["name"] == "broken":
+            raise ValueError("no uploads array")
+        return [f"- accept {source['name']} ok"]
+
+    monkeypatch.setattr(prune_uploads, "prune_uploads", fake_prune_uploads)
+    selected = [{"_id": i, "name": name} for i, name in enumerate(["first", "broken", "third"])]
+    results = prune_sources(None, None, selected, ERROR_THRESHOLD, workers=3)
+    assert max(most_in_flight) > 1
+    assert results == [
+        (selected[0], ["- accept first ok"], True),
+        (selected[1], ["- prune fail: no uploads array"], False),
+        (selected[2], ["- accept third ok"], True),
+    ]
+
+
+class FakeCases:
+    def __init__(self, cases):
+        self.cases = cases
+        self.database = self
+        self.caserevisions = self
+        self.revisions = []
+
+    def find(self, query):
+        return [c for c in self.cases if all(c.get(k) == v for k, v in query.items())]
+
+    def insert_many(self, documents, ordered=True):
+        self.revisions.append(documents)
+
+
+def test_save_revisions_of_pruned_cases(monkeypatch):
+    monkeypatch.setattr(prune_uploads, "REVISION_CHUNK_SIZE", 2)
+    cases = FakeCases([{"_id": i, "list": i != 3} for i in range(6)])
+    prune_uploads.save_revisions(cases, {"list": True})
+    assert cases.revisions == [
+        [{"case": {"_id": 0, "list": True}}, {"case": {"_id": 1, "list": True}}],
+        [{"case": {"_id": 2, "list": True}}, {"case": {"_id": 4, "list": True}}],
+        [{"case": {"_id": 5, "list": True}}],
+    ]
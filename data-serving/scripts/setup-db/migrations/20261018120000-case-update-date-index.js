@@ -0,0 +1,26 @@
+// The aggregation job finds the cases that have changed since its last run by
+// their update date.
+const indexes = [
+    {
+        name: 'byUpdateDate',
+        key: {
+            'revisionMetadata.updateMetadata.date': -1,
+        },
+    },
+];
+
+module.exports = {
+    async up(db, client) {
+        await db.command({
+            createIndexes: 'day0cases',
+            indexes: indexes,
+        });
+    },
+
+    async down(db, client) {
+        await db.command({
+            dropIndexes: 'day0cases',
+            index: ['byUpdateDate'],
+        });
+    },
+};
@@ -0,0 +1,27 @@
+// Cases that have never been updated have no update date, so the aggregation
+// job also finds the cases that have changed since its last run by their
+// creation date.
+const indexes = [
+    {
+        name: 'byCreationDate',
+        key: {
+            'revisionMetadata.creationMetadata.date': -1,
+        },
+    },
+];
+
+module.exports = {
+    async up(db, client) {
+        await db.command({
+            createIndexes: 'day0cases',
+            indexes: indexes,
+        });
+    },
+
+    async down(db, client) {
+        await db.command({
+            dropIndexes: 'day0cases',
+            index: ['byCreationDate'],
+        });
+    },
+};
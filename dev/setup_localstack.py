@@ -58,6 +58,8 @@ BATCH_COMPUTE_ENVIRONMENT_ORDER = [
 DATA_BUCKET_NAME = environ.get("DATA_BUCKET_NAME", "covid-19-data-export")
 CACHE_BUCKET_NAME = environ.get("CACHE_BUCKET_NAME", "covid-19-country-export")
 RETRIEVAL_BUCKET_NAME = environ.get("RETRIEVAL_BUCKET_NAME", "gdh-sources")
+AGGREGATE_BUCKET_NAME = environ.get("S3_AGGREGATE_BUCKET", "covid-19-aggregates")
+MAP_DATA_BUCKET_NAME = environ.get("S3_MAP_DATA_BUCKET", "covid-19-map-data")
 SES_EMAIL_ADDRESS = environ.get("SES_EMAIL_ADDRESS", "info@global.health")
 ECR_REPOSITORY_NAME = environ.get("ECR_REPOSITORY_NAME", "gdh-ingestor")
 
@@ -200,5 +202,7 @@ if __name__ == "__main__":
     lw.create_s3_bucket(DATA_BUCKET_NAME)
     lw.create_s3_bucket(CACHE_BUCKET_NAME)
     lw.create_s3_bucket(RETRIEVAL_BUCKET_NAME)
+    lw.create_s3_bucket(AGGREGATE_BUCKET_NAME)
+    lw.create_s3_bucket(MAP_DATA_BUCKET_NAME)
     lw.create_container_repository(ECR_REPOSITORY_NAME)
     print("Done setting up localstack resources")
@@ -0,0 +1,58 @@
+"""Compare the rate at which UTM coordinates can be converted to latitudes and longitudes.
+
+The scalar converter handles one point per call; the vectorized converter handles
+arrays of points with numpy. Run from the location-service directory:
+
+    poetry run python -m benchmarks.convert_utm [number_of_points]
+"""
+
+import random
+import sys
+import time
+
+import numpy
+
+from src.app.utm_to_latlong import utmToLatLong, utmToLatLongArrays
+
+
+def random_points(count):
+    """The same count of UTM coordinates every time, as lists of northings, eastings,
+    zones and whether each is in the southern hemisphere."""
+    rng = random.Random(1234)
+    northings = [rng.uniform(0, 9300000) for _ in range(count)]
+    eastings = [rng.uniform(170000, 830000) for _ in range(count)]
+    zones = [rng.randint(1, 60) for _ in range(count)]
+    southern = [rng.random() < 0.5 for _ in range(count)]
+    # southern northings count down from 10,000km at the equator
+    northings = [10000000 - n if s else n for (n, s) in zip(northings, southern)]
+    return (northings, eastings, zones, southern)
+
+
+def scalar(northings, eastings, zones, southern):
+    return [utmToLatLong(n, e, z, s) for (n, e, z, s) in zip(northings, eastings, zones, southern)]
+
+
+def vectorized(northings, eastings, zones, southern):
+    return utmToLatLongArrays(
+        numpy.array(northings), numpy.array(eastings), numpy.array(zones), numpy.array(southern)
+    )
+
+
+def points_per_second(converter, points):
+    start = time.perf_counter()
+    converter(*points)
+    return len(points[0]) / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    points = random_points(count)
+    one_at_a_time = points_per_second(scalar, points)
+    arrays = points_per_second(vectorized, points)
+    print(f"converted {count} UTM coordinates")
+    print(f"one at a time: {one_at_a_time:12.0f} points/s")
+    print(f"vectorized:    {arrays:12.0f} points/s ({arrays / one_at_a_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
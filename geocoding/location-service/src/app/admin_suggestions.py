@@ -0,0 +1,120 @@
+"""Suggestions of the admin areas within a country or a larger admin area.
+
+The suggestions come from JSON files that map a key (an ISO-3166-1 alpha-3 code for
+admin1, or the wiki ID of the containing area for admin2 and admin3) onto a list of
+areas. Rather than loading every file into every worker, they are converted into a
+SQLite database, which is read one key at a time. Each list is stored as the JSON text
+that is sent in responses, with an ETag made from a hash of that text. The Docker image
+builds the database:
+
+    python3 -m src.app.admin_suggestions
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+
+h = logging.StreamHandler(sys.stdout)
+logger = logging.getLogger(__name__)
+logger.addHandler(h)
+logger.setLevel(logging.INFO)
+
+DATA_FILES = {
+    1: 'data/adm1_parsed_data.json',
+    2: 'data/adm2_parsed_data.json',
+    3: 'data/adm3_parsed_data.json',
+}
+DATABASE_PATH = 'data/admin_suggestions.sqlite'
+# change this when the table changes, so that existing databases are rebuilt
+SCHEMA_VERSION = 2
+
+
+def content_etag(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+def build_database(path=DATABASE_PATH, data_files=DATA_FILES):
+    """Convert the JSON data files into a SQLite table of suggestions keyed by level and key.
+    Data files that don't exist are skipped, so there are no suggestions at their level."""
+    building = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(building):
+        os.remove(building)
+    connection = sqlite3.connect(building)
+    connection.execute(
+        'CREATE TABLE suggestions (level INTEGER NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+        'etag TEXT NOT NULL, PRIMARY KEY (level, key)) WITHOUT ROWID'
+    )
+    connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    for level, data_file in data_files.items():
+        if not os.path.exists(data_file):
+            logger.warning(f"No admin{level} data at {data_file}, there will be no admin{level} suggestions")
+            continue
+        with open(data_file) as f:
+            data = json.load(f)
+        rows = []
+        for key, value in data.items():
+            text = json.dumps(value, separators=(',', ':'))
+            rows.append((level, key, text, content_etag(text)))
+        connection.executemany('INSERT INTO suggestions (level, key, value, etag) VALUES (?, ?, ?, ?)', rows)
+        logger.info(f"Indexed {len(data)} admin{level} suggestion lists from {data_file}")
+    connection.commit()
+    connection.close()
+    # replace the database in one step, in case another worker is reading it
+    os.replace(building, path)
+
+
+def is_stale(path, data_files):
+    """Whether the database at path is missing, was built by an older version of this
+    module, or is older than any of the data files."""
+    if not os.path.exists(path):
+        return True
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    connection.close()
+    if version != SCHEMA_VERSION:
+        return True
+    built = os.path.getmtime(path)
+    return any(os.path.getmtime(f) > built for f in data_files.values() if os.path.exists(f))
+
+
+class AdminSuggestions:
+    """Reads suggestions from the database on demand, remembering the most recently used.
+    The database is built the first time it's needed if it's missing or out of date."""
+
+    def __init__(self, path=DATABASE_PATH, data_files=DATA_FILES, cache_size=1024):
+        self.path = path
+        self.data_files = data_files
+        self._connection = None
+        self._lock = threading.Lock()
+        self.serialized = functools.lru_cache(maxsize=cache_size)(self.lookup)
+
+    def connection(self):
+        with self._lock:
+            if self._connection is None:
+                if is_stale(self.path, self.data_files):
+                    build_database(self.path, self.data_files)
+                self._connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            return self._connection
+
+    def lookup(self, level, key):
+        """The JSON text of the list of admin areas at level within the area identified by key,
+        and its ETag, or None."""
+        connection = self.connection()
+        with self._lock:
+            return connection.execute(
+                'SELECT value, etag FROM suggestions WHERE level = ? AND key = ?', (level, key)
+            ).fetchone()
+
+    def suggest(self, level, key):
+        """The list of admin areas at level within the area identified by key, or None."""
+        row = self.serialized(level, key)
+        return json.loads(row[0]) if row is not None else None
+
+
+if __name__ == '__main__':
+    build_database()
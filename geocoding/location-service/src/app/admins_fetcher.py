@@ -1,33 +1,100 @@
+import asyncio
 import json
 import logging
-import functools
-
-import ratelimiter
+import threading
+import time
 
+from src.app.rate_limiter import AsyncTokenBucket, TokenBucket
+from src.app.result_cache import MemoryResultCache
+from src.integration import async_mapbox_client
 from src.integration.mapbox_client import mapbox_tile_query
 
 class AdminsFetcher:
 
-    def __init__(self, access_token, db, rate_limit=600):
-        self.rate_limit = ratelimiter.RateLimiter(max_calls=rate_limit, period=60)
+    def __init__(self, access_token, db, rate_limit=600, cache=None, refresh_interval=None, clock=time.monotonic,
+                 rate_limiter=None):
+        """Admin names are remembered once they've been looked up. If refresh_interval is set,
+        they are forgotten that many seconds after they were loaded, and a fully preloaded
+        collection is reloaded. Tilequery calls wait for the rate_limiter, which by default
+        allows rate_limit calls per minute from this process."""
+        self.rate_limit = rate_limiter if rate_limiter is not None else TokenBucket('tilequery', rate_limit)
+        self.async_rate_limit = AsyncTokenBucket(self.rate_limit)
         self.access_token = access_token
         self.admins = db.get_collection('admins')
+        self.cache = cache if cache is not None else MemoryResultCache('tilequery')
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self.names = {}
+        self.names_loaded_at = clock()
+        self.preloaded = False
+        self._names_lock = threading.Lock()
+
+    def preload_admins(self):
+        """Load the name of every admin in the collection, so that filling admins needs no queries."""
+        names = {admin['id']: admin['name'] for admin in self.admins.find({}, {'_id': 0, 'id': 1, 'name': 1})}
+        with self._names_lock:
+            self.names = names
+            self.names_loaded_at = self.clock()
+            self.preloaded = True
+        logging.info(f"Preloaded {len(names)} admin names")
+
+    def refresh_if_stale(self):
+        if self.refresh_interval is None or self.clock() - self.names_loaded_at < self.refresh_interval:
+            return
+        if self.preloaded:
+            self.preload_admins()
+        else:
+            with self._names_lock:
+                self.names = {}
+                self.names_loaded_at = self.clock()
 
-    @functools.lru_cache(maxsize=500)
     def cached_mapbox_tile_query(self, geocode_geometry):
-        return mapbox_tile_query(self.access_token, json.loads(geocode_geometry), rate_limit=self.rate_limit)
+        # don't remember error responses, which have no features, so the query is tried again next time
+        return self.cache.fetch(
+            geocode_geometry,
+            lambda: mapbox_tile_query(self.access_token, json.loads(geocode_geometry), rate_limit=self.rate_limit),
+            should_store=lambda response: 'features' in response
+        )
+
+    async def cached_mapbox_tile_query_async(self, geocode_geometry):
+        return await self.cache.fetch_async(
+            geocode_geometry,
+            lambda: async_mapbox_client.mapbox_tile_query(
+                self.access_token, json.loads(geocode_geometry), rate_limit=self.async_rate_limit),
+            should_store=lambda response: 'features' in response
+        )
+
+    def has_admins(self, geocode):
+        return 'administrativeAreaLevel1' in geocode and \
+            'administrativeAreaLevel2' in geocode and 'administrativeAreaLevel3' in geocode
 
     def fill_admins(self, geocode):
-        if 'administrativeAreaLevel1' in geocode and \
-            'administrativeAreaLevel2' in geocode and 'administrativeAreaLevel3' in geocode:
+        if self.has_admins(geocode):
             return geocode
         response = self.cached_mapbox_tile_query(json.dumps(geocode['geometry']))
         if 'features' not in response:
             # probably your API key doesn't support the premium APIs, skip this step
             return geocode
+        names = self.getNames([feature['properties']['id'] for feature in response['features']])
+        return self.name_admins(geocode, response, names)
+
+    async def fill_admins_async(self, geocode):
+        """fill_admins() for asyncio tasks: the tilequery call doesn't block the event loop,
+        and admin names are looked up on a worker thread, as they can need a query."""
+        if self.has_admins(geocode):
+            return geocode
+        response = await self.cached_mapbox_tile_query_async(json.dumps(geocode['geometry']))
+        if 'features' not in response:
+            return geocode
+        ids = [feature['properties']['id'] for feature in response['features']]
+        names = await asyncio.to_thread(self.getNames, ids)
+        return self.name_admins(geocode, response, names)
+
+    def name_admins(self, geocode, response, names):
+        """Set the names of the admins in a tilequery response on the geocode."""
         for feature in response['features']:
             layer = feature['properties']['tilequery']['layer']
-            name = self.getName(feature['properties']['id'])
+            name = names.get(feature['properties']['id'])
             layerKey = self.getKey(layer)
             geocode[layerKey] = name
         if 'administrativeAreaLevel1' in geocode and geocode['administrativeAreaLevel1'] is None:
@@ -46,9 +113,24 @@ class AdminsFetcher:
         }[layer]
 
     def getName(self, id):
-        admin = self.admins.find_one({'id': id})
-        if not admin:
-            logging.warning(f"ID {id} not found in admins collection, returning None")
-            return None
-        else:
-            return admin['name']
+        return self.getNames([id]).get(id)
+
+    def getNames(self, ids):
+        """Find the names of the admins with these IDs, looking up any that aren't already
+        known in one query. Returns a dictionary mapping each ID onto its name, or onto None
+        for IDs that aren't in the admins collection."""
+        self.refresh_if_stale()
+        names = self.names
+        if not self.preloaded:
+            unknown = list({id for id in ids if id not in names})
+            if len(unknown) > 0:
+                found = {admin['id']: admin['name'] for admin in
+                         self.admins.find({'id': {'$in': unknown}}, {'_id': 0, 'id': 1, 'name': 1})}
+                # remember the IDs that aren't there too, so they aren't looked up again
+                for id in unknown:
+                    names[id] = found.get(id)
+        result = {id: names.get(id) for id in ids}
+        for id, name in result.items():
+            if name is None:
+                logging.warning(f"ID {id} not found in admins collection, returning None")
+        return result
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+import sys
+
+from aiohttp import web
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from src.app import main
+from src.integration import async_mapbox_client
+
+h = logging.StreamHandler(sys.stdout)
+logger = logging.getLogger(__name__)
+logger.addHandler(h)
+logger.setLevel(logging.INFO)
+
+
+async def locate_async(query, options):
+    """locate() for asyncio tasks: ask each geocoder in turn to locate the query, returning
+    the first non-empty result."""
+    for g in main.geocoders:
+        locations = await g.geocode_async(query, options)
+        if len(locations) > 0:
+            return locations
+    return []
+
+
+async def locate_in_batch_async(query, options):
+    try:
+        return await locate_async(query, options)
+    except Exception:
+        logger.exception(f"Failed to geocode query {query} in batch")
+        return []
+
+
+class QueryArgs:
+    """Reads a query string the way Flask's request.args does, for main.query_options()."""
+
+    def __init__(self, query):
+        self.query = query
+
+    def get(self, key, default=None, type=str):
+        return type(self.query[key]) if key in self.query else default
+
+
+async def geocode(request):
+    query = request.query.get("q")
+    if not query:
+        logger.warning(f"No query supplied in request {request}")
+        return web.Response(text="No query supplied", status=400)
+    logger.info(f"geocoding query {query}")
+    options = main.query_options(QueryArgs(request.query))
+    return web.json_response(await locate_async(query, options))
+
+
+async def geocode_batch(request):
+    """The same as the Flask app's /geocode/batch, but the distinct queries in a batch are
+    all located at once by asyncio tasks rather than a few at a time on threads. Each
+    geocoder's rate limiter still applies to every query."""
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    (batch, error) = main.batch_queries(body if isinstance(body, dict) else {})
+    if error is not None:
+        return web.Response(text=error, status=400)
+    logger.info(f"geocoding batch of {len(batch)} queries")
+    # the same query often turns up many times in a batch, so only locate each once
+    distinct = list(dict.fromkeys(batch))
+    located = dict(
+        zip(
+            distinct,
+            await asyncio.gather(
+                *[locate_in_batch_async(q, json.loads(o)) for (q, o) in distinct]
+            ),
+        )
+    )
+    return web.json_response([located[r] for r in batch])
+
+
+async def forward_to_flask(request):
+    """Answer every other route with the Flask app, on a worker thread."""
+    environ = EnvironBuilder(
+        path=request.path,
+        method=request.method,
+        query_string=request.query_string,
+        headers=list(request.headers.items()),
+        data=await request.read(),
+    ).get_environ()
+    (body, status, headers) = await asyncio.to_thread(
+        run_wsgi_app, main.app, environ, buffered=True
+    )
+    return web.Response(
+        body=b"".join(body),
+        status=int(status.split(" ", 1)[0]),
+        headers=[(k, v) for (k, v) in headers if k.lower() != "content-length"],
+    )
+
+
+async def close_mapbox_session(app):
+    await async_mapbox_client.session.close()
+
+
+def make_app():
+    """The location-service as an aiohttp app, which handles geocoding requests on one
+    event loop, calling Mapbox over a pool of connections shared by every request."""
+    app = web.Application()
+    app.router.add_get("/geocode", geocode)
+    app.router.add_post("/geocode/batch", geocode_batch)
+    app.router.add_route("*", "/{path:.*}", forward_to_flask)
+    app.on_cleanup.append(close_mapbox_session)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(make_app(), host="0.0.0.0", port=8080)
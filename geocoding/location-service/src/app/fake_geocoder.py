@@ -14,3 +14,6 @@ class FakeGeocoder:
             return [self.values[query]]
         else:
             return []
+
+    async def geocode_async(self, query, opts):
+        return self.geocode(query, opts)
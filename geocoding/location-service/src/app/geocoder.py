@@ -1,11 +1,13 @@
+import asyncio
 import iso3166
 import json
 import logging
-import ratelimiter
 import sys
-import functools
 
 
+from src.app.rate_limiter import AsyncTokenBucket, TokenBucket
+from src.app.result_cache import MemoryResultCache
+from src.integration import async_mapbox_client
 from src.integration.mapbox_client import mapbox_geocode
 
 h = logging.StreamHandler(sys.stdout)
@@ -13,19 +15,49 @@ logger = logging.getLogger(__name__)
 logger.addHandler(h)
 logger.setLevel(logging.INFO)
 
+# marks a partial country name that is part of more than one country's name
+AMBIGUOUS = object()
+
+
+def country_name_index():
+    """Map every lower-case country name, and every part of a name, onto the country's
+    ISO-3166 two-letter code. Parts of more than one country's name map onto AMBIGUOUS,
+    unless they are also a country's whole name: "niger" is in "nigeria" but means Niger."""
+    names = {c.name.lower(): c.alpha2 for c in iso3166.countries}
+    index = {}
+    for name, code in names.items():
+        for start in range(len(name)):
+            for end in range(start + 1, len(name) + 1):
+                part = name[start:end]
+                index[part] = code if index.get(part, code) == code else AMBIGUOUS
+    index.update(names)
+    # "United States" is the Mapbox name for US, but it is not in the iso3166 list (which
+    # has "United States of America"), and the PRC is not in the iso3166 list (but China is).
+    index.update({
+        'united states': 'US',
+        "people's republic of china": 'CN'
+    })
+    return index
+
+
 class Geocoder:
     Country = 'Country'
     Admin3 = 'Admin3'
     Admin2 = 'Admin2'
     Admin1 = 'Admin1'
     Point = 'Point'
-    INDEX = {c.name.lower(): c for c in iso3166.countries}
+    INDEX = country_name_index()
 
-    def __init__(self, api_token, admins_fetcher, rate_limit=600):
-        """Needs a mapbox API token."""
-        self.rate_limit = ratelimiter.RateLimiter(max_calls=rate_limit, period=60)
+    def __init__(self, api_token, admins_fetcher, rate_limit=600, cache=None, rate_limiter=None):
+        """Needs a mapbox API token. Geocoding results are kept in the cache, which
+        is a ResultCache and by default lives only in this process. Calls to Mapbox wait
+        for the rate_limiter, which by default allows rate_limit calls per minute from
+        this process."""
+        self.rate_limit = rate_limiter if rate_limiter is not None else TokenBucket('geocode', rate_limit)
+        self.async_rate_limit = AsyncTokenBucket(self.rate_limit)
         self.api_token = api_token
         self.admins_fetcher = admins_fetcher
+        self.cache = cache if cache is not None else MemoryResultCache('geocode')
 
     def resolutionToMapboxType(self, resolution):
         return {
@@ -64,37 +96,28 @@ class Geocoder:
         Return:  The ISO-3166 two-letter code, or None if the countryName was unfound or ambiguous.
         """
         logger.debug(f"Getting country code for {countryName}")
-        # workaround a common problem: "United States" is the Mapbox name for US, but the algorithm
-        # below will also find UM (United States Minor Outlying Islands) and fail because the
-        # query is ambiguous.
-        #
-        # additionally the PRC is not in the iso3166 list (but China is).
-        fixups = {
-            'united states': 'US',
-            "people's republic of china": 'CN'
-        }
-        name = countryName.lower()
-        if fixedCode := fixups.get(name):
-            return fixedCode
-        
-        country = None
-        for key in Geocoder.INDEX:
-            if name in key:
-                if country is not None:
-                    # Ambiguous countryName
-                    logger.error(f"Country {countryName} is ambiguous, found both {country} and {Geocoder.INDEX[key]}")
-                    return None
-                country = Geocoder.INDEX[key]
-
-        if country is not None:
-            logger.debug(f"code for {countryName} is {country.alpha2}")
-            return country.alpha2
-        logger.error(f"Country {countryName} not found in iso3166.countries!")
-        return None
-
+        code = Geocoder.INDEX.get(countryName.lower())
+        if code is None:
+            logger.error(f"Country {countryName} not found in iso3166.countries!")
+            return None
+        if code is AMBIGUOUS:
+            logger.error(f"Country {countryName} is ambiguous")
+            return None
+        logger.debug(f"code for {countryName} is {code}")
+        return code
 
     def unpackGeoJson(self, feature):
         """Turn mapbox geojson into the data structure we need."""
+        res = self.locationFromGeoJson(feature)
+        self.admins_fetcher.fill_admins(res)
+        return res
+
+    async def unpackGeoJsonAsync(self, feature):
+        res = self.locationFromGeoJson(feature)
+        await self.admins_fetcher.fill_admins_async(res)
+        return res
+
+    def locationFromGeoJson(self, feature):
         contexts = [feature]
         if ('context' in feature):
             for c in feature['context']:
@@ -112,24 +135,40 @@ class Geocoder:
             'admin1': self.getFeatureDescriptionFromContext(contexts, 'region'),
             'geoResolution': self.getResolution(contexts)
         }
-        self.admins_fetcher.fill_admins(res)
         return res
 
-    @functools.lru_cache(500)
     def cached_mapbox_geocode(self, query: str, options: str):
+        return self.cache.fetch(json.dumps([query, options]), lambda: self.mapbox_geocode(query, options))
+
+    def mapbox_geocode_options(self, options: str):
         options = json.loads(options)
         limit_resolution = options.get("limitToResolution", [])
-        limit_country = options.get("limitToCountry")
         types = [self.resolutionToMapboxType(i) for i in limit_resolution] if limit_resolution else None
+        return {"types": types, "limit": 5, "languages": ['en'], "country": options.get("limitToCountry")}
+
+    def mapbox_geocode(self, query: str, options: str):
         geoResult = mapbox_geocode(
             self.api_token,
             json.loads(query),
-            types=types, limit=5,
-            languages=['en'],
-            country=limit_country,
-            rate_limit=self.rate_limit
+            rate_limit=self.rate_limit,
+            **self.mapbox_geocode_options(options)
         )
         return [self.unpackGeoJson(feature) for feature in geoResult['features']]
 
+    async def mapbox_geocode_async(self, query: str, options: str):
+        geoResult = await async_mapbox_client.mapbox_geocode(
+            self.api_token,
+            json.loads(query),
+            rate_limit=self.async_rate_limit,
+            **self.mapbox_geocode_options(options)
+        )
+        return list(await asyncio.gather(*[self.unpackGeoJsonAsync(feature) for feature in geoResult['features']]))
+
     def geocode(self, query, options={}):
         return self.cached_mapbox_geocode(json.dumps(query), json.dumps(options))
+
+    async def geocode_async(self, query, options={}):
+        """geocode() for asyncio tasks, which doesn't block the event loop while Mapbox answers."""
+        (query, options) = (json.dumps(query), json.dumps(options))
+        return await self.cache.fetch_async(
+            json.dumps([query, options]), lambda: self.mapbox_geocode_async(query, options))
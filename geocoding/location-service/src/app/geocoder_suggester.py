@@ -1,16 +1,14 @@
 import logging
 import sys
-import json
 
+from src.app.admin_suggestions import AdminSuggestions
 from src.app.geocoder import Geocoder
 
 h = logging.StreamHandler(sys.stdout)
 logger = logging.getLogger(__name__)
 logger.addHandler(h)
 logger.setLevel(logging.INFO)
-adm1ParsedData = json.load(open('data/adm1_parsed_data.json'))
-adm2ParsedData = json.load(open('data/adm2_parsed_data.json'))
-adm3ParsedData = json.load(open('data/adm3_parsed_data.json'))
+adminSuggestions = AdminSuggestions()
 
 class GeocodeSuggester:
     """Suggest geocoding by asking a cohort of geocoders to locate the query."""
@@ -50,10 +48,15 @@ class GeocodeSuggester:
         return []
 
     def suggest_admin1(self, admin0):
-        return adm1ParsedData.get(admin0)
+        return adminSuggestions.suggest(1, admin0)
 
     def suggest_admin2(self, admin1WikiId):
-        return adm2ParsedData.get(admin1WikiId)
+        return adminSuggestions.suggest(2, admin1WikiId)
 
     def suggest_admin3(self, admin2WikiId):
-        return adm3ParsedData.get(admin2WikiId)
+        return adminSuggestions.suggest(3, admin2WikiId)
+
+    def serialized_admins(self, level, key):
+        """The JSON text of the admin suggestions that suggest_admin1/2/3 would make, and its
+        ETag, or None."""
+        return adminSuggestions.serialized(level, key)
@@ -1,21 +1,27 @@
 import sys
 import json
+import hashlib
 import iso3166
 import logging
 import pymongo
-from flask import Blueprint, Flask, jsonify, request
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, Flask, Response, jsonify, request
 from os import environ
 
 from src.app.admins_fetcher import AdminsFetcher
 from src.app.fake_geocoder import FakeGeocoder
 from src.app.geocoder import Geocoder
 from src.app.geocoder_suggester import GeocodeSuggester
-from src.app.utm_to_latlong import utmToLatLong
+from src.app.rate_limiter import TokenBucket, make_buckets
+from src.app.result_cache import make_result_cache
+from src.app.utm_to_latlong import convertUTMBatch, utmToLatLong
 
 
 app = Flask(__name__)
 
 geocoders = []
+result_caches = []
+rate_limiters = []
 
 h = logging.StreamHandler(sys.stdout)
 logger = logging.getLogger(__name__)
@@ -51,14 +57,146 @@ if "MAPBOX_TOKEN" in environ:
             environ["DB_CONNECTION_STRING"], authSource="admin"
         )
     rate_limit = int(environ.get("MAPBOX_GEOCODE_RATE_LIMIT_PER_MIN", 600))
+    tilequery_rate_limit = int(
+        environ.get("MAPBOX_TILEQUERY_RATE_LIMIT_PER_MIN", rate_limit)
+    )
+    db = mongo_client.get_database(environ["DB"])
+    # With the mongo backend, the rate limits apply to all replicas together rather than
+    # to each one.
+    buckets = make_buckets(environ.get("RATE_LIMIT_BACKEND", "memory"), db)
+    rate_limiters.extend(
+        [
+            TokenBucket("geocode", rate_limit, buckets=buckets),
+            TokenBucket("tilequery", tilequery_rate_limit, buckets=buckets),
+        ]
+    )
+    # Mapbox results are cached in memory (the default), in a SQLite file at
+    # GEOCODE_CACHE_PATH, or in the mongo database shared by every replica.
+    cache_options = {
+        "backend": environ.get("GEOCODE_CACHE_BACKEND", "memory"),
+        "ttl": int(environ.get("GEOCODE_CACHE_TTL_SECONDS", 30 * 24 * 60 * 60)),
+        "max_size": int(environ.get("GEOCODE_CACHE_MAX_ENTRIES", 100000)),
+        "path": environ.get("GEOCODE_CACHE_PATH"),
+        "db": db,
+    }
+    admins_refresh = environ.get("ADMINS_REFRESH_SECONDS")
     admins_fetcher = AdminsFetcher(
-        access_token, mongo_client.get_database(environ["DB"]), rate_limit=rate_limit
+        access_token,
+        db,
+        cache=make_result_cache("tilequery", **cache_options),
+        refresh_interval=float(admins_refresh) if admins_refresh else None,
+        rate_limiter=rate_limiters[1],
+    )
+    if "PRELOAD_ADMINS" in environ:
+        admins_fetcher.preload_admins()
+    mapbox_geocoder = Geocoder(
+        access_token,
+        admins_fetcher,
+        cache=make_result_cache("geocode", **cache_options),
+        rate_limiter=rate_limiters[0],
     )
-    mapbox_geocoder = Geocoder(access_token, admins_fetcher, rate_limit=rate_limit)
     geocoders.append(mapbox_geocoder)
+    result_caches.extend([mapbox_geocoder.cache, admins_fetcher.cache])
 
 suggester = GeocodeSuggester(geocoders)
 
+# Queries in a batch are geocoded at most this many at a time. Each geocoder's
+# rate limiter still applies to every query.
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(environ.get("GEOCODE_BATCH_CONCURRENCY", 4))
+)
+# Larger batches are turned away, so that one request can't hold the executor for long.
+batch_max_queries = int(environ.get("GEOCODE_BATCH_MAX_QUERIES", 1000))
+
+
+# The country and admin suggestions only change when the service is deployed, so clients
+# and CDNs can keep them for this long, and check whether they're current with their ETags.
+static_max_age = int(environ.get("STATIC_SUGGESTIONS_MAX_AGE_SECONDS", 24 * 60 * 60))
+
+country_names = {
+    c.alpha2: (c.name, hashlib.sha256(c.name.encode("utf-8")).hexdigest()[:32])
+    for c in iso3166.countries
+}
+
+
+def static_response(body, etag, mimetype):
+    """A response that can be cached, which is 304 Not Modified if the request's
+    If-None-Match header has the ETag."""
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = static_max_age
+    return response.make_conditional(request)
+
+
+def admin_suggestions_response(level, key):
+    serialized = suggester.serialized_admins(level, key)
+    if serialized is None:
+        return None
+    (body, etag) = serialized
+    return static_response(body, etag, "application/json")
+
+
+def locate(query, options):
+    """Ask each geocoder in turn to locate the query, returning the first non-empty result."""
+    for g in geocoders:
+        locations = g.geocode(query, options)
+        if len(locations) > 0:
+            return locations
+    return []
+
+
+def locate_in_batch(query, options):
+    """Locate one query of a batch. A query that fails is logged and found nowhere,
+    so that it doesn't stop the rest of the batch from being located."""
+    try:
+        return locate(query, options)
+    except Exception:
+        logger.exception(f"Failed to geocode query {query} in batch")
+        return []
+
+
+def query_options(args):
+    """The geocoding options given in the query string of a /geocode request."""
+    options = {}
+    resolution = args.get("limitToResolution", "[]", type=str)
+    listOfResolutions = json.loads(resolution)
+    if len(listOfResolutions) > 0:
+        options["limitToResolution"] = listOfResolutions
+    countries = args.get("limitToCountry", "[]", type=str)
+    listOfCountries = json.loads(countries)
+    if len(listOfCountries) > 0:
+        options["limitToCountry"] = listOfCountries
+    return options
+
+
+def batch_queries(body):
+    """Read the queries from the body of a /geocode/batch request. Returns the list of
+    (query, options JSON) pairs, and None; or None and the reason the body is bad."""
+    queries = body.get("queries")
+    if not isinstance(queries, list):
+        logger.warning(f"No list of queries supplied in batch request {body}")
+        return None, "No list of queries supplied"
+    if len(queries) > batch_max_queries:
+        logger.warning(f"Batch of {len(queries)} queries is too large")
+        return None, f"At most {batch_max_queries} queries can be geocoded in a batch"
+    batch = []
+    for q in queries:
+        if not isinstance(q, dict) or not isinstance(q.get("q"), str) or not q["q"]:
+            logger.warning(f"Query {q} has no q in batch request")
+            return None, "Every query must have a q"
+        options = {}
+        for option in ["limitToResolution", "limitToCountry"]:
+            if not isinstance(q.get(option, []), list):
+                logger.warning(
+                    f"Query {q} has a {option} that isn't a list in batch request"
+                )
+                return None, f"{option} must be a list"
+            if len(q.get(option, [])) > 0:
+                options[option] = q[option]
+        batch.append((q["q"], json.dumps(options, sort_keys=True)))
+    return batch, None
+
 
 @app.route("/health")
 def index() -> str:
@@ -72,6 +210,18 @@ def index() -> str:
     return jsonify({"status": "Healthy"})
 
 
+@app.route("/geocode/cacheStats")
+def cache_stats():
+    """Report the hits, misses and size of each cache of Mapbox results."""
+    return jsonify({c.name: c.stats() for c in result_caches})
+
+
+@app.route("/geocode/rateLimitStats")
+def rate_limit_stats():
+    """Report how many calls each Mapbox rate limiter has allowed, and how long they waited."""
+    return jsonify({r.name: r.stats() for r in rate_limiters})
+
+
 @app.route("/geocode")
 def geocode():
     query = request.args.get("q", type=str)
@@ -79,23 +229,33 @@ def geocode():
         logger.warning(f"No query supplied in request {request}")
         return "No query supplied", 400
     logger.info(f"geocoding query {query}")
-    options = {}
-    resolution = request.args.get("limitToResolution", "[]", type=str)
-    listOfResolutions = json.loads(resolution)
-    if len(listOfResolutions) > 0:
-        options["limitToResolution"] = listOfResolutions
-    countries = request.args.get("limitToCountry", "[]", type=str)
-    listOfCountries = json.loads(countries)
-    if len(listOfCountries) > 0:
-        options["limitToCountry"] = listOfCountries
+    options = query_options(request.args)
     logger.debug(f"options {options}")
-    for g in geocoders:
-        locations = g.geocode(query, options)
-        if len(locations) > 0:
-            logger.debug("responding with locations: {locations}")
-            return jsonify(locations)
-    logger.debug("empty response")
-    return jsonify([])
+    locations = locate(query, options)
+    logger.debug(f"responding with locations: {locations}")
+    return jsonify(locations)
+
+
+@app.route("/geocode/batch", methods=["POST"])
+def geocode_batch():
+    """Geocode a list of queries, each of which can have its own limitToResolution and
+    limitToCountry lists. Responds with a list of the locations found for each query,
+    in the same order as the queries. A query that cannot be geocoded gets an empty list."""
+    (batch, error) = batch_queries(request.get_json(silent=True) or {})
+    if error is not None:
+        return error, 400
+    logger.info(f"geocoding batch of {len(batch)} queries")
+    # the same query often turns up many times in a batch, so only locate each once
+    distinct = list(dict.fromkeys(batch))
+    located = dict(
+        zip(
+            distinct,
+            batch_executor.map(
+                lambda r: locate_in_batch(r[0], json.loads(r[1])), distinct
+            ),
+        )
+    )
+    return jsonify([located[r] for r in batch])
 
 
 @app.route("/geocode/suggest")
@@ -126,8 +286,12 @@ def convert_geocode():
     if not zone:
         logger.warning(f"No zone specified in request {request}")
         return "No zone supplied", 400
+    hemisphere = request.args.get("h", "N", type=str)
+    if hemisphere not in ("N", "S"):
+        logger.warning(f"Bad hemisphere {hemisphere} in request {request}")
+        return "Hemisphere must be N or S", 400
     # now do the conversion!
-    (latitude, longitude) = utmToLatLong(northing, easting, zone)
+    (latitude, longitude) = utmToLatLong(northing, easting, zone, hemisphere == "S")
     if not latitude or not longitude:
         logger.error(f"Conversion failed for request {request}")
         return "Conversion failed", 500
@@ -138,6 +302,43 @@ def convert_geocode():
     return jsonify(position)
 
 
+def is_number(value):
+    # JSON true and false arrive as bools, which Python counts as ints
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+@app.route("/geocode/convertUTM/batch", methods=["POST"])
+def convert_geocode_batch():
+    """Convert lists of northings, eastings and zones (and optionally hemispheres, N or S,
+    which are N by default) to lists of latitudes and longitudes."""
+    body = request.get_json(silent=True) or {}
+    columns = [body.get(c) for c in ["northings", "eastings", "zones"]]
+    if not all(isinstance(c, list) for c in columns):
+        logger.warning(f"Northings, eastings or zones missing in request {request}")
+        return "Supply lists of northings, eastings and zones", 400
+    (northings, eastings, zones) = columns
+    hemispheres = body.get("hemispheres", ["N"] * len(northings))
+    if not isinstance(hemispheres, list) or not (
+        len(northings) == len(eastings) == len(zones) == len(hemispheres)
+    ):
+        logger.warning(f"Lists of different lengths in request {request}")
+        return (
+            "Supply the same number of northings, eastings, zones and hemispheres",
+            400,
+        )
+    if not all(is_number(v) for v in northings + eastings):
+        return "Northings and eastings must be numbers", 400
+    if not all(is_number(z) and isinstance(z, int) and 1 <= z <= 60 for z in zones):
+        return "Zones must be whole numbers from 1 to 60", 400
+    if not all(h in ("N", "S") for h in hemispheres):
+        return "Hemispheres must be N or S", 400
+    logger.info(f"converting {len(northings)} UTM coordinates")
+    (latitudes, longitudes) = convertUTMBatch(
+        northings, eastings, zones, [h == "S" for h in hemispheres]
+    )
+    return jsonify({"latitudes": latitudes, "longitudes": longitudes})
+
+
 @app.route("/geocode/countryName")
 def country_name():
     code = request.args.get("c", type=str)
@@ -149,10 +350,11 @@ def country_name():
             f"Country code {code} is not two characters long in request {request}"
         )
         return "Bad ISO-3166-1 country code", 400
-    country = iso3166.countries_by_alpha2.get(code)
+    country = country_names.get(code)
     if country is None:
         return "Unknown country code", 404
-    return country.name, 200
+    (name, etag) = country
+    return static_response(name, etag, "text/html")
 
 
 @app.route("/geocode/admin1")
@@ -166,13 +368,13 @@ def suggest_admin1():
             f"Country code {admin0} is not three characters long in request {request}"
         )
         return "Bad ISO-3166-1 alpha-3 country code", 400
-    admin1Suggestions = suggester.suggest_admin1(admin0)
+    admin1Suggestions = admin_suggestions_response(1, admin0)
     if admin1Suggestions is None:
         logger.warning(
             f"Unknown ISO-3166-1 alpha-3 country code {admin0} from request {request}"
         )
         return f"Unknown ISO-3166-1 alpha-3 country code {admin0}", 404
-    return jsonify(admin1Suggestions), 200
+    return admin1Suggestions
 
 
 @app.route("/geocode/admin2")
@@ -181,11 +383,11 @@ def suggest_admin2():
     if not admin1WikiId:
         logger.warning(f"No admin1WikiId in request {request}")
         return "No admin1WikiId in request", 400
-    admin2Suggestions = suggester.suggest_admin2(admin1WikiId)
+    admin2Suggestions = admin_suggestions_response(2, admin1WikiId)
     if admin2Suggestions is None:
         logger.warning(f"Unknown admin1WikiId {admin1WikiId} from request {request}")
         return f"Unknown admin1WikiId {admin1WikiId}", 404
-    return jsonify(admin2Suggestions), 200
+    return admin2Suggestions
 
 
 @app.route("/geocode/admin3")
@@ -194,11 +396,11 @@ def suggest_admin3():
     if not admin2WikiId:
         logger.warning(f"No admin2WikiId in request {request}")
         return "No admin2WikiId in request", 400
-    admin3Suggestions = suggester.suggest_admin3(admin2WikiId)
+    admin3Suggestions = admin_suggestions_response(3, admin2WikiId)
     if admin3Suggestions is None:
         logger.warning(f"Unknown admin2WikiId {admin2WikiId} from request {request}")
         return f"Unknown admin2WikiId {admin2WikiId}", 404
-    return jsonify(admin3Suggestions), 200
+    return admin3Suggestions
 
 
 if __name__ == "__main__":
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+
+from pymongo.errors import DuplicateKeyError
+
+# a bucket this close to having a token has one, so rounding errors don't leave callers
+# waiting for vanishingly short times
+TOKEN_TOLERANCE = 1e-9
+
+
+class InProcessBuckets:
+    """Keeps token buckets in this process, so they limit only this process's calls."""
+
+    def __init__(self):
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, name, rate, capacity, now):
+        """Take a token from the bucket called name, which fills at rate tokens per second up
+        to capacity. Returns 0 if a token was taken, or how many seconds to wait before one
+        will be available."""
+        with self._lock:
+            (tokens, updated_at) = self.buckets.get(name, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens >= 1 - TOKEN_TOLERANCE:
+                self.buckets[name] = (max(0, tokens - 1), now)
+                return 0
+            self.buckets[name] = (tokens, now)
+            return (1 - tokens) / rate
+
+
+class MongoBuckets:
+    """Keeps token buckets in a mongo collection, so that every replica of the service shares
+    them. Each bucket is one document, which is updated only if nobody else has changed it
+    since it was read; a replica that loses the race reads the bucket again."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def take(self, name, rate, capacity, now):
+        while True:
+            bucket = self.collection.find_one({"_id": name})
+            if bucket is None:
+                try:
+                    self.collection.insert_one({"_id": name, "tokens": capacity - 1, "updatedAt": now})
+                    return 0
+                except DuplicateKeyError:
+                    continue
+            # another replica's clock can be a little ahead of ours
+            elapsed = max(0, now - bucket["updatedAt"])
+            tokens = min(capacity, bucket["tokens"] + elapsed * rate)
+            wait = 0 if tokens >= 1 - TOKEN_TOLERANCE else (1 - tokens) / rate
+            if wait > 0:
+                return wait
+            updated = self.collection.update_one(
+                {"_id": name, "tokens": bucket["tokens"], "updatedAt": bucket["updatedAt"]},
+                {"$set": {"tokens": max(0, tokens - 1), "updatedAt": max(now, bucket["updatedAt"])}},
+            )
+            if updated.modified_count == 1:
+                return 0
+
+
+class TokenBucket:
+    """Limits calls to an API to rate_limit in any minute, allowing bursts of up to burst calls.
+    Use it as a context manager around each call: entering waits until the call is allowed,
+    rather than failing. The buckets backend says where the tokens are kept, and how long
+    callers have waited is recorded for stats().
+
+    A full bucket allows burst calls at once, and then refills during the minute, so it
+    refills at (rate_limit - burst) per minute to keep every minute within rate_limit. The
+    default burst is a second's worth of calls. A rate_limit of one call a minute or less is
+    too small for a burst, so the bucket holds one token and refills at rate_limit per minute."""
+
+    def __init__(self, name, rate_limit, burst=None, buckets=None, clock=time.time, sleep=time.sleep):
+        self.name = name
+        if rate_limit <= 0:
+            raise ValueError(f"The rate limit for {name} must be more than 0, not {rate_limit}")
+        if burst is None and rate_limit <= 1:
+            self.capacity = 1
+            self.rate = rate_limit / 60
+        else:
+            self.capacity = burst if burst is not None else max(1, rate_limit // 60)
+            if not 0 < self.capacity < rate_limit:
+                raise ValueError(f"The burst for {name} must be at least 1 and less than its rate limit {rate_limit}")
+            self.rate = (rate_limit - self.capacity) / 60
+        self.buckets = buckets if buckets is not None else InProcessBuckets()
+        self.clock = clock
+        self.sleep = sleep
+        self.calls = 0
+        self.delayed_calls = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def take(self):
+        return self.buckets.take(self.name, self.rate, self.capacity, self.clock())
+
+    def start_waiting(self):
+        with self._lock:
+            self.waiting += 1
+        return self.clock()
+
+    def finish_waiting(self, started, delayed):
+        waited = self.clock() - started
+        with self._lock:
+            self.waiting -= 1
+            self.calls += 1
+            if delayed:
+                self.delayed_calls += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def acquire(self):
+        started = self.start_waiting()
+        delayed = False
+        try:
+            while (wait := self.take()) > 0:
+                delayed = True
+                self.sleep(wait)
+        finally:
+            self.finish_waiting(started, delayed)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "delayedCalls": self.delayed_calls,
+                "waiting": self.waiting,
+                "totalWaitSeconds": self.total_wait,
+                "maxWaitSeconds": self.max_wait,
+            }
+
+
+class AsyncTokenBucket:
+    """Applies a TokenBucket's limit to asyncio tasks. Use it as an async context manager
+    around each call: entering waits until the call is allowed by sleeping the task, not a
+    thread. It shares the TokenBucket's tokens and stats, so calls made from threads and
+    from tasks count towards the same limit. Buckets kept outside this process are taken
+    from on a worker thread, so the event loop isn't blocked on the database."""
+
+    def __init__(self, bucket, sleep=asyncio.sleep):
+        self.bucket = bucket
+        self.sleep = sleep
+
+    async def take(self):
+        if isinstance(self.bucket.buckets, InProcessBuckets):
+            return self.bucket.take()
+        return await asyncio.to_thread(self.bucket.take)
+
+    async def acquire(self):
+        started = self.bucket.start_waiting()
+        delayed = False
+        try:
+            while (wait := await self.take()) > 0:
+                delayed = True
+                await self.sleep(wait)
+        finally:
+            self.bucket.finish_waiting(started, delayed)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+def make_buckets(backend="memory", db=None):
+    """Create the store of token buckets named by the RATE_LIMIT_BACKEND setting: memory,
+    or mongo (in the rateLimits collection of db)."""
+    if backend == "memory":
+        return InProcessBuckets()
+    if backend == "mongo":
+        if db is None:
+            raise ValueError("The mongo rate limiter needs a database connection")
+        return MongoBuckets(db.get_collection("rateLimits"))
+    raise ValueError(f"Unknown rate limit backend {backend}")
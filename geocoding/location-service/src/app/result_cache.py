@@ -0,0 +1,255 @@
+import abc
+import asyncio
+import collections
+import datetime
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+
+import pymongo
+
+h = logging.StreamHandler(sys.stdout)
+logger = logging.getLogger(__name__)
+logger.addHandler(h)
+logger.setLevel(logging.INFO)
+
+
+class ResultCache(abc.ABC):
+    """Remembers the results of expensive lookups, like calls to the Mapbox APIs.
+    Keys are strings and values are anything that can be represented as JSON;
+    every get() returns a fresh copy of the value, so callers can change it.
+    Entries expire ttl seconds after they're stored, and the oldest entries are
+    evicted when there are more than max_size. Subclasses say where the entries
+    are kept by implementing lookup(), store() and size()."""
+
+    # whether lookups and stores wait on a file or a database
+    blocking = True
+
+    def __init__(self, name, ttl=30 * 24 * 60 * 60, max_size=100000):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value stored for key, or None if there isn't an unexpired one."""
+        value = self.lookup(key)
+        with self._counter_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return json.loads(value) if value is not None else None
+
+    def put(self, key, value):
+        self.store(key, json.dumps(value))
+
+    def fetch(self, key, compute, should_store=lambda value: True):
+        """Return the value stored for key, or compute it, store it and return it.
+        Values that should_store rejects are returned without being stored."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if should_store(value):
+                self.put(key, value)
+        return value
+
+    async def fetch_async(self, key, compute, should_store=lambda value: True):
+        """fetch() for asyncio tasks, where compute is a coroutine function. Caches that wait
+        on a file or a database are read and written on a worker thread."""
+        value = await self.without_blocking(self.get, key)
+        if value is None:
+            value = await compute()
+            if should_store(value):
+                await self.without_blocking(self.put, key, value)
+        return value
+
+    async def without_blocking(self, method, *args):
+        if not self.blocking:
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": self.size()}
+
+    @abc.abstractmethod
+    def lookup(self, key):
+        """Return the JSON text stored for key, or None."""
+
+    @abc.abstractmethod
+    def store(self, key, text):
+        """Remember the JSON text for key."""
+
+    @abc.abstractmethod
+    def size(self):
+        """Return how many entries are kept."""
+
+
+class MemoryResultCache(ResultCache):
+    """Keeps entries in this process, evicting the least recently used."""
+
+    blocking = False
+
+    def __init__(self, name, ttl=30 * 24 * 60 * 60, max_size=10000, clock=time.monotonic):
+        super().__init__(name, ttl, max_size)
+        self.clock = clock
+        self.entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            (stored_at, text) = entry
+            if self.clock() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return text
+
+    def store(self, key, text):
+        with self._lock:
+            self.entries[key] = (self.clock(), text)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def size(self):
+        return len(self.entries)
+
+
+class SQLiteResultCache(ResultCache):
+    """Keeps entries in a table of a SQLite database on disk, so that they survive
+    restarts. Processes that share the file share the cache. Expired entries are
+    ignored, and removed along with the oldest entries beyond max_size every
+    trim_interval stores."""
+
+    def __init__(self, name, path, ttl=30 * 24 * 60 * 60, max_size=100000, trim_interval=100, clock=time.time):
+        super().__init__(name, ttl, max_size)
+        # the table name can't be a query parameter, so only allow simple names
+        if not name.isidentifier():
+            raise ValueError(f"Cache name {name} is not a valid table name")
+        self.trim_interval = trim_interval
+        self.clock = clock
+        self.stores_since_trim = 0
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self.connection.execute(f"CREATE INDEX IF NOT EXISTS {name}_stored_at ON {name} (stored_at)")
+
+    def lookup(self, key):
+        with self._lock:
+            row = self.connection.execute(
+                f"SELECT value FROM {self.name} WHERE key = ? AND stored_at >= ?",
+                (key, self.clock() - self.ttl),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def store(self, key, text):
+        with self._lock:
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO {self.name} (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, text, self.clock()),
+            )
+            self.stores_since_trim += 1
+            if self.stores_since_trim >= self.trim_interval:
+                self.stores_since_trim = 0
+                self.trim()
+
+    def trim(self):
+        """Remove expired entries, then the oldest entries if there are more than max_size.
+        Call with the lock held."""
+        self.connection.execute(f"DELETE FROM {self.name} WHERE stored_at < ?", (self.clock() - self.ttl,))
+        self.connection.execute(
+            f"DELETE FROM {self.name} WHERE key IN "
+            f"(SELECT key FROM {self.name} ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+
+    def size(self):
+        with self._lock:
+            return self.connection.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+
+
+class MongoResultCache(ResultCache):
+    """Keeps entries in a mongo collection, so that every replica of the service shares them.
+    Mongo removes expired entries itself with a TTL index; entries that are waiting to be
+    removed are ignored. The collection is trimmed to max_size every trim_interval stores."""
+
+    def __init__(self, name, collection, ttl=30 * 24 * 60 * 60, max_size=100000, trim_interval=100):
+        super().__init__(name, ttl, max_size)
+        self.collection = collection
+        self.trim_interval = trim_interval
+        self.stores_since_trim = 0
+        self._lock = threading.Lock()
+        self.ensure_ttl_index()
+
+    def ensure_ttl_index(self):
+        """Create the TTL index on storedAt, or change how long it keeps entries if it was
+        created with a different ttl: create_index fails when the options don't match."""
+        ttl = int(self.ttl)
+        for index in self.collection.index_information().values():
+            if index["key"] == [("storedAt", pymongo.ASCENDING)]:
+                if index.get("expireAfterSeconds") != ttl:
+                    self.collection.database.command(
+                        "collMod",
+                        self.collection.name,
+                        index={"keyPattern": {"storedAt": pymongo.ASCENDING}, "expireAfterSeconds": ttl},
+                    )
+                return
+        self.collection.create_index("storedAt", expireAfterSeconds=ttl)
+
+    def lookup(self, key):
+        oldest = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl)
+        document = self.collection.find_one({"_id": key, "storedAt": {"$gte": oldest}})
+        return document["value"] if document is not None else None
+
+    def store(self, key, text):
+        self.collection.replace_one(
+            {"_id": key},
+            {"_id": key, "value": text, "storedAt": datetime.datetime.utcnow()},
+            upsert=True,
+        )
+        with self._lock:
+            self.stores_since_trim += 1
+            if self.stores_since_trim < self.trim_interval:
+                return
+            self.stores_since_trim = 0
+        self.trim()
+
+    def trim(self):
+        """Remove the oldest entries if there are more than max_size."""
+        excess = self.collection.estimated_document_count() - self.max_size
+        if excess <= 0:
+            return
+        oldest = self.collection.find({}, {"_id": 1}).sort("storedAt", pymongo.ASCENDING).limit(excess)
+        self.collection.delete_many({"_id": {"$in": [d["_id"] for d in oldest]}})
+        logger.info(f"Evicted {excess} entries from the {self.name} cache")
+
+    def size(self):
+        return self.collection.estimated_document_count()
+
+
+def make_result_cache(name, backend="memory", ttl=30 * 24 * 60 * 60, max_size=100000, path=None, db=None):
+    """Create the cache called name using the backend named by the GEOCODE_CACHE_BACKEND
+    setting: memory, sqlite (in the file at path) or mongo (in a collection of db)."""
+    if backend == "memory":
+        return MemoryResultCache(name, ttl=ttl, max_size=max_size)
+    if backend == "sqlite":
+        if path is None:
+            raise ValueError("The sqlite geocode cache needs a file path")
+        return SQLiteResultCache(name, path, ttl=ttl, max_size=max_size)
+    if backend == "mongo":
+        if db is None:
+            raise ValueError("The mongo geocode cache needs a database connection")
+        return MongoResultCache(name, db.get_collection(f"{name}Cache"), ttl=ttl, max_size=max_size)
+    raise ValueError(f"Unknown geocode cache backend {backend}")
@@ -10,9 +10,11 @@
 
 import math
 
-def utmToLatLong(utmNorthing: float, utmEasting: float, utmZone: int) -> (float, float):
+import numpy
+
+def utmToLatLong(utmNorthing: float, utmEasting: float, utmZone: int, southern: bool = False) -> (float, float):
     eastingOffset = 500000.0
-    #northingOffset unused - would be needed for southern hemisphere coordinates
+    # southern hemisphere northings are measured from 10,000km south of the equator
     northingOffset = 10000000.0
     k0 = 0.9996
     equatorialRadius = 6378137.0
@@ -24,7 +26,7 @@ def utmToLatLong(utmNorthing: float, utmEasting: float, utmZone: int) -> (float,
     # Removes 500,000 metre offset for longitude
     # This originally did some casting I don't need
     xUTM = utmEasting - eastingOffset
-    yUTM = utmNorthing
+    yUTM = utmNorthing - northingOffset if southern else utmNorthing
     zoneNumber = utmZone
 
     # Finds the origin longitude for the zone
@@ -53,3 +55,51 @@ def utmToLatLong(utmNorthing: float, utmEasting: float, utmZone: int) -> (float,
     lon = lonOrigin + lon * rad2deg
 
     return (lat, lon)
+
+
+def utmToLatLongArrays(utmNorthings, utmEastings, utmZones, southern=None):
+    """The same conversion as utmToLatLong, done on numpy arrays of northings, eastings
+    and zones, and optionally an array saying which points are in the southern hemisphere.
+    Returns arrays of latitudes and longitudes."""
+    eastingOffset = 500000.0
+    northingOffset = 10000000.0
+    k0 = 0.9996
+    equatorialRadius = 6378137.0
+    eccSquared = 0.006694380023
+    eccPrimeSquared = eccSquared / (1 - eccSquared)
+    e1 = (1 - math.sqrt(1 - eccSquared)) / (1 + math.sqrt(1 - eccSquared))
+    rad2deg = 180.0 / math.pi
+
+    xUTM = numpy.asarray(utmEastings, dtype=numpy.float64) - eastingOffset
+    yUTM = numpy.asarray(utmNorthings, dtype=numpy.float64)
+    if southern is not None:
+        yUTM = numpy.where(numpy.asarray(southern, dtype=bool), yUTM - northingOffset, yUTM)
+    lonOrigin = (numpy.asarray(utmZones, dtype=numpy.float64) - 1) * 6 - 180 + 3
+
+    M = yUTM / k0
+    mu = M / (equatorialRadius * (1 - eccSquared / 4 - 3 * eccSquared * eccSquared / 64 - 5 * eccSquared * eccSquared * eccSquared / 256))
+
+    phi1Rad = mu + (3 * e1 / 2 - 27 * e1 * e1 * e1 / 32) * numpy.sin(2 * mu) + (21 * e1 * e1 / 16 - 55 * e1 * e1 * e1 * e1 / 32) * numpy.sin(4 * mu) + (151 * e1 * e1 * e1 / 96) * numpy.sin(6 * mu)
+
+    sinPhi1 = numpy.sin(phi1Rad)
+    cosPhi1 = numpy.cos(phi1Rad)
+    tanPhi1 = numpy.tan(phi1Rad)
+    N1 = equatorialRadius / numpy.sqrt(1 - eccSquared * sinPhi1 * sinPhi1)
+    T1 = tanPhi1 * tanPhi1
+    C1 = eccPrimeSquared * cosPhi1 * cosPhi1
+    R1 = equatorialRadius * (1 - eccSquared) / numpy.power(1 - eccSquared * sinPhi1 * sinPhi1, 1.5)
+    D = xUTM / (N1 * k0)
+    D2 = D * D
+
+    lat = phi1Rad - (N1 * tanPhi1 / R1) * (D2 / 2 - (5 + 3 * T1 + 10 * C1 - 4 * C1 * C1 - 9 * eccPrimeSquared) * D2 * D2 / 24 + (61 + 90 * T1 + 298 * C1 + 45 * T1 * T1 - 252 * eccPrimeSquared - 3 * C1 * C1) * D2 * D2 * D2 / 720)
+    lon = (D - (1 + 2 * T1 + C1) * D2 * D / 6 + (5 - 2 * C1 + 28 * T1 - 3 * C1 * C1 + 8 * eccPrimeSquared + 24 * T1 * T1) * D2 * D2 * D / 120) / cosPhi1
+
+    return (lat * rad2deg, lonOrigin + lon * rad2deg)
+
+
+def convertUTMBatch(utmNorthings, utmEastings, utmZones, southern=None) -> (list, list):
+    """Convert lists of UTM coordinates to lists of latitudes and longitudes."""
+    if southern is None:
+        southern = [False] * len(utmNorthings)
+    (lats, lons) = utmToLatLongArrays(utmNorthings, utmEastings, utmZones, southern)
+    return (lats.tolist(), lons.tolist())
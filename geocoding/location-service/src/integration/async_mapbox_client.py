@@ -0,0 +1,55 @@
+import asyncio
+from contextlib import nullcontext
+from os import environ
+
+import aiohttp
+
+from src.integration.mapbox_client import geocode_request, mapbox_timeout, tile_query_request
+
+
+class AsyncMapboxSession:
+    """The pool of connections that every asyncio task calls Mapbox over, so that connections
+    (and their TLS handshakes) are reused rather than made again for each request. An aiohttp
+    session belongs to the event loop it was made in, so a new one is made for a new loop."""
+
+    def __init__(self):
+        self.session = None
+        self.loop = None
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.loop is not loop or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=int(environ.get("MAPBOX_CONNECTIONS", 10)))
+            self.session = aiohttp.ClientSession(connector=connector)
+            self.loop = loop
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+session = AsyncMapboxSession()
+
+
+async def get_json(uri, params, rate_limit):
+    async with rate_limit:
+        timeout = aiohttp.ClientTimeout(total=mapbox_timeout())
+        async with session.get().get(uri, params=params, timeout=timeout) as response:
+            return await response.json(content_type=None)
+
+
+async def mapbox_geocode(access_token, query, types=None, languages=None, limit=None, country=None,
+                         rate_limit=nullcontext()):
+    """Request the location of the point of interest identified in the search query, without
+    blocking the event loop."""
+    (uri, params) = geocode_request(access_token, query, types, languages, limit, country)
+    return await get_json(uri, params, rate_limit)
+
+
+async def mapbox_tile_query(access_token, query, rate_limit=nullcontext()):
+    """Request the full hierarchy of administrative areas for a given location, without blocking
+    the event loop."""
+    (uri, params) = tile_query_request(access_token, query)
+    return await get_json(uri, params, rate_limit)
@@ -1,19 +1,58 @@
 from contextlib import nullcontext
-import mapbox
+from os import environ
+from urllib.parse import quote
+
 import requests
+from requests.adapters import HTTPAdapter
+
+# Every call to Mapbox goes through this session, so connections (and their TLS
+# handshakes) are reused rather than made again for each request.
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(environ.get("MAPBOX_CONNECTIONS", 10)))
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+
+
+def mapbox_api():
+    """The base URL of the Mapbox API, which can be changed to talk to a fake Mapbox in tests."""
+    return environ.get("MAPBOX_API_URL", "https://api.mapbox.com")
+
+
+def mapbox_timeout():
+    return float(environ.get("MAPBOX_TIMEOUT_SECONDS", 10))
+
+
+def geocode_request(access_token, query, types=None, languages=None, limit=None, country=None):
+    """The URL and parameters of a request for the location of the point of interest identified
+    in the search query."""
+    params = {"access_token": access_token}
+    if types:
+        params["types"] = ",".join(types)
+    if languages:
+        params["language"] = ",".join(languages)
+    if limit:
+        params["limit"] = limit
+    if country:
+        params["country"] = ",".join(country)
+    return f"{mapbox_api()}/geocoding/v5/mapbox.places/{quote(query, safe='')}.json", params
+
+
+def tile_query_request(access_token, query):
+    """The URL and parameters of a request for the full hierarchy of administrative areas for a
+    given location."""
+    uri = f"{mapbox_api()}/v4/mapbox.enterprise-boundaries-a1-v2,mapbox.enterprise-boundaries-a2-v2,mapbox.enterprise-boundaries-a3-v2/tilequery/{query.get('longitude')},{query.get('latitude')}.json"
+    return uri, {"access_token": access_token}
 
 
 def mapbox_geocode(access_token, query, types=None, languages=None, limit=None, country=None, rate_limit=nullcontext()):
     """Request the location of the point of interest identified in the search query."""
+    (uri, params) = geocode_request(access_token, query, types, languages, limit, country)
     with rate_limit:
-        geocoder = mapbox.Geocoder(access_token=access_token)
-        return geocoder.forward(query, types=types, languages=languages, limit=limit, country=country).geojson()
+        return session.get(uri, params=params, timeout=mapbox_timeout()).json()
 
 
 def mapbox_tile_query(access_token, query, rate_limit=nullcontext()):
     """Request the full hierarchy of administrative areas for a given location."""
+    (uri, params) = tile_query_request(access_token, query)
     with rate_limit:
-        uri = f"https://api.mapbox.com/v4/mapbox.enterprise-boundaries-a1-v2,mapbox.enterprise-boundaries-a2-v2,mapbox.enterprise-boundaries-a3-v2/tilequery/{query.get('longitude')},{query.get('latitude')}.json?access_token={access_token}"
-        res = requests.get(uri)
-        return res.json()
-
+        return session.get(uri, params=params, timeout=mapbox_timeout()).json()
@@ -0,0 +1,86 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class FakeMapboxServer:
+    """A local HTTP server that answers the Mapbox geocoding and tilequery requests the
+    location-service makes, so the Mapbox client can be tested without Mapbox. Point the
+    client at it by setting MAPBOX_API_URL to its url. Responses are seeded by query (for
+    geocoding) or by "longitude,latitude" (for tilequery); anything else finds nothing.
+    Every request waits for delay seconds, and the server records the requests it gets
+    and the most it was answering at once."""
+
+    geocode_path = re.compile(r"^/geocoding/v5/mapbox\.places/(?P<query>[^/]+)\.json$")
+    tilequery_path = re.compile(r"^/v4/[^/]+/tilequery/(?P<position>[^/]+)\.json$")
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.geocodes = {}
+        self.tilequeries = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def seed_geocode(self, query, features):
+        self.geocodes[query] = {"type": "FeatureCollection", "features": features}
+
+    def seed_tilequery(self, longitude, latitude, features):
+        self.tilequeries[f"{longitude},{latitude}"] = {"type": "FeatureCollection", "features": features}
+
+    def respond(self, path, params):
+        if match := self.geocode_path.match(path):
+            return self.geocodes.get(unquote(match["query"]), {"type": "FeatureCollection", "features": []})
+        if match := self.tilequery_path.match(path):
+            return self.tilequeries.get(match["position"], {"type": "FeatureCollection", "features": []})
+        return None
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                with fake._lock:
+                    fake.requests.append((url.path, params))
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                try:
+                    time.sleep(fake.delay)
+                    body = fake.respond(url.path, params)
+                    if "access_token" not in params:
+                        self.send_response(401)
+                        body = {"message": "Not Authorized - No Token"}
+                    elif body is None:
+                        self.send_response(404)
+                        body = {"message": "Not Found"}
+                    else:
+                        self.send_response(200)
+                    data = json.dumps(body).encode("utf-8")
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.app.admin_suggestions import AdminSuggestions, build_database
+
+
+class AdminSuggestionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.data_files = {
+            1: self.write_data('adm1.json', {'GNQ': [{'name': 'Insular', 'wiki': 'Q3040071'}]}),
+            2: self.write_data('adm2.json', {'Q3040071': [{'name': 'Annobón', 'wiki': 'Q3736616'}]}),
+            3: os.path.join(self.directory.name, 'missing.json'),
+        }
+        self.path = os.path.join(self.directory.name, 'suggestions.sqlite')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_data(self, name, data):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        return path
+
+    def test_itBuildsTheDatabaseWhenFirstNeeded(self):
+        suggestions = AdminSuggestions(self.path, self.data_files)
+        assert not os.path.exists(self.path)
+        assert suggestions.suggest(1, 'GNQ') == [{'name': 'Insular', 'wiki': 'Q3040071'}]
+        assert os.path.exists(self.path)
+
+    def test_itReadsSuggestionsForEachLevel(self):
+        build_database(self.path, self.data_files)
+        suggestions = AdminSuggestions(self.path, self.data_files)
+        assert suggestions.suggest(2, 'Q3040071') == [{'name': 'Annobón', 'wiki': 'Q3736616'}]
+        assert suggestions.suggest(1, 'Q3040071') is None
+        assert suggestions.suggest(3, 'Q3736616') is None
+
+    def test_itRemembersRecentSuggestions(self):
+        suggestions = AdminSuggestions(self.path, self.data_files)
+        suggestions.suggest(1, 'GNQ')
+        suggestions.suggest(1, 'GNQ')
+        assert suggestions.serialized.cache_info().hits == 1
+
+    def test_itStoresSerializedSuggestionsWithETags(self):
+        suggestions = AdminSuggestions(self.path, self.data_files)
+        (text, etag) = suggestions.serialized(1, 'GNQ')
+        assert json.loads(text) == [{'name': 'Insular', 'wiki': 'Q3040071'}]
+        self.write_data('adm1.json', {'GNQ': [{'name': 'Continental', 'wiki': 'Q845368'}]})
+        build_database(self.path, self.data_files)
+        (_, changed_etag) = AdminSuggestions(self.path, self.data_files).serialized(1, 'GNQ')
+        assert changed_etag != etag
+
+    def test_itRebuildsTheDatabaseWhenTheDataChanges(self):
+        build_database(self.path, self.data_files)
+        os.utime(self.path, (0, 0))
+        self.write_data('adm1.json', {'ESP': [{'name': 'Galicia', 'wiki': 'Q3908'}]})
+        suggestions = AdminSuggestions(self.path, self.data_files)
+        assert suggestions.suggest(1, 'ESP') == [{'name': 'Galicia', 'wiki': 'Q3908'}]
@@ -97,3 +97,22 @@ class TestAdminsFetcher(unittest.TestCase):
         assert filled_geocode['administrativeAreaLevel1'] == 'some admin 1'
         assert filled_geocode['administrativeAreaLevel2'] == 'some admin 2'
         assert filled_geocode['administrativeAreaLevel3'] == 'some admin 3'
+
+    def test_itLooksUpAllTheAdminNamesTogether(self):
+        admins = self.db['admins']
+        admins.insert_many([
+            {'id': 'FRAONE', 'name': 'first admin'},
+            {'id': 'FRATWO', 'name': 'second admin'},
+        ])
+        with patch.object(admins, 'find', wraps=admins.find) as find:
+            self.fetcher.admins = admins
+            names = self.fetcher.getNames(['FRAONE', 'FRATWO', 'FRANOPE'])
+            self.fetcher.getNames(['FRAONE', 'FRANOPE'])
+        find.assert_called_once()
+        assert names == {'FRAONE': 'first admin', 'FRATWO': 'second admin', 'FRANOPE': None}
+
+    def test_itUsesPreloadedAdminNames(self):
+        self.db['admins'].insert_one({'id': 'ESPONE', 'name': 'preloaded admin'})
+        self.fetcher.preload_admins()
+        self.db['admins'].delete_many({'id': 'ESPONE'})
+        assert self.fetcher.getName('ESPONE') == 'preloaded admin'
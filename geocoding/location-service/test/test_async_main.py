@@ -0,0 +1,59 @@
+import asyncio
+import os
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+os.environ['ENABLE_FAKE_GEOCODER'] = 'YES'
+from src.app import async_main, main
+
+
+class FindsAllButParis:
+    async def geocode_async(self, query, options):
+        if query == "Paris":
+            raise ValueError("Paris is not in the database")
+        return [{"name": query, "options": options}]
+
+
+def request(method, path, **kwargs):
+    """Make a request of the async app, returning its status and the body."""
+    async def make_request():
+        async with TestClient(TestServer(async_main.make_app())) as client:
+            response = await client.request(method, path, **kwargs)
+            return response.status, await response.text()
+    return asyncio.run(make_request())
+
+
+@pytest.fixture
+def geocoders(monkeypatch):
+    monkeypatch.setattr(main, 'geocoders', [FindsAllButParis()])
+
+
+def test_batch_geocode_locates_each_query_once(geocoders):
+    (status, body) = request("POST", "/geocode/batch", json={"queries": [
+        {"q": "Lyon"}, {"q": "Paris"}, {"q": "Lyon"}, {"q": "Nice", "limitToCountry": ["FR"]}
+    ]})
+    assert status == 200
+    assert body == '[[{"name": "Lyon", "options": {}}], [], [{"name": "Lyon", "options": {}}], ' \
+        '[{"name": "Nice", "options": {"limitToCountry": ["FR"]}}]]'
+
+
+def test_batch_geocode_turns_away_bad_batches(geocoders):
+    (status, body) = request("POST", "/geocode/batch", json={"queries": [{"q": "Lyon", "limitToCountry": "FR"}]})
+    assert status == 400
+    assert body == "limitToCountry must be a list"
+    (status, _) = request("POST", "/geocode/batch", data="not json")
+    assert status == 400
+
+
+def test_geocode_reads_options_from_the_query_string(geocoders):
+    (status, body) = request("GET", '/geocode?q=Lyon&limitToResolution=["Admin3"]')
+    assert status == 200
+    assert body == '[{"name": "Lyon", "options": {"limitToResolution": ["Admin3"]}}]'
+
+
+def test_other_routes_are_answered_by_the_flask_app():
+    (status, body) = request("GET", "/geocode/countryName?c=EE")
+    assert status == 200
+    assert body == "Estonia"
+    (status, _) = request("GET", "/geocode/countryName?c=ZZ")
+    assert status == 404
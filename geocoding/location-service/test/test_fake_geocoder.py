@@ -25,4 +25,23 @@ class FakeGeocoderTests(unittest.TestCase):
 
     def test_itCanClearGeocodes(self):
         response = self.client.post('/geocode/clear')
-        assert response.status == '200 OK'
\ No newline at end of file
+        assert response.status == '200 OK'
+    def test_itGeocodesBatchesInOrder(self):
+        lyon = {
+            'country': 'FR',
+            'geometry': {
+                'latitude': 45.75889,
+                'longitude': 4.84139
+            },
+            'name': 'Lyon',
+        }
+        self.client.post('/geocode/seed', json=lyon)
+        response = self.client.post('/geocode/batch', json={
+            'queries': [
+                {'q': 'Lyon', 'limitToCountry': ['FR']},
+                {'q': 'Nowhere'},
+                {'q': 'Lyon', 'limitToCountry': ['FR']},
+            ]
+        })
+        assert response.status == '200 OK'
+        assert response.json == [[lyon], [], [lyon]]
@@ -90,4 +90,19 @@ class GeocodeTests(unittest.TestCase):
     def test_canFindCodeForUnitedStates(self):
         geocoder = Geocoder('api_token', FakeAdminsFetcher())
         code = geocoder.getISO3166Code('United States')
-        assert code == 'US'
\ No newline at end of file
+        assert code == 'US'
+    def test_canFindCodeForCountryWhoseNameIsInAnotherName(self):
+        geocoder = Geocoder('api_token', FakeAdminsFetcher())
+        assert geocoder.getISO3166Code('India') == 'IN'
+        assert geocoder.getISO3166Code('Niger') == 'NE'
+        assert geocoder.getISO3166Code('Nigeria') == 'NG'
+
+    def test_canFindCodeFromUnambiguousPartOfName(self):
+        geocoder = Geocoder('api_token', FakeAdminsFetcher())
+        assert geocoder.getISO3166Code('Bissau') == 'GW'
+
+    def test_noCodeForAmbiguousOrUnknownNames(self):
+        geocoder = Geocoder('api_token', FakeAdminsFetcher())
+        assert geocoder.getISO3166Code('United') is None
+        assert geocoder.getISO3166Code('Atlantis') is None
+        assert geocoder.getISO3166Code('') is None
@@ -36,3 +36,42 @@ def test_does_not_attempt_geocode_with_no_query(client):
 def test_searching_for_country_name(client):
     response = client.get("/geocode/countryName?c=EE")
     assert response.get_data(as_text=True) == 'Estonia'
+
+def test_does_not_attempt_batch_geocode_without_queries(client):
+    response = client.post("/geocode/batch", json={"q": "Lyon"})
+    assert response.status == '400 BAD REQUEST'
+
+def test_does_not_attempt_batch_geocode_with_empty_query(client):
+    response = client.post("/geocode/batch", json={"queries": [{"q": "Lyon"}, {"limitToCountry": ["FR"]}]})
+    assert response.status == '400 BAD REQUEST'
+
+def test_does_not_attempt_batch_geocode_with_options_that_are_not_lists(client):
+    response = client.post("/geocode/batch", json={"queries": [{"q": "Lyon", "limitToCountry": "FR"}]})
+    assert response.status == '400 BAD REQUEST'
+
+def test_reports_cache_stats(client):
+    response = client.get("/geocode/cacheStats")
+    assert response.status == '200 OK'
+    assert isinstance(response.get_json(), dict)
+
+def test_country_name_can_be_cached(client):
+    response = client.get("/geocode/countryName?c=EE")
+    cached = client.get("/geocode/countryName?c=EE", headers={"If-None-Match": response.headers["ETag"]})
+    assert cached.status == '304 NOT MODIFIED'
+    assert "public" in response.headers["Cache-Control"]
+
+def test_does_not_attempt_batch_geocode_with_too_many_queries(client, monkeypatch):
+    monkeypatch.setattr(main, 'batch_max_queries', 2)
+    response = client.post("/geocode/batch", json={"queries": [{"q": "Lyon"}, {"q": "Paris"}, {"q": "Nice"}]})
+    assert response.status == '400 BAD REQUEST'
+
+def test_batch_geocode_finds_nothing_for_a_failing_query(client, monkeypatch):
+    class FailsForParis:
+        def geocode(self, query, options):
+            if query == "Paris":
+                raise ValueError("Paris is not in the database")
+            return [{"name": query}]
+    monkeypatch.setattr(main, 'geocoders', [FailsForParis()])
+    response = client.post("/geocode/batch", json={"queries": [{"q": "Lyon"}, {"q": "Paris"}, {"q": "Nice"}]})
+    assert response.status == '200 OK'
+    assert response.get_json() == [[{"name": "Lyon"}], [], [{"name": "Nice"}]]
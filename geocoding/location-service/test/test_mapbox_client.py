@@ -0,0 +1,106 @@
+import asyncio
+import json
+import pytest
+
+from src.app import main
+from src.app.geocoder import Geocoder
+from src.integration import async_mapbox_client
+from src.integration.mapbox_client import mapbox_geocode, mapbox_tile_query
+from test.fake_mapbox_server import FakeMapboxServer
+
+
+class FakeAdminsFetcher:
+    def fill_admins(self, unused):
+        return unused
+
+    async def fill_admins_async(self, unused):
+        return unused
+
+
+@pytest.fixture
+def fake_mapbox(monkeypatch):
+    with FakeMapboxServer() as server:
+        monkeypatch.setenv('MAPBOX_API_URL', server.url)
+        yield server
+
+
+@pytest.fixture
+def lyon():
+    with open('test/lyon.json', 'r') as file:
+        return json.load(file)
+
+
+def test_geocode_sends_options_to_mapbox(fake_mapbox, lyon):
+    fake_mapbox.seed_geocode('Lyon, France', [lyon])
+    result = mapbox_geocode('token', 'Lyon, France', types=['place', 'region'], languages=['en'], limit=5, country=['fr'])
+    assert result['features'] == [lyon]
+    (path, params) = fake_mapbox.requests[0]
+    assert path == '/geocoding/v5/mapbox.places/Lyon%2C%20France.json'
+    assert params == {'access_token': 'token', 'types': 'place,region', 'language': 'en', 'limit': '5', 'country': 'fr'}
+
+
+def test_tile_query_asks_mapbox_about_the_position(fake_mapbox):
+    feature = {'properties': {'id': 'FRAONE', 'tilequery': {'layer': 'boundaries_admin_1'}}}
+    fake_mapbox.seed_tilequery(4.84139, 45.75889, [feature])
+    result = mapbox_tile_query('token', {'latitude': 45.75889, 'longitude': 4.84139})
+    assert result['features'] == [feature]
+
+
+def test_geocoder_unpacks_features_from_mapbox(fake_mapbox, lyon):
+    fake_mapbox.seed_geocode('Lyon', [lyon])
+    geocoder = Geocoder('token', FakeAdminsFetcher())
+    feats = geocoder.geocode('Lyon', {'limitToResolution': [Geocoder.Admin3]})
+    assert len(feats) == 1
+    assert feats[0]['admin3'] == 'Lyon'
+    assert fake_mapbox.requests[0][1]['types'] == 'admin3'
+
+
+def test_batch_geocoding_overlaps_mapbox_requests(monkeypatch, lyon):
+    with FakeMapboxServer(delay=0.2) as server:
+        monkeypatch.setenv('MAPBOX_API_URL', server.url)
+        monkeypatch.setattr(main, 'geocoders', [Geocoder('token', FakeAdminsFetcher())])
+        for city in ['Lyon', 'Paris', 'Nice', 'Lille']:
+            server.seed_geocode(city, [lyon])
+        client = main.app.test_client()
+        response = client.post('/geocode/batch', json={'queries': [{'q': c} for c in ['Lyon', 'Paris', 'Nice', 'Lille']]})
+        assert response.status_code == 200
+        assert [len(locations) for locations in response.json] == [1, 1, 1, 1]
+        assert server.max_in_flight > 1
+
+
+def test_async_client_overlaps_mapbox_requests(monkeypatch, lyon):
+    with FakeMapboxServer(delay=0.2) as server:
+        monkeypatch.setenv('MAPBOX_API_URL', server.url)
+        for city in ['Lyon', 'Paris', 'Nice', 'Lille']:
+            server.seed_geocode(city, [lyon])
+
+        async def geocode_all():
+            try:
+                return await asyncio.gather(*[
+                    async_mapbox_client.mapbox_geocode('token', c, limit=5)
+                    for c in ['Lyon', 'Paris', 'Nice', 'Lille']
+                ])
+            finally:
+                await async_mapbox_client.session.close()
+
+        results = asyncio.run(geocode_all())
+        assert [r['features'] for r in results] == [[lyon]] * 4
+        assert server.requests[0][1]['limit'] == '5'
+        assert server.max_in_flight > 1
+
+
+def test_geocoder_unpacks_features_from_mapbox_asynchronously(fake_mapbox, lyon):
+    fake_mapbox.seed_geocode('Lyon', [lyon])
+    geocoder = Geocoder('token', FakeAdminsFetcher())
+
+    async def geocode():
+        try:
+            return await geocoder.geocode_async('Lyon', {'limitToResolution': [Geocoder.Admin3]})
+        finally:
+            await async_mapbox_client.session.close()
+
+    feats = asyncio.run(geocode())
+    assert feats == geocoder.geocode('Lyon', {'limitToResolution': [Geocoder.Admin3]})
+    assert feats[0]['admin3'] == 'Lyon'
+    # the second geocode was answered from the cache
+    assert len(fake_mapbox.requests) == 1
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import unittest
+from pymongo import MongoClient
+
+from src.app.rate_limiter import AsyncTokenBucket, InProcessBuckets, MongoBuckets, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def bucket(self, rate_limit=62, burst=2, buckets=None):
+        return TokenBucket('geocode', rate_limit, burst=burst, buckets=buckets, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_calls_within_the_burst_do_not_wait(self):
+        bucket = self.bucket()
+        with bucket:
+            pass
+        with bucket:
+            pass
+        self.assertEqual(self.clock.now, 1000.0)
+        self.assertEqual(bucket.stats()['delayedCalls'], 0)
+
+    def test_calls_beyond_the_burst_wait_for_a_token(self):
+        bucket = self.bucket(rate_limit=61, burst=1)
+        with bucket:
+            pass
+        with bucket:
+            pass
+        # one token a second
+        self.assertAlmostEqual(self.clock.now, 1001.0)
+        stats = bucket.stats()
+        self.assertEqual(stats['calls'], 2)
+        self.assertEqual(stats['delayedCalls'], 1)
+        self.assertEqual(stats['waiting'], 0)
+        self.assertAlmostEqual(stats['maxWaitSeconds'], 1.0)
+
+    def test_tokens_refill_at_the_rate_limit(self):
+        # refills at two tokens a second
+        bucket = self.bucket(rate_limit=122, burst=2)
+        for _ in range(2):
+            bucket.acquire()
+        self.clock.now += 0.5
+        bucket.acquire()
+        self.assertEqual(self.clock.now, 1000.5)
+        bucket.acquire()
+        self.assertAlmostEqual(self.clock.now, 1001.0)
+
+    def test_limiters_sharing_buckets_share_the_limit(self):
+        buckets = InProcessBuckets()
+        first = self.bucket(rate_limit=61, burst=1, buckets=buckets)
+        second = self.bucket(rate_limit=61, burst=1, buckets=buckets)
+        first.acquire()
+        second.acquire()
+        self.assertAlmostEqual(self.clock.now, 1001.0)
+        self.assertEqual(second.stats()['delayedCalls'], 1)
+
+    def test_no_minute_has_more_calls_than_the_rate_limit(self):
+        for (rate_limit, burst) in [(600, None), (120, 30), (61, 1), (2, None), (1, None)]:
+            clock = FakeClock()
+            bucket = TokenBucket('geocode', rate_limit, burst=burst, clock=clock, sleep=clock.sleep)
+            calls = []
+            while clock.now < 1300:
+                bucket.acquire()
+                calls.append(clock.now)
+            busiest = max(sum(1 for c in calls[i:] if c < start + 60 - 1e-6) for i, start in enumerate(calls))
+            self.assertLessEqual(busiest, rate_limit)
+            self.assertGreaterEqual(busiest, rate_limit - 1)
+
+    def test_burst_must_be_less_than_the_rate_limit(self):
+        with self.assertRaises(ValueError):
+            TokenBucket('geocode', 60, burst=60)
+
+    def test_small_rate_limits_space_calls_out(self):
+        for (rate_limit, spacing) in [(1, 60.0), (0.5, 120.0)]:
+            clock = FakeClock()
+            bucket = TokenBucket('geocode', rate_limit, clock=clock, sleep=clock.sleep)
+            bucket.acquire()
+            bucket.acquire()
+            self.assertAlmostEqual(clock.now, 1000.0 + spacing)
+
+    def test_rate_limit_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            TokenBucket('geocode', 0)
+
+    def test_tasks_wait_for_a_token_without_blocking_the_loop(self):
+        bucket = self.bucket(rate_limit=61, burst=1)
+        sleeps = []
+
+        async def sleep(seconds):
+            sleeps.append(seconds)
+            self.clock.sleep(seconds)
+
+        async def call_twice():
+            limit = AsyncTokenBucket(bucket, sleep=sleep)
+            async with limit:
+                pass
+            async with limit:
+                pass
+
+        asyncio.run(call_twice())
+        self.assertAlmostEqual(self.clock.now, 1001.0)
+        self.assertEqual(len(sleeps), 1)
+        self.assertEqual(bucket.stats()['delayedCalls'], 1)
+
+
+@unittest.skipIf(not os.environ.get("DOCKERIZED", False),
+                 "Skipping outside dockerized environment")
+class MongoBucketsTest(unittest.TestCase):
+    def setUp(self):
+        self.client = MongoClient(host="mongo")
+        self.collection = self.client.get_database("testdb").get_collection("rateLimits")
+        self.collection.drop()
+
+    def tearDown(self):
+        self.collection.drop()
+        self.client.close()
+
+    def test_replicas_share_a_bucket(self):
+        clock = FakeClock()
+        replicas = [
+            TokenBucket('geocode', 61, burst=1, buckets=MongoBuckets(self.collection), clock=clock, sleep=clock.sleep)
+            for _ in range(2)
+        ]
+        for replica in replicas:
+            replica.acquire()
+        self.assertAlmostEqual(clock.now, 1001.0)
+        self.assertEqual(self.collection.count_documents({"_id": "geocode"}), 1)
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+from pymongo import MongoClient
+
+from src.app.result_cache import MemoryResultCache, MongoResultCache, ResultCache, SQLiteResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ResultCacheTests(unittest.TestCase):
+
+    def test_itNeedsSomewhereToKeepEntries(self):
+        class NowhereResultCache(ResultCache):
+            def lookup(self, key):
+                return None
+        with self.assertRaises(TypeError):
+            NowhereResultCache('geocode')
+
+
+class MemoryResultCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = MemoryResultCache('geocode', ttl=60, max_size=2, clock=self.clock)
+
+    def test_itCountsHitsAndMisses(self):
+        assert self.cache.get('lyon') is None
+        self.cache.put('lyon', [{'name': 'Lyon'}])
+        assert self.cache.get('lyon') == [{'name': 'Lyon'}]
+        assert self.cache.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+    def test_itReturnsCopiesOfValues(self):
+        self.cache.put('lyon', {'name': 'Lyon'})
+        self.cache.get('lyon')['name'] = 'Paris'
+        assert self.cache.get('lyon') == {'name': 'Lyon'}
+
+    def test_itExpiresEntries(self):
+        self.cache.put('lyon', 'Lyon')
+        self.clock.now += 61
+        assert self.cache.get('lyon') is None
+
+    def test_itEvictsTheLeastRecentlyUsed(self):
+        self.cache.put('lyon', 'Lyon')
+        self.cache.put('paris', 'Paris')
+        self.cache.get('lyon')
+        self.cache.put('nice', 'Nice')
+        assert self.cache.get('paris') is None
+        assert self.cache.get('lyon') == 'Lyon'
+
+    def test_itOnlyComputesMissingValues(self):
+        computed = []
+        compute = lambda: computed.append('lyon') or 'Lyon'
+        assert self.cache.fetch('lyon', compute) == 'Lyon'
+        assert self.cache.fetch('lyon', compute) == 'Lyon'
+        assert computed == ['lyon']
+
+    def test_itDoesNotStoreRejectedValues(self):
+        self.cache.fetch('lyon', lambda: {'message': 'error'}, should_store=lambda v: 'features' in v)
+        assert self.cache.get('lyon') is None
+
+
+class SQLiteResultCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.sqlite')
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_cache(self, **kwargs):
+        return SQLiteResultCache('geocode', self.path, ttl=60, clock=self.clock, **kwargs)
+
+    def test_entriesSurviveAcrossInstances(self):
+        self.make_cache().put('lyon', [{'name': 'Lyon'}])
+        cache = self.make_cache()
+        assert cache.get('lyon') == [{'name': 'Lyon'}]
+        assert cache.stats() == {'hits': 1, 'misses': 0, 'size': 1}
+
+    def test_itExpiresEntries(self):
+        cache = self.make_cache()
+        cache.put('lyon', 'Lyon')
+        self.clock.now += 61
+        assert cache.get('lyon') is None
+
+    def test_itTrimsTheOldestEntries(self):
+        cache = self.make_cache(max_size=2, trim_interval=3)
+        for name in ['lyon', 'paris', 'nice']:
+            cache.put(name, name)
+            self.clock.now += 1
+        assert cache.size() == 2
+        assert cache.get('lyon') is None
+        assert cache.get('nice') == 'nice'
+
+    def test_itRejectsUnsafeNames(self):
+        with self.assertRaises(ValueError):
+            SQLiteResultCache('geocode; DROP TABLE admins', self.path)
+
+
+@unittest.skipIf(not os.environ.get("DOCKERIZED", False),
+                 "Skipping outside dockerized environment")
+class MongoResultCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.mongo = MongoClient(host="mongo")
+        self.db = self.mongo['testdb']
+        self.db.drop_collection('geocodeCache')
+
+    def tearDown(self):
+        self.mongo.close()
+
+    def test_itSharesEntriesBetweenInstances(self):
+        MongoResultCache('geocode', self.db['geocodeCache']).put('lyon', [{'name': 'Lyon'}])
+        cache = MongoResultCache('geocode', self.db['geocodeCache'])
+        assert cache.get('lyon') == [{'name': 'Lyon'}]
+        assert cache.get('paris') is None
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+    def test_itChangesTheTTLOfAnExistingCache(self):
+        MongoResultCache('geocode', self.db['geocodeCache'], ttl=60)
+        MongoResultCache('geocode', self.db['geocodeCache'], ttl=120)
+        ttls = [i.get('expireAfterSeconds') for i in self.db['geocodeCache'].index_information().values()]
+        assert 120 in ttls
+        assert 60 not in ttls
+
+    def test_itTrimsTheOldestEntries(self):
+        cache = MongoResultCache('geocode', self.db['geocodeCache'], max_size=2, trim_interval=3)
+        for name in ['lyon', 'paris', 'nice']:
+            cache.put(name, name)
+        assert cache.size() == 2
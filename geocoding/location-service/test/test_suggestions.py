@@ -245,3 +245,18 @@ class SuggestionsTest(unittest.TestCase):
     def test_admin3NoAdmin2ResultsInError(self):
         response = self.client.get('/geocode/admin3')
         assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_admin1SuggestionsCanBeCached(self):
+        response = self.client.get('/geocode/admin1?admin0=GNQ')
+        etag = response.headers['ETag']
+        assert etag
+        assert 'max-age' in response.headers['Cache-Control']
+        cached = self.client.get('/geocode/admin1?admin0=GNQ', headers={'If-None-Match': etag})
+        assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+        assert cached.data == b''
+
+    def test_admin2SuggestionsHaveDifferentETagsForDifferentAreas(self):
+        response = self.client.get('/geocode/admin2?admin1WikiId=Q3040071')
+        stale = self.client.get('/geocode/admin2?admin1WikiId=Q845368', headers={'If-None-Match': response.headers['ETag']})
+        assert stale.status_code == status.HTTP_200_OK
+        assert stale.headers['ETag'] != response.headers['ETag']
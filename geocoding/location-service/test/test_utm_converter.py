@@ -1,5 +1,7 @@
 import pytest
+from benchmarks.convert_utm import random_points
 from src.app import main
+from src.app.utm_to_latlong import utmToLatLong, utmToLatLongArrays
 
 
 @pytest.fixture
@@ -17,3 +19,60 @@ def test_coordinate_conversion(client):
     assert result['latitude'] == 9.197726112080002
     assert 'longitude' in result
     assert result['longitude'] == -79.62765393281299
+
+
+def test_southern_hemisphere_conversion(client):
+    response = client.get('/geocode/convertUTM?n=6252266&e=334873&z=56&h=S')
+    result = response.get_json()
+    assert result['latitude'] == pytest.approx(-33.857, abs=1e-3)
+    assert result['longitude'] == pytest.approx(151.215, abs=1e-3)
+
+
+def test_batch_coordinate_conversion(client):
+    response = client.post('/geocode/convertUTM/batch', json={
+        'northings': [1017001, 6252266],
+        'eastings': [650771, 334873],
+        'zones': [17, 56],
+        'hemispheres': ['N', 'S'],
+    })
+    result = response.get_json()
+    assert result['latitudes'][0] == pytest.approx(9.197726112080002, abs=1e-9)
+    assert result['longitudes'][0] == pytest.approx(-79.62765393281299, abs=1e-9)
+    assert result['latitudes'][1] == pytest.approx(-33.857, abs=1e-3)
+    assert result['longitudes'][1] == pytest.approx(151.215, abs=1e-3)
+
+
+def test_batch_conversion_needs_matching_lists(client):
+    response = client.post('/geocode/convertUTM/batch', json={
+        'northings': [1017001, 6252266],
+        'eastings': [650771],
+        'zones': [17, 56],
+    })
+    assert response.status == '400 BAD REQUEST'
+
+
+def test_batch_conversion_needs_valid_zones(client):
+    response = client.post('/geocode/convertUTM/batch', json={
+        'northings': [1017001],
+        'eastings': [650771],
+        'zones': [61],
+    })
+    assert response.status == '400 BAD REQUEST'
+
+
+def test_batch_conversion_rejects_booleans_as_zones(client):
+    response = client.post('/geocode/convertUTM/batch', json={
+        'northings': [1017001],
+        'eastings': [650771],
+        'zones': [True],
+    })
+    assert response.status == '400 BAD REQUEST'
+
+
+def test_vectorized_conversion_matches_scalar_conversion():
+    (northings, eastings, zones, southern) = random_points(1000)
+    (latitudes, longitudes) = utmToLatLongArrays(northings, eastings, zones, southern)
+    for i in range(len(northings)):
+        (latitude, longitude) = utmToLatLong(northings[i], eastings[i], zones[i], southern[i])
+        assert latitudes[i] == pytest.approx(latitude, abs=1e-9)
+        assert longitudes[i] == pytest.approx(longitude, abs=1e-9)